@@ -0,0 +1,245 @@
+'''
+Measures the latency and throughput of the backend's endpoints. The default
+or the Rok app is served in-process, against a fake API Server that runs in
+the same process (see benchmarks/fakeapi.py). Each endpoint is driven at the
+given concurrency and the calls it makes to the API Server are counted. Run
+it from the backend's directory:
+
+    python -m benchmarks.api_load [--ui rok] [--concurrency 16]
+
+The backend's settings are read from the environment as usual, so i.e.
+CACHE_ENABLED=true benchmarks the endpoints with the caches enabled.
+'''
+import itertools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+from . import fakeapi
+
+ENDPOINTS = ["get_notebooks", "get_pvcs", "get_config", "post_notebook"]
+USER = "user@kubeflow.org"
+
+
+def percentile(values, p):
+    '''Nearest-rank percentile of the sorted values'''
+    if not values:
+        return 0
+    k = max(0, min(len(values) - 1, int(round(p / 100 * len(values))) - 1))
+    return values[k]
+
+
+def notebook_form(name):
+    '''The body the spawner form sends, with the config's defaults'''
+    return {
+        "name": name,
+        "image": fakeapi.IMAGE,
+        "cpu": "0.5",
+        "memory": "1.0Gi",
+        "gpus": {"num": "none"},
+        "noWorkspace": False,
+        "workspace": {
+            "type": "New",
+            "name": "workspace-" + name,
+            "size": "10Gi",
+            "mode": "ReadWriteOnce",
+            "path": "/home/jovyan",
+            "extraFields": {},
+        },
+        "datavols": [],
+        "configurations": [],
+        "shm": True,
+    }
+
+
+class Client:
+    '''Sends the requests of the endpoints to the backend, as a user'''
+
+    def __init__(self, url, namespaces, headers):
+        self.url = url
+        self.namespaces = namespaces
+        self.headers = headers
+        self.seq = itertools.count()
+
+    def request(self, endpoint):
+        i = next(self.seq)
+        ns = self.namespaces[i % len(self.namespaces)]
+        headers = dict(self.headers)
+        data = None
+
+        if endpoint == "get_notebooks":
+            path = "/api/namespaces/{}/notebooks".format(ns)
+        elif endpoint == "get_pvcs":
+            path = "/api/namespaces/{}/pvcs".format(ns)
+        elif endpoint == "get_config":
+            path = "/api/config"
+        elif endpoint == "post_notebook":
+            path = "/api/namespaces/{}/notebooks".format(ns)
+            data = json.dumps(notebook_form("bench-{}".format(i)))
+            data = data.encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        else:
+            raise ValueError("Unknown endpoint: {}".format(endpoint))
+
+        req = urllib.request.Request(self.url + path, data=data,
+                                     headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=60) as resp:
+                body = json.loads(resp.read().decode("utf-8"))
+        except urllib.error.HTTPError:
+            return False
+
+        return body.get("success", False)
+
+
+def run_endpoint(client, cluster, endpoint, requests, concurrency, warmup):
+    '''Send the requests to the endpoint and return its measurements'''
+    for _ in range(warmup):
+        client.request(endpoint)
+
+    cluster.reset_calls()
+    latencies, errors = [], []
+    left = iter(range(requests))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if next(left, None) is None:
+                    return
+
+            start = time.perf_counter()
+            try:
+                ok = client.request(endpoint)
+            except Exception:
+                ok = False
+            latency = time.perf_counter() - start
+
+            with lock:
+                latencies.append(latency)
+                if not ok:
+                    errors.append(latency)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for f in [executor.submit(worker) for _ in range(concurrency)]:
+            f.result()
+    elapsed = time.perf_counter() - start
+
+    calls = {k: v for k, v in cluster.reset_calls().items()
+             if not k.startswith("WATCH")}
+    latencies.sort()
+    return {
+        "endpoint": endpoint,
+        "requests": requests,
+        "errors": len(errors),
+        "throughput": requests / elapsed,
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "upstreamCalls": sum(calls.values()) / requests,
+        "upstream": {k: v / requests for k, v in sorted(calls.items())},
+    }
+
+
+def print_results(results):
+    print("{:<15}{:>9}{:>8}{:>10}{:>10}{:>10}{:>10}{:>10}".format(
+        "Endpoint", "Requests", "Errors", "Req/s", "p50 (ms)", "p95 (ms)",
+        "p99 (ms)", "Calls/req"))
+    for r in results:
+        print("{:<15}{:>9}{:>8}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}"
+              .format(r["endpoint"], r["requests"], r["errors"],
+                      r["throughput"], r["p50"], r["p95"], r["p99"],
+                      r["upstreamCalls"]))
+
+    print("\nCalls to the API Server per request:")
+    for r in results:
+        calls = ", ".join("{} {:.1f}".format(k, v)
+                          for k, v in r["upstream"].items())
+        print("  {:<15}{}".format(r["endpoint"], calls or "-"))
+
+
+def serve_app(ui):
+    '''Serve the UI's Flask app from a background thread'''
+    from werkzeug.serving import make_server
+    from kubeflow_jupyter.default.app import app as default
+    from kubeflow_jupyter.rok.app import app as rok
+    from kubeflow_jupyter.common import cache, tracing, warmpool
+
+    app = {"default": default, "rok": rok}[ui]
+    cache.start()
+    tracing.start()
+    warmpool.start()
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    t = threading.Thread(target=server.serve_forever, name="backend",
+                         daemon=True)
+    t.start()
+    return "http://127.0.0.1:{}".format(server.server_port)
+
+
+def main():
+    parser = ArgumentParser(description="Latency and throughput per endpoint")
+    parser.add_argument("--ui", choices=["default", "rok"], default="default",
+                        help="the app to benchmark")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS,
+                        default=ENDPOINTS, help="the endpoints to drive")
+    parser.add_argument("--requests", type=int, default=500,
+                        help="number of requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="number of requests in flight")
+    parser.add_argument("--warmup", type=int, default=20,
+                        help="requests per endpoint before measuring")
+    parser.add_argument("--namespaces", type=int, default=10,
+                        help="number of namespaces in the fake cluster")
+    parser.add_argument("--notebooks", type=int, default=20,
+                        help="number of Notebooks, and PVCs, per namespace")
+    parser.add_argument("--events", type=int, default=3,
+                        help="number of events per Notebook")
+    parser.add_argument("--latency-ms", type=float, default=5,
+                        help="latency added to each API Server call")
+    parser.add_argument("--jitter-ms", type=float, default=0,
+                        help="random extra latency, up to this much")
+    parser.add_argument("--json", type=str, default="",
+                        help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true",
+                        help="keep the INFO logs of the backend")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    cluster = fakeapi.Cluster(args.namespaces, args.notebooks, args.events,
+                              latency=args.latency_ms / 1000,
+                              jitter=args.jitter_ms / 1000)
+    url = fakeapi.serve(cluster)
+
+    # The backend loads the kubeconfig when imported
+    kubeconfig = os.path.join(tempfile.mkdtemp(), "kubeconfig")
+    fakeapi.write_kubeconfig(url, kubeconfig)
+    os.environ["KUBECONFIG"] = kubeconfig
+
+    backend = serve_app(args.ui)
+    from kubeflow_jupyter.common import utils
+    client = Client(backend, cluster.namespaces,
+                    {utils.USER_HEADER: utils.USER_PREFIX + USER})
+
+    results = [run_endpoint(client, cluster, e, args.requests,
+                            args.concurrency, args.warmup)
+               for e in args.endpoints]
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
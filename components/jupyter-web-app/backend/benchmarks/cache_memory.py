@@ -0,0 +1,286 @@
+'''
+Measures the memory the caches need per object, when storing the full objects
+and when storing the compact records, for 10k Notebooks with their PVCs,
+events and Pods. Run it from the backend's directory:
+
+    python -m benchmarks.cache_memory [--count 10000]
+'''
+import datetime as dt
+import gc
+import json
+import tracemalloc
+from argparse import ArgumentParser
+
+from kubernetes import client
+from kubeflow_jupyter.common import records
+
+NAMESPACES = 50
+IMAGES = [
+    "gcr.io/kubeflow-images-public/tensorflow-1.14.0-notebook-cpu:v0.7.0",
+    "gcr.io/kubeflow-images-public/tensorflow-1.14.0-notebook-gpu:v0.7.0",
+    "gcr.io/kubeflow-images-public/tensorflow-2.0.0a0-notebook-cpu:v0.7.0",
+]
+
+
+def notebook(i):
+    '''A Notebook CR as returned by the API Server, with a running Pod'''
+    name, namespace = "notebook-{}".format(i), "user-{}".format(i % NAMESPACES)
+    return {
+        "apiVersion": "kubeflow.org/v1beta1",
+        "kind": "Notebook",
+        "metadata": {
+            "name": name,
+            "namespace": namespace,
+            "uid": "6c6d1f0e-{:04x}-11ea-8a7e-42010a80000c".format(i),
+            "resourceVersion": str(1000000 + i),
+            "generation": 1,
+            "creationTimestamp": "2019-11-05T12:34:56Z",
+            "labels": {"app": name},
+            "selfLink": "/apis/kubeflow.org/v1beta1/namespaces/{}/notebooks/"
+                        "{}".format(namespace, name),
+        },
+        "spec": {"template": {"spec": {
+            "serviceAccountName": "default-editor",
+            "containers": [{
+                "name": name,
+                "image": IMAGES[i % len(IMAGES)],
+                "imagePullPolicy": "IfNotPresent",
+                "workingDir": "/home/jovyan",
+                "env": [],
+                "resources": {"requests": {"cpu": "0.5", "memory": "1.0Gi"}},
+                "volumeMounts": [
+                    {"mountPath": "/home/jovyan",
+                     "name": "workspace-" + name},
+                    {"mountPath": "/dev/shm", "name": "dshm"},
+                ],
+            }],
+            "ttlSecondsAfterFinished": 300,
+            "volumes": [
+                {"name": "workspace-" + name,
+                 "persistentVolumeClaim": {"claimName": "workspace-" + name}},
+                {"name": "dshm", "emptyDir": {"medium": "Memory"}},
+            ],
+        }}},
+        "status": {
+            "conditions": [{
+                "lastProbeTime": "2019-11-05T12:35:40Z",
+                "type": "Running",
+            }],
+            "containerState": {
+                "running": {"startedAt": "2019-11-05T12:35:40Z"},
+            },
+            "readyReplicas": 1,
+        },
+    }
+
+
+def pvc(i):
+    name, namespace = "workspace-notebook-{}".format(i), \
+        "user-{}".format(i % NAMESPACES)
+    return client.V1PersistentVolumeClaim(
+        api_version="v1",
+        kind="PersistentVolumeClaim",
+        metadata=client.V1ObjectMeta(
+            name=name,
+            namespace=namespace,
+            uid="8d9e2a1f-{:04x}-11ea-8a7e-42010a80000c".format(i),
+            resource_version=str(2000000 + i),
+            creation_timestamp=dt.datetime(2019, 11, 5, 12, 34, 56),
+            annotations={
+                "pv.kubernetes.io/bind-completed": "yes",
+                "pv.kubernetes.io/bound-by-controller": "yes",
+                "volume.beta.kubernetes.io/storage-provisioner":
+                    "kubernetes.io/gce-pd",
+            },
+            finalizers=["kubernetes.io/pvc-protection"],
+            self_link="/api/v1/namespaces/{}/persistentvolumeclaims/{}"
+                      .format(namespace, name),
+        ),
+        spec=client.V1PersistentVolumeClaimSpec(
+            access_modes=["ReadWriteOnce"],
+            storage_class_name="standard",
+            volume_name="pvc-8d9e2a1f-{:04x}".format(i),
+            volume_mode="Filesystem",
+            resources=client.V1ResourceRequirements(
+                requests={"storage": "10Gi"}),
+        ),
+        status=client.V1PersistentVolumeClaimStatus(
+            phase="Bound",
+            access_modes=["ReadWriteOnce"],
+            capacity={"storage": "10Gi"},
+        ),
+    )
+
+
+def event(i):
+    name, namespace = "notebook-{}".format(i), "user-{}".format(i % NAMESPACES)
+    ts = dt.datetime(2019, 11, 5, 12, 35, 40, tzinfo=dt.timezone.utc)
+    return client.V1Event(
+        api_version="v1",
+        kind="Event",
+        metadata=client.V1ObjectMeta(
+            name="{}.15d3b4d1a{:06x}".format(name, i),
+            namespace=namespace,
+            uid="9e0f3b2a-{:04x}-11ea-8a7e-42010a80000c".format(i),
+            resource_version=str(3000000 + i),
+            creation_timestamp=ts,
+            self_link="/api/v1/namespaces/{}/events/{}".format(namespace,
+                                                               name),
+        ),
+        involved_object=client.V1ObjectReference(
+            api_version="kubeflow.org/v1beta1",
+            kind="Notebook",
+            name=name,
+            namespace=namespace,
+            uid="6c6d1f0e-{:04x}-11ea-8a7e-42010a80000c".format(i),
+            resource_version=str(1000000 + i),
+        ),
+        reason="Started",
+        message="Reissued from pod/{}-0: Started container {}".format(name,
+                                                                      name),
+        source=client.V1EventSource(component="notebook-controller"),
+        first_timestamp=ts,
+        last_timestamp=ts,
+        count=1,
+        type="Normal",
+    )
+
+
+def pod(i):
+    '''The Pod of a running Notebook'''
+    name, namespace = "notebook-{}".format(i), "user-{}".format(i % NAMESPACES)
+    ts = dt.datetime(2019, 11, 5, 12, 35, 40, tzinfo=dt.timezone.utc)
+    return client.V1Pod(
+        api_version="v1",
+        kind="Pod",
+        metadata=client.V1ObjectMeta(
+            name=name + "-0",
+            namespace=namespace,
+            uid="a1b2c3d4-{:04x}-11ea-8a7e-42010a80000c".format(i),
+            resource_version=str(4000000 + i),
+            creation_timestamp=ts,
+            generate_name=name + "-",
+            labels={"app": name, "notebook-name": name,
+                    "statefulset": name,
+                    "controller-revision-hash": name + "-5d4f8c7b9"},
+            owner_references=[client.V1OwnerReference(
+                api_version="apps/v1", kind="StatefulSet", name=name,
+                uid="b2c3d4e5-{:04x}-11ea-8a7e-42010a80000c".format(i),
+                controller=True, block_owner_deletion=True)],
+        ),
+        spec=client.V1PodSpec(
+            node_name="gke-kubeflow-default-pool-{}".format(i % 20),
+            service_account_name="default-editor",
+            containers=[client.V1Container(
+                name=name,
+                image=IMAGES[i % len(IMAGES)],
+                image_pull_policy="IfNotPresent",
+                working_dir="/home/jovyan",
+                env=[client.V1EnvVar(name="NB_PREFIX",
+                                     value="/notebook/{}/{}".format(
+                                         namespace, name))],
+                ports=[client.V1ContainerPort(container_port=8888,
+                                              name="notebook-port",
+                                              protocol="TCP")],
+                resources=client.V1ResourceRequirements(
+                    requests={"cpu": "500m", "memory": "1Gi"}),
+                volume_mounts=[
+                    client.V1VolumeMount(mount_path="/home/jovyan",
+                                         name="workspace-" + name),
+                    client.V1VolumeMount(mount_path="/dev/shm", name="dshm"),
+                ],
+            )],
+            volumes=[
+                client.V1Volume(
+                    name="workspace-" + name,
+                    persistent_volume_claim=client.
+                    V1PersistentVolumeClaimVolumeSource(
+                        claim_name="workspace-" + name)),
+                client.V1Volume(name="dshm", empty_dir=client.
+                                V1EmptyDirVolumeSource(medium="Memory")),
+            ],
+        ),
+        status=client.V1PodStatus(
+            phase="Running",
+            host_ip="10.128.0.{}".format(i % 20),
+            pod_ip="10.4.{}.{}".format(i // 250 % 250, i % 250),
+            start_time=ts,
+            conditions=[client.V1PodCondition(type=t, status="True",
+                                              last_transition_time=ts)
+                        for t in ("Initialized", "Ready", "ContainersReady",
+                                  "PodScheduled")],
+            container_statuses=[client.V1ContainerStatus(
+                name=name, ready=True, restart_count=0,
+                image=IMAGES[i % len(IMAGES)],
+                image_id="docker-pullable://" + IMAGES[i % len(IMAGES)],
+                container_id="docker://{:064x}".format(i),
+                state=client.V1ContainerState(
+                    running=client.V1ContainerStateRunning(started_at=ts)),
+            )],
+        ),
+    )
+
+
+class Response:
+    '''Mimics a urllib3 response so that the ApiClient can deserialize it'''
+
+    def __init__(self, data):
+        self.data = data
+
+
+def json_parser(kind):
+    '''
+    Parse an object from its JSON, as the watches do, so that it owns all its
+    strings like it would in the cache
+    '''
+    if kind == "object":
+        return json.loads
+
+    api_client = client.ApiClient()
+    return lambda text: api_client.deserialize(Response(text), kind)
+
+
+def footprint(make, count):
+    '''Bytes allocated to keep 'count' objects from make(i)'''
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    objs = [make(i) for i in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    total = sum(s.size_diff for s in after.compare_to(before, "filename"))
+    del objs
+    return total
+
+
+def main():
+    parser = ArgumentParser(description="Memory per cached object")
+    parser.add_argument("--count", type=int, default=10000,
+                        help="number of Notebooks, PVCs, events and Pods")
+    args = parser.parse_args()
+
+    kinds = [
+        ("Notebook", notebook, "object", records.NotebookRecord),
+        ("PVC", pvc, "V1PersistentVolumeClaim", records.PVCRecord),
+        ("Event", event, "V1Event", records.EventRecord),
+        ("Pod", pod, "V1Pod", records.PodRecord),
+    ]
+
+    api_client = client.ApiClient()
+    print("{:<10}{:>16}{:>16}{:>8}".format("Kind", "Full (B/obj)",
+                                           "Record (B/obj)", "Ratio"))
+    for name, make, kind, record in kinds:
+        texts = [json.dumps(api_client.sanitize_for_serialization(make(i)))
+                 for i in range(args.count)]
+        parse = json_parser(kind)
+
+        full = footprint(lambda i: parse(texts[i]), args.count)
+        compact = footprint(lambda i: record.from_object(parse(texts[i])),
+                            args.count)
+        print("{:<10}{:>16.0f}{:>16.0f}{:>7.1f}x".format(
+            name, full / args.count, compact / args.count, full / compact))
+
+
+if __name__ == "__main__":
+    main()
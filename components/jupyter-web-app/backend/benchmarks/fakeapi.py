@@ -0,0 +1,366 @@
+'''
+A fake Kubernetes API Server for the benchmarks, that runs in the same process
+as the backend. It serves the resources the UIs read, with configurable
+counts, accepts every create and allows every SubjectAccessReview. Each
+response can be delayed to mimic the latency of a real API Server. The calls
+are counted per method and resource.
+'''
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+IMAGE = "gcr.io/kubeflow-images-public/tensorflow-1.14.0-notebook-cpu:v0.7.0"
+CREATED = "2019-11-05T12:34:56Z"
+STARTED = "2019-11-05T12:35:40Z"
+
+# A watch is held open for at most this many seconds and then ends empty
+MAX_WATCH_SECS = 5
+
+# (method, path, resource) of the calls the fake serves. The resource is
+# used to count the calls
+NS = r"(?:/namespaces/(?P<namespace>[^/]+))?"
+ROUTES = [
+    ("GET", r"/apis/kubeflow\.org/v1beta1" + NS + "/notebooks", "notebooks"),
+    ("POST", r"/apis/kubeflow\.org/v1beta1" + NS + "/notebooks", "notebooks"),
+    ("GET", r"/apis/kubeflow\.org/v1alpha1" + NS + "/poddefaults",
+     "poddefaults"),
+    ("GET", r"/api/v1" + NS + "/persistentvolumeclaims", "pvcs"),
+    ("POST", r"/api/v1" + NS + "/persistentvolumeclaims", "pvcs"),
+    ("GET", r"/api/v1" + NS + "/events", "events"),
+    ("GET", r"/api/v1" + NS + "/pods", "pods"),
+    ("GET", r"/api/v1/nodes", "nodes"),
+    ("GET", r"/api/v1/namespaces", "namespaces"),
+    ("GET", r"/api/v1/namespaces/(?P<namespace>[^/]+)/secrets/(?P<name>[^/]+)",
+     "secrets"),
+    ("GET", r"/apis/storage\.k8s\.io/v1/storageclasses", "storageclasses"),
+    ("POST", r"/apis/authorization\.k8s\.io/v1/subjectaccessreviews",
+     "subjectaccessreviews"),
+    ("POST", r"/apis/authorization\.k8s\.io/v1/selfsubjectrulesreviews",
+     "selfsubjectrulesreviews"),
+]
+ROUTES = [(m, re.compile(p + "$"), r) for m, p, r in ROUTES]
+
+
+def notebook(namespace, i):
+    name = "notebook-{}".format(i)
+    return {
+        "apiVersion": "kubeflow.org/v1beta1",
+        "kind": "Notebook",
+        "metadata": {
+            "name": name,
+            "namespace": namespace,
+            "uid": "{}-{}".format(namespace, name),
+            "resourceVersion": "1",
+            "creationTimestamp": CREATED,
+            "labels": {"app": name},
+        },
+        "spec": {"template": {"spec": {
+            "serviceAccountName": "default-editor",
+            "containers": [{
+                "name": name,
+                "image": IMAGE,
+                "resources": {"requests": {"cpu": "0.5", "memory": "1.0Gi"}},
+                "volumeMounts": [{"mountPath": "/home/jovyan",
+                                  "name": "workspace-" + name}],
+            }],
+            "volumes": [{
+                "name": "workspace-" + name,
+                "persistentVolumeClaim": {"claimName": "workspace-" + name},
+            }],
+        }}},
+        "status": {
+            "containerState": {"running": {"startedAt": STARTED}},
+            "readyReplicas": 1,
+        },
+    }
+
+
+def pvc(namespace, i):
+    return {
+        "apiVersion": "v1",
+        "kind": "PersistentVolumeClaim",
+        "metadata": {
+            "name": "workspace-notebook-{}".format(i),
+            "namespace": namespace,
+            "resourceVersion": "1",
+            "creationTimestamp": CREATED,
+        },
+        "spec": {
+            "accessModes": ["ReadWriteOnce"],
+            "storageClassName": "standard",
+            "resources": {"requests": {"storage": "10Gi"}},
+        },
+        "status": {"phase": "Bound"},
+    }
+
+
+def event(namespace, i, j):
+    name = "notebook-{}".format(i)
+    return {
+        "apiVersion": "v1",
+        "kind": "Event",
+        "metadata": {
+            "name": "{}.{:x}".format(name, j),
+            "namespace": namespace,
+            "resourceVersion": "1",
+            "creationTimestamp": STARTED,
+        },
+        "involvedObject": {"kind": "Notebook", "name": name,
+                           "namespace": namespace},
+        "reason": "Started",
+        "message": "Reissued from pod/{}-0: Started container".format(name),
+        "type": "Normal",
+        "count": 1,
+    }
+
+
+def poddefault(namespace, i):
+    return {
+        "apiVersion": "kubeflow.org/v1alpha1",
+        "kind": "PodDefault",
+        "metadata": {"name": "poddefault-{}".format(i),
+                     "namespace": namespace},
+        "spec": {
+            "desc": "PodDefault {}".format(i),
+            "selector": {"matchLabels": {"poddefault-{}".format(i): "true"}},
+        },
+    }
+
+
+def node(i):
+    return {
+        "apiVersion": "v1",
+        "kind": "Node",
+        "metadata": {"name": "node-{}".format(i)},
+        "status": {"allocatable": {"cpu": "16", "memory": "64Gi",
+                                   "pods": "110"}},
+    }
+
+
+def object_list(kind, items, api_version="v1"):
+    return {
+        "apiVersion": api_version,
+        "kind": kind + "List",
+        "metadata": {"resourceVersion": "1"},
+        "items": items,
+    }
+
+
+class Cluster:
+    '''
+    The objects the fake serves: 'notebooks' Notebooks per namespace, each
+    with a workspace PVC and 'events' events. The list responses are encoded
+    once, so that the fake spends as little time as possible per call.
+    '''
+
+    def __init__(self, namespaces, notebooks, events, poddefaults=3,
+                 nodes=10, latency=0, jitter=0):
+        self.namespaces = ["user-{}".format(n) for n in range(namespaces)]
+        self.latency = latency
+        self.jitter = jitter
+
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+        objs = {"notebooks": {}, "pvcs": {}, "events": {}, "poddefaults": {}}
+        self.events = {}
+        for ns in self.namespaces:
+            objs["notebooks"][ns] = [notebook(ns, i)
+                                     for i in range(notebooks)]
+            objs["pvcs"][ns] = [pvc(ns, i) for i in range(notebooks)]
+            objs["poddefaults"][ns] = [poddefault(ns, i)
+                                       for i in range(poddefaults)]
+            objs["events"][ns] = []
+            for i in range(notebooks):
+                evs = [event(ns, i, j) for j in range(events)]
+                self.events[(ns, "notebook-{}".format(i))] = encode(
+                    object_list("Event", evs))
+                objs["events"][ns] += evs
+
+        kinds = {
+            "notebooks": ("Notebook", "kubeflow.org/v1beta1"),
+            "pvcs": ("PersistentVolumeClaim", "v1"),
+            "events": ("Event", "v1"),
+            "poddefaults": ("PodDefault", "kubeflow.org/v1alpha1"),
+        }
+        self.lists = {}
+        for rsrc, per_ns in objs.items():
+            kind, version = kinds[rsrc]
+            for ns, items in per_ns.items():
+                self.lists[(rsrc, ns)] = encode(
+                    object_list(kind, items, version))
+            self.lists[(rsrc, None)] = encode(object_list(
+                kind, [o for items in per_ns.values() for o in items],
+                version))
+
+        self.lists[("nodes", None)] = encode(
+            object_list("Node", [node(i) for i in range(nodes)]))
+        self.lists[("pods", None)] = encode(object_list("Pod", []))
+        self.lists[("namespaces", None)] = encode(object_list(
+            "Namespace", [{"metadata": {"name": ns}}
+                          for ns in self.namespaces]))
+        self.lists[("storageclasses", None)] = encode(object_list(
+            "StorageClass",
+            [{"metadata": {
+                "name": "standard",
+                "annotations": {
+                    "storageclass.kubernetes.io/is-default-class": "true"},
+            }, "provisioner": "kubernetes.io/gce-pd"}],
+            "storage.k8s.io/v1"))
+
+    def count(self, method, rsrc):
+        with self.lock:
+            self.calls["{} {}".format(method, rsrc)] += 1
+
+    def reset_calls(self):
+        '''Return the calls counted so far and start counting from zero'''
+        with self.lock:
+            calls, self.calls = self.calls, Counter()
+        return calls
+
+    def delay(self):
+        d = self.latency + random.uniform(0, self.jitter)
+        if d > 0:
+            time.sleep(d)
+
+
+def encode(obj):
+    return json.dumps(obj).encode("utf-8")
+
+
+def field(query, name):
+    '''The value of a field of the fieldSelector, i.e. involvedObject.name'''
+    for sel in query.get("fieldSelector", [""])[0].split(","):
+        k, _, v = sel.partition("=")
+        if k == name:
+            return v
+    return None
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def route(self, method):
+        url = urlparse(self.path)
+        for m, pattern, rsrc in ROUTES:
+            match = pattern.match(url.path)
+            if m == method and match:
+                return rsrc, match.groupdict(), parse_qs(url.query)
+
+        return None, {}, {}
+
+    def do_GET(self):
+        cluster = self.server.cluster
+        rsrc, params, query = self.route("GET")
+        if rsrc is None:
+            return self.send(404, encode({"kind": "Status", "code": 404,
+                                          "message": "not found"}))
+
+        if query.get("watch", ["false"])[0] in ("true", "1"):
+            # Nothing ever changes, so a watch just ends after a while
+            cluster.count("WATCH", rsrc)
+            timeout = int(query.get("timeoutSeconds", [MAX_WATCH_SECS])[0])
+            time.sleep(min(timeout, MAX_WATCH_SECS))
+            return self.send(200, b"")
+
+        cluster.count("GET", rsrc)
+        cluster.delay()
+
+        ns = params.get("namespace")
+        if rsrc == "secrets":
+            return self.send(200, encode({
+                "apiVersion": "v1",
+                "kind": "Secret",
+                "metadata": {"name": params["name"], "namespace": ns},
+                "data": {"token": "dG9rZW4="},
+            }))
+
+        if rsrc == "events" and field(query, "involvedObject.name"):
+            name = field(query, "involvedObject.name")
+            body = cluster.events.get((ns, name))
+            return self.send(200, body or encode(object_list("Event", [])))
+
+        body = cluster.lists.get((rsrc, ns))
+        if body is None:
+            body = encode(object_list(rsrc, []))
+        self.send(200, body)
+
+    def do_POST(self):
+        cluster = self.server.cluster
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+
+        rsrc, params, _ = self.route("POST")
+        if rsrc is None:
+            return self.send(404, encode({"kind": "Status", "code": 404,
+                                          "message": "not found"}))
+
+        cluster.count("POST", rsrc)
+        cluster.delay()
+
+        if rsrc == "subjectaccessreviews":
+            body["status"] = {"allowed": True}
+        elif rsrc == "selfsubjectrulesreviews":
+            body["status"] = {
+                "resourceRules": [{"verbs": ["*"], "apiGroups": ["*"],
+                                   "resources": ["*"]}],
+                "nonResourceRules": [],
+                "incomplete": False,
+            }
+        else:
+            # The created objects are not stored, so that every iteration
+            # of a benchmark sees the same cluster
+            meta = body.setdefault("metadata", {})
+            if "generateName" in meta and "name" not in meta:
+                meta["name"] = meta["generateName"] + "{:05x}".format(
+                    random.getrandbits(20))
+            meta.setdefault("namespace", params.get("namespace"))
+            meta["resourceVersion"] = "1"
+            meta["creationTimestamp"] = CREATED
+
+        self.send(201, encode(body))
+
+
+class Server(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve(cluster, host="127.0.0.1", port=0):
+    '''Serve the cluster from a background thread. Returns the server URL'''
+    server = Server((host, port), Handler)
+    server.cluster = cluster
+    t = threading.Thread(target=server.serve_forever, name="fake-api-server",
+                         daemon=True)
+    t.start()
+    return "http://{}:{}".format(*server.server_address)
+
+
+def write_kubeconfig(url, path):
+    '''A kubeconfig with a single context for the fake API Server'''
+    kubeconfig = {
+        "apiVersion": "v1",
+        "kind": "Config",
+        "clusters": [{"name": "fake", "cluster": {"server": url}}],
+        "users": [{"name": "fake", "user": {"token": "fake"}}],
+        "contexts": [{"name": "fake",
+                      "context": {"cluster": "fake", "user": "fake"}}],
+        "current-context": "fake",
+    }
+    with open(path, "w") as f:
+        json.dump(kubeconfig, f)
@@ -0,0 +1,78 @@
+'''
+Measures the CPU time and the bytes of a get_notebooks response, with the
+json module and with orjson, and without compression and with gzip and
+brotli. The fake Notebooks are alike, so real responses compress less. Run it
+from the backend's directory:
+
+    python -m benchmarks.json_response [--notebooks 500]
+'''
+import os
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from . import fakeapi
+
+
+def cpu_ms(fn, iterations):
+    '''CPU time of a call of fn, in ms, averaged over the iterations'''
+    start = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - start) * 1000 / iterations
+
+
+def main():
+    parser = ArgumentParser(description="CPU and bytes per JSON response")
+    parser.add_argument("--notebooks", type=int, default=500,
+                        help="number of Notebooks in the response")
+    parser.add_argument("--iterations", type=int, default=50,
+                        help="times each step is repeated")
+    args = parser.parse_args()
+
+    # The backend loads the kubeconfig when imported. No calls are sent
+    kubeconfig = os.path.join(tempfile.mkdtemp(), "kubeconfig")
+    fakeapi.write_kubeconfig("http://127.0.0.1:1", kubeconfig)
+    os.environ["KUBECONFIG"] = kubeconfig
+
+    from flask import jsonify
+    from kubeflow_jupyter.default.app import app
+    from kubeflow_jupyter.common import compression, encoder, settings, utils
+
+    data = {
+        "success": True,
+        "log": "",
+        "notebooks": [utils.process_resource(fakeapi.notebook("user", i), [])
+                      for i in range(args.notebooks)],
+    }
+
+    with app.test_request_context():
+        print("{:<10}{:>12}{:>12}".format("Encoder", "CPU (ms)", "Bytes"))
+        for name in ("json", "orjson"):
+            if name == "orjson" and encoder.orjson is None:
+                print("{:<10}{:>24}".format(name, "not installed"))
+                continue
+
+            settings.JSON_ENCODER = name
+            body = jsonify(data).get_data()
+            ms = cpu_ms(lambda: jsonify(data).get_data(), args.iterations)
+            print("{:<10}{:>12.2f}{:>12}".format(name, ms, len(body)))
+
+        print("\n{:<10}{:>12}{:>12}{:>8}".format("Encoding", "CPU (ms)",
+                                                 "Bytes", "Ratio"))
+        print("{:<10}{:>12.2f}{:>12}{:>7.1f}x".format("identity", 0,
+                                                      len(body), 1))
+        for enc in ("gzip", "br"):
+            if enc == "br" and compression.brotli is None:
+                print("{:<10}{:>24}".format(enc, "not installed"))
+                continue
+
+            compressed = compression.compress(body, enc)
+            ms = cpu_ms(lambda: compression.compress(body, enc),
+                        args.iterations)
+            print("{:<10}{:>12.2f}{:>12}{:>7.1f}x".format(
+                enc, ms, len(compressed), len(body) / len(compressed)))
+
+
+if __name__ == "__main__":
+    main()
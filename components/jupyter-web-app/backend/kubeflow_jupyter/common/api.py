@@ -3,6 +3,12 @@ from kubernetes import client, config
 from kubernetes.config import ConfigException
 from kubernetes.client.rest import ApiException
 from . import auth
+from . import breaker
+from . import cache
+from . import deadline
+from . import records
+from . import startup
+from . import tracing
 from . import utils
 
 logger = utils.create_logger(__name__)
@@ -18,6 +24,27 @@ except ConfigException:
 v1_core = client.CoreV1Api()
 custom_api = client.CustomObjectsApi()
 storage_api = client.StorageV1Api()
+for a in (v1_core, custom_api, storage_api):
+    deadline.disable_read_retries(a)
+
+# Caches for the resources listed by the UIs. They are only used if enabled
+cache.register("notebooks", custom_api.list_cluster_custom_object,
+               "kubeflow.org", "v1beta1", "notebooks",
+               record=records.NotebookRecord,
+               on_update=startup.on_notebook_update, sharded=True)
+cache.register("pvcs", v1_core.list_persistent_volume_claim_for_all_namespaces,
+               record=records.PVCRecord, sharded=True)
+cache.register("notebook-events", v1_core.list_event_for_all_namespaces,
+               field_selector="involvedObject.kind=Notebook",
+               record=records.EventRecord, sharded=True)
+cache.register("poddefaults", custom_api.list_cluster_custom_object,
+               "kubeflow.org", "v1alpha1", "poddefaults", sharded=True)
+# Used for the capacity of the whole cluster, so every shard keeps them all.
+# Of the Pods only their node and requests are kept
+cache.register("nodes", v1_core.list_node)
+cache.register("pods", v1_core.list_pod_for_all_namespaces,
+               field_selector="status.phase!=Succeeded,status.phase!=Failed",
+               record=records.PodRecord)
 
 
 def parse_error(e):
@@ -40,16 +67,28 @@ def wrap_resp(rsrc, fn, *args, **kwargs):
         "log": ""
     }
 
-    try:
-        data[rsrc] = fn(*args, **kwargs)
-    except ApiException as e:
-        data[rsrc] = {}
-        data["success"] = False
-        data["log"] = parse_error(e)
-    except Exception as e:
-        data[rsrc] = {}
-        data["success"] = False
-        data["log"] = parse_error(e)
+    timeout = deadline.call_timeout()
+    if not breaker.api_server.allow():
+        return breaker.fallback(rsrc, fn, args, kwargs)
+
+    with tracing.span("k8s." + fn.__name__, resource=rsrc):
+        try:
+            data[rsrc] = fn(*args, _request_timeout=timeout, **kwargs)
+            breaker.api_server.record_success()
+            breaker.remember(fn, args, kwargs, data[rsrc])
+        except ApiException as e:
+            breaker.api_server.record_error(e)
+            data[rsrc] = {}
+            data["success"] = False
+            data["log"] = parse_error(e)
+        except Exception as e:
+            breaker.api_server.record_error(e)
+            data[rsrc] = {}
+            data["success"] = False
+            data["log"] = parse_error(e)
+
+        if not data["success"]:
+            tracing.set_error(data["log"])
 
     return data
 
@@ -63,34 +102,107 @@ def wrap(fn, *args, **kwargs):
         "log": ""
     }
 
-    try:
-        fn(*args, **kwargs)
-    except ApiException as e:
-        data["success"] = False
-        data["log"] = parse_error(e)
-    except Exception as e:
-        data["success"] = False
-        data["log"] = parse_error(e)
+    timeout = deadline.call_timeout()
+    if not breaker.api_server.allow():
+        return breaker.fallback(None, fn, args, kwargs)
+
+    with tracing.span("k8s." + fn.__name__):
+        try:
+            fn(*args, _request_timeout=timeout, **kwargs)
+            breaker.api_server.record_success()
+        except ApiException as e:
+            breaker.api_server.record_error(e)
+            data["success"] = False
+            data["log"] = parse_error(e)
+        except Exception as e:
+            breaker.api_server.record_error(e)
+            data["success"] = False
+            data["log"] = parse_error(e)
+
+        if not data["success"]:
+            tracing.set_error(data["log"])
+
+    return data
+
+
+def wrap_stream(rsrc, fn, *args, **kwargs):
+    '''
+    Like wrap_resp, for calls whose response is streamed by the caller. The
+    rsrc is the urllib3 response, which the caller must release. Streams
+    aren't served stale while the circuit breaker is open, and followed ones
+    are not cut by the request's deadline once they have connected.
+    '''
+    data = {
+        "success": True,
+        "log": ""
+    }
+
+    timeout = deadline.call_timeout()
+    if kwargs.get("follow") and timeout is not None:
+        timeout = (timeout[0], None)
+    if not breaker.api_server.allow():
+        raise breaker.CircuitOpen(
+            "The API Server is unavailable. Try again later",
+            breaker.api_server.retry_after())
+
+    with tracing.span("k8s." + fn.__name__, resource=rsrc):
+        try:
+            data[rsrc] = fn(*args, _preload_content=False,
+                            _request_timeout=timeout, **kwargs)
+            breaker.api_server.record_success()
+        except Exception as e:
+            # ApiExceptions, but also timeouts and connection errors
+            breaker.api_server.record_error(e)
+            data[rsrc] = None
+            data["success"] = False
+            data["log"] = parse_error(e)
+            tracing.set_error(data["log"])
 
     return data
 
 
+def cached_resp(rsrc, namespace, predicate=None):
+    '''
+    rsrc: Name of the resource, used as the dict key and as the cache's name
+
+    Returns the same dict as wrap_resp, with the objects served from the
+    resource's cache. Returns None if the cache can't be used.
+    '''
+    c = cache.get(rsrc)
+    if c is None or not c.owns(namespace):
+        return None
+
+    return {
+        "success": True,
+        "log": "",
+        rsrc: c.as_list(c.list(namespace, predicate)),
+    }
+
+
 # API Functions
 # GETers
 @auth.needs_authorization("list", "", "v1", "persistentvolumeclaims")
 def list_pvcs(namespace):
+    data = cached_resp("pvcs", namespace)
+    if data is not None:
+        return data
+
     return wrap_resp(
         "pvcs",
-        v1_core.list_namespaced_persistent_volume_claim,
+        deadline.hedged(v1_core.list_namespaced_persistent_volume_claim),
         namespace=namespace
     )
 
 
 @auth.needs_authorization("list", "kubeflow.org", "v1beta1", "notebooks")
 def list_notebooks(namespace):
+    data = cached_resp("notebooks", namespace)
+    if data is not None:
+        return data
+
     return wrap_resp(
         "notebooks",
-        custom_api.list_namespaced_custom_object,
+        deadline.hedged(custom_api.list_namespaced_custom_object),
         "kubeflow.org",
         "v1beta1",
         namespace,
@@ -106,6 +218,11 @@ def list_notebook_events(namespace, nb_name):
     '''
     V1EventList with events whose source the Notebook with 'nb_name' from namespace 'namespace'
     '''
+    data = cached_resp("notebook-events", namespace,
+                       lambda e: e.involved_object.name == nb_name)
+    if data is not None:
+        return data
+
     return wrap_resp(
         "notebook-events",
         v1_core.list_namespaced_event,
@@ -114,8 +231,34 @@ def list_notebook_events(namespace, nb_name):
     )
 
 
+@auth.needs_authorization("get", "", "v1", "pods/log")
+def read_notebook_logs(notebook_name, namespace, follow=False, tail_lines=None,
+                       since_seconds=None):
+    '''
+    The log of the Notebook's container, as a urllib3 response to be streamed.
+    The Pod is the single replica of the Notebook's StatefulSet.
+    '''
+    kwargs = {"container": notebook_name, "follow": follow}
+    if tail_lines is not None:
+        kwargs["tail_lines"] = tail_lines
+    if since_seconds is not None:
+        kwargs["since_seconds"] = since_seconds
+
+    return wrap_stream(
+        "logs",
+        v1_core.read_namespaced_pod_log,
+        notebook_name + "-0",
+        namespace,
+        **kwargs
+    )
+
+
 @auth.needs_authorization("list", "kubeflow.org", "v1alpha1", "poddefaults")
 def list_poddefaults(namespace):
+    data = cached_resp("poddefaults", namespace)
+    if data is not None:
+        return data
+
     return wrap_resp(
         "poddefaults",
         custom_api.list_namespaced_custom_object,
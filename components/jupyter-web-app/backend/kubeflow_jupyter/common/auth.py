@@ -1,12 +1,25 @@
 import functools
 from kubernetes import client, config
 from kubernetes.config import ConfigException
-from kubernetes.client.rest import ApiException
+from . import breaker
+from . import deadline
+from . import tracing
 from . import utils
 from . import settings
+from .ttlcache import TTLCache
 
 logger = utils.create_logger(__name__)
 
+# The latest SubjectAccessReview decisions, used while the circuit breaker in
+# front of the API Server is open
+MAX_STALE_DECISIONS = 4096
+stale_decisions = TTLCache(MAX_STALE_DECISIONS,
+                           settings.BREAKER_STALE_AUTH_TTL_SECS)
+
+# Rules of (user, namespace), from SelfSubjectRulesReviews
+MAX_RULES = 4096
+rules_cache = TTLCache(MAX_RULES, settings.AUTH_RULES_TTL_SECS)
+
 try:
     # Load configuration inside the Pod
     config.load_incluster_config()
@@ -16,14 +29,16 @@ except ConfigException:
 
 # The API object for submitting SubjecAccessReviews
 api = client.AuthorizationV1Api()
+deadline.disable_read_retries(api)
 
 
 def create_subject_access_review(user, verb, namespace, group, version,
                                  resource):
     '''
     Create the SubjecAccessReview object which we will use to determine if the
-    user is authorized.
+    user is authorized. The resource can have a subresource, i.e. pods/log.
     '''
+    resource, _, subresource = resource.partition("/")
     return client.V1SubjectAccessReview(
         spec=client.V1SubjectAccessReviewSpec(
             user=user,
@@ -32,12 +47,142 @@ def create_subject_access_review(user, verb, namespace, group, version,
                 namespace=namespace,
                 verb=verb,
                 resource=resource,
+                subresource=subresource or None,
                 version=version
             )
         )
     )
 
 
+def create_self_subject_rules_review(user, namespace, timeout):
+    '''
+    Submit a SelfSubjectRulesReview as the user, by impersonating them. The
+    generated client can't add headers to a single call, so the request is
+    made with the ApiClient directly.
+    '''
+    review = client.V1SelfSubjectRulesReview(
+        spec=client.V1SelfSubjectRulesReviewSpec(namespace=namespace))
+
+    return api.api_client.call_api(
+        "/apis/authorization.k8s.io/v1/selfsubjectrulesreviews", "POST",
+        header_params={
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "Impersonate-User": user,
+        },
+        body=review,
+        response_type="V1SelfSubjectRulesReview",
+        auth_settings=["BearerToken"],
+        _return_http_data_only=True,
+        _request_timeout=timeout,
+    )
+
+
+def namespace_rules(user, namespace):
+    '''
+    The status of a SelfSubjectRulesReview of the user in the namespace, with
+    the resource rules that apply to them. Cached for AUTH_RULES_TTL_SECS.
+    Returns None if the rules can't be fetched.
+    '''
+    key = (user, namespace)
+    rules = rules_cache.get(key)
+    if rules is not None:
+        return rules
+
+    timeout = deadline.call_timeout()
+    if not breaker.api_server.allow():
+        return None
+
+    with tracing.span("auth.rules_review", user=user, namespace=namespace):
+        try:
+            obj = create_self_subject_rules_review(user, namespace, timeout)
+            breaker.api_server.record_success()
+        except Exception as e:
+            breaker.api_server.record_error(e)
+            logger.error("Error submitting SelfSubjectRulesReview for user"
+                         " {} in namespace {}: {}".format(user, namespace, e))
+            tracing.set_error(str(e))
+            return None
+
+    if obj.status is None:
+        logger.error("SelfSubjectRulesReview doesn't have status.")
+        return None
+
+    rules_cache.set(key, obj.status)
+    return obj.status
+
+
+def resource_matches(rule_resource, resource):
+    '''
+    As RBAC matches them: "*" matches every resource and subresource, and
+    "*/log" the log subresource of every resource, i.e. pods/log
+    '''
+    if rule_resource in ("*", resource):
+        return True
+
+    _, _, subresource = resource.partition("/")
+    return bool(subresource) and rule_resource == "*/" + subresource
+
+
+def rule_matches(rule, verb, group, resource):
+    # Rules limited to specific resourceNames don't grant the whole resource
+    if rule.resource_names:
+        return False
+
+    verbs = any(v in ("*", verb) for v in rule.verbs)
+    groups = any(g in ("*", group) for g in rule.api_groups or [])
+    resources = any(resource_matches(r, resource)
+                    for r in rule.resources or [])
+    return verbs and groups and resources
+
+
+def rules_allow(rules, verb, group, resource):
+    '''
+    Whether the rules allow the verb on the resource. Returns None if they
+    don't, but are incomplete, i.e. when an authorizer other than RBAC is
+    used, in which case a SubjectAccessReview has the final say.
+    '''
+    for rule in rules.resource_rules or []:
+        if rule_matches(rule, verb, group, resource):
+            return True
+
+    if rules.incomplete:
+        return None
+
+    return False
+
+
+def rules_decision(user, verb, namespace, group, resource):
+    '''
+    The decision of the user's rules in the namespace, from their
+    SelfSubjectRulesReview. Returns None if the rules can't decide, in which
+    case a SubjectAccessReview has to.
+    '''
+    if not settings.AUTH_RULES_REVIEW or namespace is None:
+        return None
+
+    rules = namespace_rules(user, namespace)
+    if rules is None:
+        return None
+
+    return rules_allow(rules, verb, group, resource)
+
+
+def stale_decision(key):
+    '''
+    The last decision of the same SubjectAccessReview, while the circuit
+    breaker is open. Raises CircuitOpen if there is none.
+    '''
+    allowed = stale_decisions.get(key)
+    if allowed is None:
+        raise breaker.CircuitOpen(
+            "The API Server is unavailable. Try again later",
+            breaker.api_server.retry_after())
+
+    return allowed
+
+
+@tracing.traced("auth.is_authorized", "user", "verb", "namespace", "resource")
 def is_authorized(user, verb, namespace, group, version, resource):
     '''
     Create a SubjectAccessReview to the K8s API to determine if the user is
@@ -58,18 +203,32 @@ def is_authorized(user, verb, namespace, group, version, resource):
         )
         return False
 
+    allowed = rules_decision(user, verb, namespace, group, resource)
+    if allowed is not None:
+        return allowed
+
+    timeout = deadline.call_timeout()
+    key = (user, verb, namespace, group, version, resource)
+    if not breaker.api_server.allow():
+        return stale_decision(key)
+
     sar = create_subject_access_review(user, verb, namespace, group, version,
                                        resource)
     try:
-        obj = api.create_subject_access_review(sar)
-    except ApiException as e:
+        obj = api.create_subject_access_review(sar, _request_timeout=timeout)
+        breaker.api_server.record_success()
+    except Exception as e:
+        # ApiExceptions, but also timeouts and connection errors
+        breaker.api_server.record_error(e)
         logger.error(
-            "Error submitting SubjecAccessReview: {}, {}".format(
-                sar, utils.parse_error(e))
+            "Error submitting SubjecAccessReview: {}, {}".format(sar, e)
         )
+        tracing.set_error(str(e))
         return False
 
     if obj.status is not None:
+        if settings.BREAKER_ENABLED:
+            stale_decisions.set(key, obj.status.allowed)
         return obj.status.allowed
     else:
         logger.error("SubjectAccessReview doesn't have status.")
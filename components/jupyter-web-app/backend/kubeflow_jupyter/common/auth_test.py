@@ -0,0 +1,166 @@
+import pytest
+from kubernetes import client
+
+from kubeflow_jupyter.common import auth, breaker, settings
+from kubeflow_jupyter.common.ttlcache import TTLCache
+
+
+def rule(verbs, resources, groups=("",), names=None):
+    return client.V1ResourceRule(verbs=list(verbs), api_groups=list(groups),
+                                 resources=list(resources),
+                                 resource_names=names)
+
+
+def rules(*resource_rules, incomplete=False):
+    return client.V1SubjectRulesReviewStatus(
+        resource_rules=list(resource_rules), non_resource_rules=[],
+        incomplete=incomplete)
+
+
+class FakeAuthorizationApi:
+    '''Answers the reviews with the given rules and SAR decision'''
+
+    def __init__(self, status=None, allowed=False):
+        self.status = status
+        self.allowed = allowed
+        self.rules_reviews = 0
+        self.access_reviews = 0
+
+    def rules_review(self, user, namespace, timeout):
+        self.rules_reviews += 1
+        if self.status is None:
+            raise client.rest.ApiException(status=500)
+        return client.V1SelfSubjectRulesReview(
+            spec=client.V1SelfSubjectRulesReviewSpec(namespace=namespace),
+            status=self.status)
+
+    def create_subject_access_review(self, sar, _request_timeout=None):
+        self.access_reviews += 1
+        return client.V1SubjectAccessReview(
+            spec=sar.spec,
+            status=client.V1SubjectAccessReviewStatus(allowed=self.allowed))
+
+
+@pytest.fixture
+def authz(monkeypatch):
+    def install(**kwargs):
+        fake = FakeAuthorizationApi(**kwargs)
+        monkeypatch.setattr(auth, "create_self_subject_rules_review",
+                            fake.rules_review)
+        monkeypatch.setattr(auth.api, "create_subject_access_review",
+                            fake.create_subject_access_review)
+        return fake
+
+    monkeypatch.setattr(settings, "DEV_MODE", False)
+    monkeypatch.setattr(settings, "AUTH_RULES_REVIEW", True)
+    monkeypatch.setattr(auth, "rules_cache", TTLCache(10, 60))
+    monkeypatch.setattr(breaker, "api_server", breaker.NoopBreaker())
+    return install
+
+
+def is_authorized(verb="list", resource="notebooks", group="kubeflow.org",
+                  namespace="user"):
+    return auth.is_authorized("alice", verb, namespace, group, "v1beta1",
+                              resource)
+
+
+def test_rule_matches():
+    r = rule(["get", "list"], ["notebooks"], groups=["kubeflow.org"])
+    assert auth.rule_matches(r, "list", "kubeflow.org", "notebooks")
+    assert not auth.rule_matches(r, "create", "kubeflow.org", "notebooks")
+    assert not auth.rule_matches(r, "list", "", "notebooks")
+    assert not auth.rule_matches(r, "list", "kubeflow.org", "poddefaults")
+
+    assert auth.rule_matches(rule(["*"], ["*"], groups=["*"]), "delete",
+                             "kubeflow.org", "notebooks")
+    assert auth.rule_matches(rule(["get"], ["pods/log"]), "get", "",
+                             "pods/log")
+    assert not auth.rule_matches(rule(["get"], ["pods"]), "get", "",
+                                 "pods/log")
+
+
+def test_rule_matches_subresources():
+    for resources in (["*"], ["*/log"], ["pods/log"]):
+        assert auth.rule_matches(rule(["get"], resources), "get", "",
+                                 "pods/log")
+
+    assert not auth.rule_matches(rule(["get"], ["*/exec"]), "get", "",
+                                 "pods/log")
+    assert not auth.rule_matches(rule(["get"], ["*/log"]), "get", "",
+                                 "pods")
+
+
+def test_rules_with_resource_names_dont_grant_the_resource():
+    r = rule(["get"], ["notebooks"], groups=["kubeflow.org"], names=["nb"])
+    assert not auth.rule_matches(r, "get", "kubeflow.org", "notebooks")
+
+
+def test_rules_allow():
+    status = rules(rule(["list"], ["persistentvolumeclaims"]))
+    assert auth.rules_allow(status, "list", "", "persistentvolumeclaims")
+    assert auth.rules_allow(status, "create", "",
+                            "persistentvolumeclaims") is False
+
+    status.incomplete = True
+    assert auth.rules_allow(status, "create", "",
+                            "persistentvolumeclaims") is None
+
+
+def test_allowed_by_the_rules(authz):
+    fake = authz(status=rules(rule(["list"], ["notebooks"],
+                                   groups=["kubeflow.org"])))
+
+    assert is_authorized()
+    assert is_authorized()
+    assert fake.rules_reviews == 1
+    assert fake.access_reviews == 0
+
+
+def test_denied_by_complete_rules(authz):
+    fake = authz(status=rules(), allowed=True)
+
+    assert not is_authorized()
+    assert fake.access_reviews == 0
+
+
+def test_incomplete_rules_fall_back_to_a_review(authz):
+    fake = authz(status=rules(incomplete=True), allowed=True)
+
+    assert is_authorized()
+    assert fake.access_reviews == 1
+
+
+def test_failed_rules_review_falls_back_to_a_review(authz):
+    fake = authz(status=None, allowed=True)
+
+    assert is_authorized()
+    assert fake.rules_reviews == 1
+    assert fake.access_reviews == 1
+
+
+def test_cluster_scoped_checks_skip_the_rules(authz):
+    fake = authz(status=rules(), allowed=True)
+
+    assert is_authorized(namespace=None)
+    assert fake.rules_reviews == 0
+
+
+def test_rules_disabled(authz, monkeypatch):
+    monkeypatch.setattr(settings, "AUTH_RULES_REVIEW", False)
+    fake = authz(status=rules(), allowed=True)
+
+    assert is_authorized()
+    assert fake.rules_reviews == 0
+
+
+def test_no_user(authz):
+    authz(status=rules(), allowed=True)
+    assert not auth.is_authorized(None, "list", "user", "kubeflow.org",
+                                  "v1beta1", "notebooks")
+
+
+def test_logs_allowed_by_a_wildcard_subresource_rule(authz):
+    fake = authz(status=rules(rule(["get"], ["*/log"])))
+
+    assert is_authorized(verb="get", resource="pods/log", group="")
+    assert fake.access_reviews == 0
@@ -1,9 +1,25 @@
 import datetime as dt
 
-from flask import jsonify, request, Blueprint
+from flask import jsonify, request, Blueprint, Response, g
 from kubernetes import client
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from . import api
+from . import breaker
+from . import capacity
+from . import compression
+from . import deadline
+from . import encoder
+from . import idempotency
+from . import logs
+from . import profiling
+from . import ratelimit
+from . import settings
+from . import sharding
+from . import startup
+from . import tracing
+from . import usage
 from . import utils
+from . import warmpool
 
 # The BaseApp is a Blueprint that other UIs will use
 app = Blueprint("base_app", __name__)
@@ -18,6 +34,110 @@ def prefix():
         return ""
 
 
+# The apps encode their JSON responses with the faster encoder
+@app.record_once
+def set_json_encoder(state):
+    state.app.json_encoder = encoder.JSONEncoder
+
+
+# Compression: registered first, so that it runs after all the other hooks
+@app.after_app_request
+def compress_response(resp):
+    return compression.compress_response(resp)
+
+
+# Profiling: registered early, so that it covers the other hooks too
+@app.before_app_request
+def start_request_profile():
+    g.profiler = profiling.start(request.headers)
+
+
+@app.after_app_request
+def end_request_profile(resp):
+    sampler = g.pop("profiler", None)
+    if sampler is None:
+        return resp
+
+    # Streamed responses are only profiled until their view returns
+    sampler.stop()
+    profiling.log_summary(sampler, request.method, request.path)
+    if request.headers.get(profiling.HEADER) == profiling.MODE_INLINE:
+        report = sampler.report(settings.PROFILING_TOP)
+        report["status"] = resp.status_code
+        return jsonify(report)
+
+    try:
+        path = profiling.save(sampler, request.method, request.path)
+        resp.headers[profiling.PROFILE_FILE_HEADER] = path
+    except OSError as e:
+        logger.error("Couldn't save the profile: {}".format(e))
+
+    return resp
+
+
+@app.teardown_app_request
+def stop_request_profile(exc):
+    # The after request hooks that follow one that raised aren't called, but
+    # the teardown hooks always are, so the sampler can't outlive its request
+    sampler = g.pop("profiler", None)
+    if sampler is not None:
+        sampler.stop()
+
+
+@app.before_app_request
+def start_request_deadline():
+    deadline.start()
+
+
+# Tracing: every request gets a root span, the calls it makes are its children
+@app.before_app_request
+def start_request_span():
+    if not tracing.enabled():
+        return
+
+    g.span, g.parent_span = tracing.start_span(
+        "{} {}".format(request.method, request.url_rule or request.path),
+        {"http.method": request.method, "http.target": request.path},
+        traceparent=request.headers.get("traceparent"),
+    )
+
+
+# Sharding: requests for namespaces of other shards are sent there
+@app.before_app_request
+def route_to_shard():
+    return sharding.route()
+
+
+# Rate limiting: each API request is admitted once, after the sharding so
+# that it's only counted by the shard that serves it
+@app.before_app_request
+def admit_request():
+    if request.path.startswith("/api/"):
+        ratelimit.admit()
+
+
+@app.after_app_request
+def set_request_span_status(resp):
+    span = g.get("span")
+    if span is not None:
+        span.set_attribute("http.status_code", resp.status_code)
+        if resp.status_code >= 500:
+            span.set_error(resp.status)
+
+    return resp
+
+
+@app.teardown_app_request
+def end_request_span(exc):
+    span = g.pop("span", None)
+    if span is None:
+        return
+
+    if exc is not None:
+        span.set_error(str(exc))
+    tracing.end_span(span, g.pop("parent_span"))
+
+
 # REST Routes
 @app.route("/api/namespaces/<namespace>/notebooks")
 def get_notebooks(namespace):
@@ -36,9 +156,14 @@ def get_notebooks(namespace):
             return jsonify(nb_events)
         # User can delete and then create a nb server with the same name
         # Make sure previous events are not taken into account
-        nb_events = filter(lambda e: utils.event_timestamp(e) >= nb_creation_time,
-                           nb_events["notebook-events"].items)
-        items.append(utils.process_resource(nb, nb_events))
+        nb_events = [e for e in nb_events["notebook-events"].items
+                     if utils.event_timestamp(e) >= nb_creation_time]
+        item = utils.process_resource(nb, nb_events)
+        # With the caches the startups are recorded from the watch instead
+        running = item["status"] == utils.STATUS_RUNNING
+        if running and not settings.CACHE_ENABLED:
+            startup.observe(nb, nb_events)
+        items.append(item)
 
     data["notebooks"] = items
     return jsonify(data)
@@ -62,7 +187,7 @@ def get_poddefaults(namespace):
 
         pdefaults.append({"label": label, "desc": desc})
 
-    logger.info("Found poddefaults: {}".format(pdefaults))
+    logger.log(logs.SPEC, "Found poddefaults: %s", pdefaults)
     data["poddefaults"] = pdefaults
     return jsonify(data)
 
@@ -73,7 +198,9 @@ def get_pvcs(namespace):
     if not data["success"]:
         return jsonify(data)
 
-    data["pvcs"] = [utils.process_pvc(pvc) for pvc in data["pvcs"].items]
+    # The PVCs of the warm pool are hidden until a Notebook claims them
+    data["pvcs"] = [utils.process_pvc(pvc) for pvc in data["pvcs"].items
+                    if not warmpool.is_available(pvc)]
 
     return jsonify(data)
 
@@ -101,24 +228,11 @@ def get_default_storageclass():
 
     strg_classes = data["storageclasses"].items
     for strgclss in strg_classes:
-        annotations = strgclss.metadata.annotations
-        if annotations is None:
-            continue
-
-        # List of possible annotations
-        keys = [
-            "storageclass.kubernetes.io/is-default-class",
-            "storageclass.beta.kubernetes.io/is-default-class"  # GKE
-        ]
-
-        for key in keys:
-            is_default = annotations.get(key, "false")
-
-            if is_default == "true":
-                return jsonify({
-                    "success": True,
-                    "defaultStorageClass": strgclss.metadata.name
-                })
+        if utils.is_default_storage_class(strgclss):
+            return jsonify({
+                "success": True,
+                "defaultStorageClass": strgclss.metadata.name
+            })
 
     # No StorageClass is default
     return jsonify({
@@ -127,6 +241,55 @@ def get_default_storageclass():
     })
 
 
+@app.route("/api/namespaces/<namespace>/notebooks/usage")
+def get_notebooks_usage(namespace):
+    return jsonify(usage.namespace_usage(namespace=namespace))
+
+
+def int_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+
+    if not value.isdigit():
+        raise ValueError("{} must be a positive integer".format(name))
+
+    return int(value)
+
+
+@app.route("/api/namespaces/<namespace>/notebooks/<notebook>/logs")
+def get_notebook_logs(namespace, notebook):
+    '''
+    Stream the log of the Notebook's container. With follow=true the new lines
+    keep coming as Server-Sent Events, otherwise the log is sent as plain text.
+    '''
+    follow = request.args.get("follow", "false") == "true"
+    try:
+        tail_lines = int_arg("tailLines")
+        since_seconds = int_arg("sinceSeconds")
+    except ValueError as e:
+        return jsonify({"success": False, "log": str(e)}), 400
+
+    data = api.read_notebook_logs(notebook, namespace=namespace,
+                                  follow=follow, tail_lines=tail_lines,
+                                  since_seconds=since_seconds)
+    if not data["success"]:
+        return jsonify(data)
+
+    if follow:
+        events = utils.sse_events(utils.stream_lines(data["logs"]))
+        return Response(events, mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache",
+                                 "X-Accel-Buffering": "no"})
+
+    return Response(utils.stream_chunks(data["logs"]), mimetype="text/plain")
+
+
+@app.route("/api/namespaces/<namespace>/capacity")
+def get_capacity(namespace):
+    return jsonify(capacity.get_capacity(namespace=namespace))
+
+
 @app.route("/api/config")
 def get_config():
     data = {"success": True}
@@ -137,6 +300,7 @@ def get_config():
 
 # POSTers
 @app.route("/api/namespaces/<namespace>/pvcs", methods=["POST"])
+@idempotency.idempotent
 def post_pvc(namespace):
     body = request.get_json()
 
@@ -165,6 +329,34 @@ def delete_notebook(namespace, notebook):
     return jsonify(api.delete_notebook(notebook, namespace=namespace))
 
 
+# Errors
+@app.app_errorhandler(ratelimit.RateLimited)
+def rate_limited(e):
+    logger.warning("Rate limited: {}".format(e))
+    resp = jsonify({"success": False, "log": str(e)})
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp, 429
+
+
+@app.app_errorhandler(deadline.DeadlineExceeded)
+def deadline_exceeded(e):
+    logger.warning("Deadline exceeded: {}".format(e))
+    return jsonify({"success": False, "log": str(e)}), 504
+
+
+@app.app_errorhandler(breaker.CircuitOpen)
+def circuit_open(e):
+    resp = jsonify({"success": False, "log": str(e)})
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp, 503
+
+
+# Metrics
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
+
 # Liveness/Readiness Probes
 @app.route("/healthz/liveness", methods=["GET"])
 def liveness_probe():
@@ -0,0 +1,128 @@
+import flask
+import pytest
+
+from kubeflow_jupyter.common import api, auth, base_app, utils
+
+LOGS = "/api/namespaces/user/notebooks/nb/logs"
+
+
+class FakeLogResponse:
+    '''Mimics the streamed urllib3 response of a container's log'''
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.released = False
+
+    def stream(self, amt, decode_content=True):
+        yield from self.chunks
+
+    def release_conn(self):
+        self.released = True
+
+
+class FakeCoreV1Api:
+    def __init__(self, chunks):
+        self.resp = FakeLogResponse(chunks)
+        self.calls = []
+
+    def read_namespaced_pod_log(self, name, namespace, _preload_content=True,
+                                _request_timeout=None, **kwargs):
+        # The log is streamed, rather than read in memory
+        assert _preload_content is False
+        self.calls.append((name, namespace, kwargs))
+        return self.resp
+
+
+@pytest.fixture
+def allowed(monkeypatch):
+    '''The authorization checks, which pass unless their resource is denied'''
+    checks, denied = [], set()
+
+    def is_authorized(user, verb, namespace, group, version, resource):
+        checks.append((verb, resource))
+        return resource not in denied
+
+    monkeypatch.setattr(auth, "is_authorized", is_authorized)
+    return checks, denied
+
+
+@pytest.fixture
+def core(monkeypatch):
+    fake = FakeCoreV1Api([b"first\nsec", b"ond\n", b"third"])
+    monkeypatch.setattr(api, "v1_core", fake)
+    return fake
+
+
+@pytest.fixture
+def client():
+    app = flask.Flask(__name__)
+    app.register_blueprint(base_app.app)
+    return app.test_client()
+
+
+def get(client, query=""):
+    return client.get(LOGS + query, headers={
+        utils.USER_HEADER: utils.USER_PREFIX + "alice"})
+
+
+def test_int_arg():
+    app = flask.Flask(__name__)
+    with app.test_request_context("/?tailLines=10&sinceSeconds=-5&n=x"):
+        assert base_app.int_arg("tailLines") == 10
+        assert base_app.int_arg("missing") is None
+        for name in ("sinceSeconds", "n"):
+            with pytest.raises(ValueError):
+                base_app.int_arg(name)
+
+
+def test_invalid_args_are_rejected(client, allowed, core):
+    resp = get(client, "?tailLines=ten")
+    assert resp.status_code == 400
+    assert "tailLines" in resp.get_json()["log"]
+    assert core.calls == []
+
+
+def test_logs(client, allowed, core):
+    resp = get(client, "?tailLines=100&sinceSeconds=60")
+
+    assert resp.mimetype == "text/plain"
+    assert resp.get_data() == b"first\nsecond\nthird"
+    assert core.calls == [("nb-0", "user", {
+        "container": "nb", "follow": False, "tail_lines": 100,
+        "since_seconds": 60})]
+    assert core.resp.released
+    assert allowed[0] == [("get", "pods/log")]
+
+
+def test_followed_logs_are_server_sent_events(client, allowed, core):
+    resp = get(client, "?follow=true")
+
+    assert resp.mimetype == "text/event-stream"
+    assert resp.headers["Cache-Control"] == "no-cache"
+    assert resp.get_data() == (b"data: first\n\n" b"data: second\n\n"
+                               b"data: third\n\n")
+    assert core.calls[0][2]["follow"] is True
+
+
+def test_logs_need_authorization(client, allowed, core):
+    checks, denied = allowed
+    denied.add("pods/log")
+
+    resp = get(client)
+
+    body = resp.get_json()
+    assert body["success"] is False
+    assert "not authorized" in body["log"]
+    assert checks == [("get", "pods/log")]
+    assert core.calls == []
+
+
+def test_stream_lines_joins_the_chunks():
+    resp = FakeLogResponse([b"a\nb", b"", b"c\n\nd\n"])
+    assert list(utils.stream_lines(resp)) == [b"a", b"bc", b"", b"d"]
+    assert resp.released
+
+
+def test_sse_events():
+    assert list(utils.sse_events([b"one", b""])) == [b"data: one\n\n",
+                                                     b"data: \n\n"]
@@ -0,0 +1,213 @@
+import collections
+import math
+import threading
+import time
+
+from kubernetes.client.rest import ApiException
+from . import metrics
+from . import settings
+from . import utils
+from .ttlcache import TTLCache
+
+logger = utils.create_logger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half-open"
+
+# Number of read results kept, to serve while the breaker is open
+MAX_STALE_RESULTS = 1024
+
+
+class CircuitOpen(Exception):
+    '''
+    Raised when a call to the API Server is not sent because the breaker is
+    open and there is no stale data to use instead. The Flask apps turn it
+    into a 503 response with a Retry-After header.
+    '''
+
+    def __init__(self, msg, retry_after):
+        super().__init__(msg)
+        self.retry_after = retry_after
+
+
+def is_overload_error(e):
+    '''
+    Only errors that show the API Server is degraded count towards opening
+    the breaker. i.e. a 404 or a 409 means the API Server is healthy.
+    '''
+    if isinstance(e, ApiException):
+        return not e.status or e.status == 429 or e.status >= 500
+
+    # Timeouts, connection errors etc
+    return True
+
+
+class CircuitBreaker:
+    '''
+    Tracks the outcome of the last calls to the API Server. When the ratio of
+    failed calls goes over a threshold the breaker opens and calls fail fast.
+    After a cooldown a single probe call is let through (half-open): if it
+    succeeds the breaker closes, otherwise it opens again. Only the probe's
+    outcome counts while half-open, not the outcomes of the calls that were
+    sent before the breaker opened. The probe is known by its thread, which
+    both sends the call and records its outcome.
+    '''
+
+    def __init__(self, window, min_calls, error_ratio, cooldown):
+        self.min_calls = min_calls
+        self.error_ratio = error_ratio
+        self.cooldown = cooldown
+
+        self.outcomes = collections.deque(maxlen=window)
+        self.state = STATE_CLOSED
+        self.opened_at = 0
+        self.probing = False
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def allow(self):
+        '''Whether a call should be sent to the API Server'''
+        with self.lock:
+            if self.state == STATE_CLOSED:
+                return True
+
+            if self.state == STATE_OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.set_state(STATE_HALF_OPEN)
+
+            # Half-open, only a single probe at a time
+            if self.probing:
+                return False
+
+            self.probing = True
+            self.local.probe = True
+            return True
+
+    def is_probe(self):
+        '''Whether the calling thread sent the probe, and forget it'''
+        probe = getattr(self.local, "probe", False)
+        self.local.probe = False
+        return probe
+
+    def retry_after(self):
+        left = self.cooldown - (time.monotonic() - self.opened_at)
+        return max(1, math.ceil(left))
+
+    def record_success(self):
+        probe = self.is_probe()
+        with self.lock:
+            if self.state != STATE_CLOSED and not probe:
+                return
+
+            if self.state == STATE_HALF_OPEN:
+                logger.info("Probe to the API Server succeeded. Closing the"
+                            " circuit breaker")
+                self.outcomes.clear()
+                self.probing = False
+                self.set_state(STATE_CLOSED)
+                return
+
+            self.outcomes.append(True)
+
+    def record_error(self, e):
+        if not is_overload_error(e):
+            self.record_success()
+            return
+
+        probe = self.is_probe()
+        with self.lock:
+            if self.state != STATE_CLOSED and not probe:
+                return
+
+            if self.state == STATE_HALF_OPEN:
+                logger.warning("Probe to the API Server failed. Reopening"
+                               " the circuit breaker")
+                self.probing = False
+                self.open()
+                return
+
+            self.outcomes.append(False)
+            if self.state == STATE_CLOSED and self.over_threshold():
+                logger.warning(
+                    "{}/{} of the last calls to the API Server failed."
+                    " Opening the circuit breaker".format(
+                        self.outcomes.count(False), len(self.outcomes)))
+                self.open()
+
+    def over_threshold(self):
+        if len(self.outcomes) < self.min_calls:
+            return False
+
+        errors = self.outcomes.count(False)
+        return errors / len(self.outcomes) >= self.error_ratio
+
+    def open(self):
+        self.opened_at = time.monotonic()
+        self.set_state(STATE_OPEN)
+        metrics.BREAKER_OPENED.inc()
+
+    def set_state(self, state):
+        self.state = state
+        for s in (STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN):
+            metrics.BREAKER_STATE.labels(s).set(1 if s == state else 0)
+
+
+class NoopBreaker:
+    def allow(self):
+        return True
+
+    def record_success(self):
+        pass
+
+    def record_error(self, e):
+        pass
+
+
+api_server = NoopBreaker()
+if settings.BREAKER_ENABLED:
+    api_server = CircuitBreaker(settings.BREAKER_WINDOW,
+                                settings.BREAKER_MIN_CALLS,
+                                settings.BREAKER_ERROR_RATIO,
+                                settings.BREAKER_COOLDOWN_SECS)
+
+# The latest results of the reads, served as stale data while open
+stale_results = TTLCache(MAX_STALE_RESULTS, settings.BREAKER_STALE_TTL_SECS)
+
+
+def is_read(fn):
+    return fn.__name__.startswith(("list_", "read_", "get_"))
+
+
+def call_key(fn, args, kwargs):
+    return (fn.__qualname__, repr(args), repr(sorted(kwargs.items())))
+
+
+def remember(fn, args, kwargs, result):
+    if settings.BREAKER_ENABLED and is_read(fn):
+        stale_results.set(call_key(fn, args, kwargs), result)
+
+
+def fallback(rsrc, fn, args, kwargs):
+    '''
+    The response to use instead of calling the API Server while the breaker
+    is open: the last result of the same read, marked as stale, if any.
+    '''
+    metrics.BREAKER_REJECTED.inc()
+    result, age = None, None
+    if is_read(fn):
+        result, age = stale_results.get_with_age(call_key(fn, args, kwargs))
+
+    if result is None:
+        raise CircuitOpen("The API Server is unavailable. Try again later",
+                          api_server.retry_after())
+
+    logger.info("Serving stale '{}', {:.0f}s old".format(rsrc, age))
+    return {
+        "success": True,
+        "log": "",
+        "stale": True,
+        "staleSeconds": int(age),
+        rsrc: result,
+    }
@@ -0,0 +1,122 @@
+import threading
+
+import pytest
+from kubernetes.client.rest import ApiException
+
+from kubeflow_jupyter.common import breaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(breaker.time, "monotonic", c)
+    return c
+
+
+def new_breaker():
+    return breaker.CircuitBreaker(window=10, min_calls=4, error_ratio=0.5,
+                                  cooldown=10)
+
+
+def in_thread(fn):
+    '''Call fn in another thread, as another request would'''
+    result = []
+    t = threading.Thread(target=lambda: result.append(fn()))
+    t.start()
+    t.join()
+    return result[0] if result else None
+
+
+def opened(clock):
+    b = new_breaker()
+    for _ in range(4):
+        b.record_error(ApiException(status=503))
+    assert b.state == breaker.STATE_OPEN
+    return b
+
+
+def test_is_overload_error():
+    assert breaker.is_overload_error(ApiException(status=500))
+    assert breaker.is_overload_error(ApiException(status=429))
+    assert breaker.is_overload_error(TimeoutError())
+    assert not breaker.is_overload_error(ApiException(status=404))
+    assert not breaker.is_overload_error(ApiException(status=409))
+
+
+def test_opens_over_the_error_ratio(clock):
+    b = new_breaker()
+    for _ in range(3):
+        b.record_error(ApiException(status=500))
+    # Not enough calls yet
+    assert b.state == breaker.STATE_CLOSED
+
+    b.record_success()
+    assert b.state == breaker.STATE_CLOSED
+    b.record_error(ApiException(status=500))
+    assert b.state == breaker.STATE_OPEN
+    assert not b.allow()
+    assert b.retry_after() == 10
+
+
+def test_client_errors_dont_open(clock):
+    b = new_breaker()
+    for _ in range(10):
+        b.record_error(ApiException(status=404))
+    assert b.state == breaker.STATE_CLOSED
+
+
+def test_probe_success_closes(clock):
+    b = opened(clock)
+    clock.now += 10
+
+    assert b.allow()
+    assert b.state == breaker.STATE_HALF_OPEN
+    # A single probe at a time
+    assert not in_thread(b.allow)
+
+    b.record_success()
+    assert b.state == breaker.STATE_CLOSED
+    assert b.allow()
+
+
+def test_probe_failure_reopens(clock):
+    b = opened(clock)
+    clock.now += 10
+
+    assert b.allow()
+    b.record_error(ApiException(status=500))
+    assert b.state == breaker.STATE_OPEN
+    assert not b.allow()
+
+    clock.now += 10
+    assert b.allow()
+
+
+def test_only_the_probe_closes(clock):
+    b = opened(clock)
+    clock.now += 10
+    assert b.allow()
+
+    # Calls sent before the breaker opened complete in other threads
+    in_thread(b.record_success)
+    assert b.state == breaker.STATE_HALF_OPEN
+    in_thread(lambda: b.record_error(ApiException(status=500)))
+    assert b.state == breaker.STATE_HALF_OPEN
+
+    b.record_success()
+    assert b.state == breaker.STATE_CLOSED
+
+
+def test_outcomes_while_open_are_ignored(clock):
+    b = opened(clock)
+    b.record_success()
+    assert b.state == breaker.STATE_OPEN
+    assert not b.allow()
@@ -0,0 +1,366 @@
+import json
+import os
+import threading
+import time
+import zlib
+
+from kubernetes import client, watch
+from kubernetes.client.rest import ApiException
+from . import settings
+from . import sharding
+from . import utils
+
+logger = utils.create_logger(__name__)
+
+# Bump when the layout of the snapshot file changes
+SNAPSHOT_VERSION = 2
+RETRY_BACKOFF_SECS = 5
+# The client gives up on a watch this long after the API Server should have
+# ended it, i.e. if the connection died without being closed
+WATCH_READ_GRACE_SECS = 30
+
+# name -> ResourceCache
+CACHES = {}
+api_client = client.ApiClient()
+
+
+class ResourceGone(Exception):
+    '''The resourceVersion we tried to resume from is too old (410 Gone)'''
+
+
+class _Response:
+    '''Mimics a urllib3 response so that the ApiClient can deserialize it'''
+
+    def __init__(self, data):
+        self.data = json.dumps(data)
+
+
+def object_meta(obj):
+    '''
+    Return the (namespace, name, resourceVersion) of either a raw dict, as
+    returned for Custom Resources, or a kubernetes client model.
+    '''
+    if isinstance(obj, dict):
+        meta = obj["metadata"]
+        return (meta.get("namespace"), meta["name"],
+                meta.get("resourceVersion"))
+
+    meta = obj.metadata
+    return meta.namespace, meta.name, meta.resource_version
+
+
+def list_resource_version(lst):
+    if isinstance(lst, dict):
+        return lst["metadata"]["resourceVersion"]
+
+    return lst.metadata.resource_version
+
+
+def list_items(lst):
+    if isinstance(lst, dict):
+        return lst["items"]
+
+    return lst.items
+
+
+class ResourceCache:
+    '''
+    Keeps an in-memory copy of a resource across all namespaces. Sharded
+    caches, i.e. of the resources that the namespaced routes read, only keep
+    the namespaces this shard owns if the backend is sharded. The copy is
+    filled with a LIST and then kept up to date with a WATCH, which resumes
+    from the last resourceVersion seen. If that resourceVersion has expired
+    the API Server answers with 410 Gone and the cache is relisted.
+
+    If a record class is given, i.e. from the records module, the objects are
+    stored as compact records and are expanded back when read. If on_update
+    is given, it's called with each object that the watch sees added or
+    modified.
+    '''
+
+    def __init__(self, name, list_fn, *args, record=None, on_update=None,
+                 sharded=False, **kwargs):
+        self.name = name
+        self.list_fn = list_fn
+        self.args = args
+        self.kwargs = kwargs
+        self.record = record
+        self.on_update = on_update
+        self.sharded = sharded
+
+        # The model the list function returns items of, i.e.
+        # "V1PersistentVolumeClaim", or "object" for raw dicts
+        self.kind = watch.Watch().get_return_type(list_fn)
+
+        self.objects = {}
+        self.resource_version = None
+        self.lock = threading.Lock()
+        self.synced = threading.Event()
+
+    def owns(self, namespace):
+        return not self.sharded or sharding.owns(namespace)
+
+    # Reading from the cache
+    def compact(self, obj):
+        return obj if self.record is None else self.record.from_object(obj)
+
+    def expand(self, obj):
+        return obj if self.record is None else obj.expand()
+
+    def list(self, namespace, predicate=None):
+        with self.lock:
+            objs = [obj for (ns, _), obj in self.objects.items()
+                    if ns == namespace]
+
+        objs = [self.expand(obj) for obj in objs]
+
+        if predicate is not None:
+            objs = [obj for obj in objs if predicate(obj)]
+
+        return objs
+
+    def list_all(self, predicate=None):
+        with self.lock:
+            objs = list(self.objects.values())
+
+        objs = [self.expand(obj) for obj in objs]
+
+        if predicate is not None:
+            objs = [obj for obj in objs if predicate(obj)]
+
+        return objs
+
+    def as_list(self, items):
+        '''
+        Wrap the items in the same type that the list function would have
+        returned, so callers can't tell the difference.
+        '''
+        if self.kind == "object":
+            return {"items": items}
+
+        return getattr(client, self.kind + "List")(items=items)
+
+    # Keeping the cache in sync
+    def start(self):
+        t = threading.Thread(target=self.run, name="cache-" + self.name,
+                             daemon=True)
+        t.start()
+
+    def run(self):
+        while True:
+            try:
+                if self.resource_version is None:
+                    self.relist()
+                self.watch()
+            except ResourceGone:
+                logger.info("Watch for '{}' expired at resourceVersion {}."
+                            " Relisting".format(self.name,
+                                                self.resource_version))
+                self.resource_version = None
+            except ApiException as e:
+                if e.status == 410:
+                    logger.info("Watch for '{}' expired. Relisting".format(
+                        self.name))
+                    self.resource_version = None
+                    continue
+
+                logger.error("Error syncing the '{}' cache: {}".format(
+                    self.name, e.reason))
+                time.sleep(RETRY_BACKOFF_SECS)
+            except Exception as e:
+                logger.error("Error syncing the '{}' cache: {}".format(
+                    self.name, e))
+                time.sleep(RETRY_BACKOFF_SECS)
+
+    def relist(self):
+        lst = self.list_fn(*self.args, **self.kwargs)
+        objects = {}
+        for obj in list_items(lst):
+            ns, name, _ = object_meta(obj)
+            if self.owns(ns):
+                objects[(ns, name)] = self.compact(obj)
+
+        with self.lock:
+            self.objects = objects
+            self.resource_version = list_resource_version(lst)
+
+        self.synced.set()
+        logger.info("Listed {} objects for the '{}' cache".format(
+            len(objects), self.name))
+
+    def watch(self):
+        # The stream ends after the timeout, and run() watches again from
+        # the last resourceVersion
+        w = watch.Watch()
+        timeout = settings.CACHE_WATCH_TIMEOUT_SECS
+        stream = w.stream(self.list_fn, *self.args,
+                          resource_version=self.resource_version,
+                          timeout_seconds=timeout,
+                          _request_timeout=timeout + WATCH_READ_GRACE_SECS,
+                          **self.kwargs)
+
+        for event in stream:
+            if event["type"] == "ERROR":
+                if event["raw_object"].get("code") == 410:
+                    raise ResourceGone()
+
+                logger.warning("Watch error for '{}': {}".format(
+                    self.name, event["raw_object"].get("message")))
+                continue
+
+            obj = event["object"]
+            ns, name, rv = object_meta(obj)
+            updated = event["type"] != "DELETED" and self.owns(ns)
+            with self.lock:
+                if event["type"] == "DELETED":
+                    self.objects.pop((ns, name), None)
+                elif updated:
+                    self.objects[(ns, name)] = self.compact(obj)
+                self.resource_version = rv
+
+            if updated and self.on_update is not None:
+                self.notify(obj)
+
+    def notify(self, obj):
+        try:
+            self.on_update(obj)
+        except Exception as e:
+            logger.error("Error handling an update of the '{}' cache: {}"
+                         .format(self.name, e))
+
+    # Warm-start snapshots
+    def snapshot(self):
+        with self.lock:
+            objs = list(self.objects.values())
+            rv = self.resource_version
+
+        objs = [self.expand(o) for o in objs]
+        if self.kind != "object":
+            objs = [api_client.sanitize_for_serialization(o) for o in objs]
+
+        return {"resourceVersion": rv, "items": objs}
+
+    def restore(self, snap):
+        objs = snap["items"]
+        if self.kind != "object":
+            objs = [api_client.deserialize(_Response(o), self.kind)
+                    for o in objs]
+
+        objects = {}
+        for obj in objs:
+            ns, name, _ = object_meta(obj)
+            # The shards may have changed since the snapshot was taken
+            if self.owns(ns):
+                objects[(ns, name)] = self.compact(obj)
+
+        with self.lock:
+            self.objects = objects
+            self.resource_version = snap["resourceVersion"]
+
+        self.synced.set()
+        logger.info("Restored {} objects for the '{}' cache at"
+                    " resourceVersion {}".format(len(objects), self.name,
+                                                 self.resource_version))
+
+
+def register(name, list_fn, *args, record=None, on_update=None,
+             sharded=False, **kwargs):
+    CACHES[name] = ResourceCache(name, list_fn, *args, record=record,
+                                 on_update=on_update, sharded=sharded,
+                                 **kwargs)
+    return CACHES[name]
+
+
+def get(name):
+    '''
+    Return the cache with the given name, or None if caching is disabled or
+    the cache hasn't been filled yet. Callers should then hit the API Server.
+    '''
+    if not settings.CACHE_ENABLED:
+        return None
+
+    c = CACHES.get(name)
+    if c is None or not c.synced.is_set():
+        return None
+
+    return c
+
+
+# Snapshot file handling
+def save_snapshot(path):
+    # The snapshot is plain JSON, which can't run code when loaded like a
+    # pickle would
+    data = {
+        "version": SNAPSHOT_VERSION,
+        "savedAt": time.time(),
+        "caches": {name: c.snapshot() for name, c in CACHES.items()
+                   if c.synced.is_set()},
+    }
+    blob = zlib.compress(json.dumps(data).encode("utf-8"))
+
+    # Write to a temp file first, to never leave a half-written snapshot
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(blob)
+    os.replace(tmp, path)
+
+
+def load_snapshot(path):
+    try:
+        with open(path, "rb") as f:
+            data = json.loads(zlib.decompress(f.read()).decode("utf-8"))
+    except FileNotFoundError:
+        logger.info("No cache snapshot found at '{}'".format(path))
+        return
+    except Exception as e:
+        logger.warning("Couldn't load cache snapshot '{}': {}".format(path, e))
+        return
+
+    if data.get("version") != SNAPSHOT_VERSION:
+        logger.warning("Ignoring cache snapshot with version {}".format(
+            data.get("version")))
+        return
+
+    # The watches couldn't resume from an old snapshot anyway, and until they
+    # relist its objects would be served as if they were current
+    age = time.time() - data["savedAt"]
+    if age > settings.CACHE_SNAPSHOT_MAX_AGE_SECS:
+        logger.info("Ignoring cache snapshot saved {:.0f}s ago".format(age))
+        return
+
+    for name, snap in data["caches"].items():
+        if name in CACHES:
+            CACHES[name].restore(snap)
+
+
+def snapshot_loop(path, period):
+    while True:
+        time.sleep(period)
+        try:
+            save_snapshot(path)
+        except Exception as e:
+            logger.error("Couldn't save cache snapshot '{}': {}".format(path,
+                                                                        e))
+
+
+def start():
+    '''
+    Start syncing the registered caches. If a snapshot file is configured the
+    caches are first restored from it and the watches resume from the saved
+    resourceVersions, instead of doing a full LIST.
+    '''
+    if not settings.CACHE_ENABLED:
+        return
+
+    path = settings.CACHE_SNAPSHOT_FILE
+    if path:
+        load_snapshot(path)
+
+    for c in CACHES.values():
+        c.start()
+
+    if path:
+        t = threading.Thread(target=snapshot_loop, name="cache-snapshot",
+                             args=(path, settings.CACHE_SNAPSHOT_PERIOD),
+                             daemon=True)
+        t.start()
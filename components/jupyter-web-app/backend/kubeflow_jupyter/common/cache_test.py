@@ -0,0 +1,141 @@
+import json
+import time
+import zlib
+
+import pytest
+from kubernetes import client
+
+from kubeflow_jupyter.common import api, cache, records, settings
+
+
+def pvc(namespace, name):
+    return client.V1PersistentVolumeClaim(
+        metadata=client.V1ObjectMeta(namespace=namespace, name=name,
+                                     resource_version="1"),
+        spec=client.V1PersistentVolumeClaimSpec(
+            access_modes=["ReadWriteOnce"], storage_class_name="standard",
+            resources=client.V1ResourceRequirements(
+                requests={"storage": "10Gi"})))
+
+
+def notebook(namespace, name):
+    return {
+        "metadata": {"namespace": namespace, "name": name,
+                     "creationTimestamp": "2019-08-05T12:34:56Z"},
+        "spec": {"template": {"spec": {"containers": [{"image": "jupyter"}]}}},
+        "status": {"containerState": {"running": {
+            "startedAt": "2019-08-05T12:35:56Z"}}},
+    }
+
+
+def filled(name, list_fn, kind_list, items, record):
+    '''A cache filled from a LIST of the items, at resourceVersion 10'''
+    c = cache.ResourceCache(name, list_fn, record=record)
+    c.list_fn = lambda: kind_list(items)
+    c.relist()
+    return c
+
+
+@pytest.fixture
+def caches(monkeypatch):
+    monkeypatch.setattr(cache, "CACHES", {})
+    cache.CACHES["pvcs"] = filled(
+        "pvcs", api.v1_core.list_persistent_volume_claim_for_all_namespaces,
+        lambda items: client.V1PersistentVolumeClaimList(
+            items=items, metadata=client.V1ListMeta(resource_version="10")),
+        [pvc("user", "a"), pvc("user", "b")], records.PVCRecord)
+    cache.CACHES["notebooks"] = filled(
+        "notebooks", api.custom_api.list_cluster_custom_object,
+        lambda items: {"items": items, "metadata": {"resourceVersion": "10"}},
+        [notebook("user", "nb")], records.NotebookRecord)
+    return cache.CACHES
+
+
+def empty(caches):
+    '''New caches with the same list functions, as after a restart'''
+    for name, c in list(caches.items()):
+        caches[name] = cache.ResourceCache(name, c.list_fn, record=c.record)
+        caches[name].kind = c.kind
+
+
+def test_snapshot_round_trip(caches, tmp_path):
+    path = str(tmp_path / "snapshot")
+    cache.save_snapshot(path)
+    before = {name: c.snapshot() for name, c in caches.items()}
+
+    empty(caches)
+    cache.load_snapshot(path)
+
+    for name, c in caches.items():
+        assert c.synced.is_set()
+        assert c.resource_version == "10"
+        assert c.snapshot() == before[name]
+    pvcs = caches["pvcs"].list("user")
+    assert sorted(p.metadata.name for p in pvcs) == ["a", "b"]
+    assert pvcs[0].spec.resources.requests == {"storage": "10Gi"}
+
+
+def test_snapshot_is_json(caches, tmp_path):
+    path = str(tmp_path / "snapshot")
+    cache.save_snapshot(path)
+
+    with open(path, "rb") as f:
+        data = json.loads(zlib.decompress(f.read()).decode("utf-8"))
+    assert data["version"] == cache.SNAPSHOT_VERSION
+    assert set(data["caches"]) == {"pvcs", "notebooks"}
+
+
+def test_old_snapshot_is_ignored(caches, tmp_path, monkeypatch):
+    path = str(tmp_path / "snapshot")
+    cache.save_snapshot(path)
+
+    empty(caches)
+    now = time.time() + settings.CACHE_SNAPSHOT_MAX_AGE_SECS + 1
+    monkeypatch.setattr(cache.time, "time", lambda: now)
+    cache.load_snapshot(path)
+
+    assert not any(c.synced.is_set() for c in caches.values())
+
+
+def test_corrupt_snapshot_is_ignored(caches, tmp_path):
+    path = tmp_path / "snapshot"
+    path.write_bytes(b"not a snapshot")
+
+    empty(caches)
+    cache.load_snapshot(str(path))
+
+    assert not any(c.synced.is_set() for c in caches.values())
+
+
+def test_watch_notifies_updates(monkeypatch):
+    class Watch:
+        def stream(self, *args, **kwargs):
+            for typ in ("ADDED", "MODIFIED", "DELETED"):
+                yield {"type": typ, "object": notebook("user", "nb")}
+
+    updated = []
+    c = cache.ResourceCache("notebooks",
+                            api.custom_api.list_cluster_custom_object,
+                            record=records.NotebookRecord,
+                            on_update=updated.append)
+    monkeypatch.setattr(cache.watch, "Watch", Watch)
+    c.watch()
+
+    assert len(updated) == 2
+    assert c.list("user") == []
+
+
+def test_only_sharded_caches_are_filtered(monkeypatch):
+    monkeypatch.setattr(cache.sharding, "owns", lambda ns: ns == "mine")
+    items = [pvc("mine", "a"), pvc("theirs", "b")]
+
+    def pvcs(sharded):
+        list_fn = api.v1_core.list_persistent_volume_claim_for_all_namespaces
+        c = cache.ResourceCache("pvcs", list_fn, sharded=sharded)
+        c.list_fn = lambda: client.V1PersistentVolumeClaimList(
+            items=items, metadata=client.V1ListMeta(resource_version="10"))
+        c.relist()
+        return c
+
+    assert len(pvcs(sharded=True).list_all()) == 1
+    assert len(pvcs(sharded=False).list_all()) == 2
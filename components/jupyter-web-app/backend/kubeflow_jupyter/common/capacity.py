@@ -0,0 +1,215 @@
+import re
+from decimal import Decimal
+
+from . import api
+from . import auth
+from . import cache
+from . import settings
+from . import utils
+from .ttlcache import TTLCache
+
+logger = utils.create_logger(__name__)
+
+# Only the Pods that hold on to their requests count against the nodes
+ACTIVE_PODS_SELECTOR = "status.phase!=Succeeded,status.phase!=Failed"
+
+SUFFIXES = {
+    "n": Decimal("1e-9"), "u": Decimal("1e-6"), "m": Decimal("1e-3"),
+    "": Decimal(1), "k": Decimal(10**3), "M": Decimal(10**6),
+    "G": Decimal(10**9), "T": Decimal(10**12), "P": Decimal(10**15),
+    "E": Decimal(10**18), "Ki": Decimal(2**10), "Mi": Decimal(2**20),
+    "Gi": Decimal(2**30), "Ti": Decimal(2**40), "Pi": Decimal(2**50),
+    "Ei": Decimal(2**60),
+}
+QUANTITY = re.compile(r"^([+-]?[0-9.]+(?:[eE][+-]?[0-9]+)?)([a-zA-Z]*)$")
+
+# The aggregate is recomputed at most every CAPACITY_TTL_SECS
+snapshots = TTLCache(1, settings.CAPACITY_TTL_SECS)
+
+
+class CapacityUnknown(Exception):
+    '''The nodes or the Pods couldn't be listed'''
+
+
+def parse_quantity(q):
+    '''Parse a Kubernetes quantity, i.e. "500m" or "4Gi", to a Decimal'''
+    if isinstance(q, (int, float)):
+        return Decimal(q)
+
+    match = QUANTITY.match(str(q).strip())
+    if match is None or match.group(2) not in SUFFIXES:
+        raise ValueError("Invalid quantity: {}".format(q))
+
+    return Decimal(match.group(1)) * SUFFIXES[match.group(2)]
+
+
+def is_schedulable(node):
+    if node.spec.unschedulable:
+        return False
+
+    conditions = node.status.conditions or []
+    return any(c.type == "Ready" and c.status == "True" for c in conditions)
+
+
+def container_requests(cntr):
+    '''Requests default to the limits, as is the case for extended resources'''
+    resources = cntr.resources
+    if resources is None:
+        return {}
+
+    reqs = dict(resources.limits or {})
+    reqs.update(resources.requests or {})
+    return reqs
+
+
+def add_requests(total, reqs):
+    for rsrc, q in reqs.items():
+        total[rsrc] = total.get(rsrc, 0) + parse_quantity(q)
+
+
+def pod_requests(pod):
+    '''
+    The effective requests of the Pod, as the scheduler counts them: the
+    init containers run one at a time before the app containers, so each
+    resource is the larger of the biggest init container's request and the
+    sum of the app containers. The Pod's overhead comes on top.
+    '''
+    total = {}
+    for cntr in pod.spec.containers:
+        add_requests(total, container_requests(cntr))
+
+    for cntr in pod.spec.init_containers or []:
+        for rsrc, q in container_requests(cntr).items():
+            total[rsrc] = max(total.get(rsrc, 0), parse_quantity(q))
+
+    # Only clients from v11 on have the overhead in their models
+    add_requests(total, getattr(pod.spec, "overhead", None) or {})
+    return total
+
+
+def list_nodes_and_pods():
+    '''
+    The nodes and the active Pods, from the watch-maintained caches if they
+    are enabled, otherwise straight from the API Server
+    '''
+    nodes, pods = cache.get("nodes"), cache.get("pods")
+    if nodes is not None and pods is not None:
+        return nodes.list_all(), pods.list_all()
+
+    nodes = api.wrap_resp("nodes", api.v1_core.list_node)
+    if not nodes["success"]:
+        raise CapacityUnknown(nodes["log"])
+
+    pods = api.wrap_resp("pods", api.v1_core.list_pod_for_all_namespaces,
+                         field_selector=ACTIVE_PODS_SELECTOR)
+    if not pods["success"]:
+        raise CapacityUnknown(pods["log"])
+
+    return nodes["nodes"].items, pods["pods"].items
+
+
+def free_per_node(nodes, pods):
+    '''Return {node: {resource: allocatable minus the Pods' requests}}'''
+    free = {}
+    for node in nodes:
+        if not is_schedulable(node):
+            continue
+
+        allocatable = node.status.allocatable or {}
+        free[node.metadata.name] = {r: parse_quantity(q)
+                                    for r, q in allocatable.items()}
+
+    for pod in pods:
+        node_free = free.get(pod.spec.node_name)
+        if node_free is None:
+            continue
+
+        reqs = pod_requests(pod)
+        reqs["pods"] = 1
+        for rsrc, q in reqs.items():
+            if rsrc in node_free:
+                node_free[rsrc] -= q
+
+    return free
+
+
+def aggregate(free, nodes):
+    '''
+    Sum the allocatable and free amounts of each resource, i.e. cpu, memory
+    or a GPU vendor's key like nvidia.com/gpu, across the schedulable nodes
+    '''
+    allocatable = {n.metadata.name: n.status.allocatable or {} for n in nodes}
+
+    totals = {}
+    for node, resources in free.items():
+        for rsrc, q in resources.items():
+            t = totals.setdefault(rsrc, {"allocatable": 0, "free": 0,
+                                         "maxFreePerNode": 0})
+            q = max(q, 0)
+            t["allocatable"] += parse_quantity(allocatable[node][rsrc])
+            t["free"] += q
+            t["maxFreePerNode"] = max(t["maxFreePerNode"], q)
+
+    return {rsrc: {k: float(v) for k, v in t.items()}
+            for rsrc, t in totals.items()}
+
+
+def snapshot():
+    '''Return (free per node, aggregate), at most CAPACITY_TTL_SECS old'''
+    snap = snapshots.get("capacity")
+    if snap is None:
+        nodes, pods = list_nodes_and_pods()
+        free = free_per_node(nodes, pods)
+        snap = (free, aggregate(free, nodes))
+        snapshots.set("capacity", snap)
+
+    return snap
+
+
+@auth.needs_authorization("create", "kubeflow.org", "v1beta1", "notebooks")
+def get_capacity(namespace):
+    '''
+    The capacity of the cluster, for users that can create Notebooks in the
+    namespace
+    '''
+    try:
+        _, totals = snapshot()
+    except Exception as e:
+        return {"success": False, "log": api.parse_error(e)}
+
+    return {"success": True, "log": "", "capacity": totals}
+
+
+def notebook_requests(notebook):
+    cntr = notebook["spec"]["template"]["spec"]["containers"][0]
+    reqs = dict(cntr["resources"].get("limits", {}))
+    reqs.update(cntr["resources"].get("requests", {}))
+    return {rsrc: parse_quantity(q) for rsrc, q in reqs.items()}
+
+
+def check_fit(notebook):
+    '''
+    Return None if there is a node where the Notebook's requests fit right
+    now, otherwise a message explaining why it wouldn't be scheduled
+    '''
+    try:
+        free, _ = snapshot()
+        reqs = notebook_requests(notebook)
+    except Exception as e:
+        # Don't block the spawn if the capacity is unknown
+        logger.warning("Can't check the capacity for the Notebook: {}"
+                       .format(e))
+        return None
+
+    for resources in free.values():
+        if all(resources.get(r, 0) >= q for r, q in reqs.items()):
+            return None
+
+    # Point out the resources that no node has enough of
+    short = [r for r, q in reqs.items()
+             if all(res.get(r, 0) < q for res in free.values())]
+    if not short:
+        short = list(reqs)
+
+    return ("No node has enough free {} for the Notebook right now".format(
+        ", ".join(sorted(short))))
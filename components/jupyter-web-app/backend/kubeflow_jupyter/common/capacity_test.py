@@ -0,0 +1,98 @@
+from decimal import Decimal
+
+import pytest
+from kubernetes import client
+
+from kubeflow_jupyter.common import api, auth, capacity
+
+
+def container(limits=None, **requests):
+    resources = client.V1ResourceRequirements(requests=requests,
+                                              limits=limits)
+    return client.V1Container(name="c", resources=resources)
+
+
+def pod(node, containers, init_containers=None):
+    return client.V1Pod(spec=client.V1PodSpec(
+        node_name=node, containers=containers,
+        init_containers=init_containers))
+
+
+def node(name, ready="True", unschedulable=None, **allocatable):
+    return client.V1Node(
+        metadata=client.V1ObjectMeta(name=name),
+        spec=client.V1NodeSpec(unschedulable=unschedulable),
+        status=client.V1NodeStatus(
+            allocatable=allocatable,
+            conditions=[client.V1NodeCondition(type="Ready", status=ready)]))
+
+
+def test_parse_quantity():
+    assert capacity.parse_quantity("500m") == Decimal("0.5")
+    assert capacity.parse_quantity("4Gi") == 4 * 2**30
+    assert capacity.parse_quantity("1e3") == 1000
+    assert capacity.parse_quantity(2) == 2
+    with pytest.raises(ValueError):
+        capacity.parse_quantity("1Qi")
+
+
+def test_pod_requests_sums_the_containers():
+    p = pod("n", [container(cpu="500m", memory="1Gi"),
+                  container(limits={"nvidia.com/gpu": "1"}, cpu="1")])
+    assert capacity.pod_requests(p) == {
+        "cpu": Decimal("1.5"), "memory": 2**30, "nvidia.com/gpu": 1}
+
+
+def test_pod_requests_counts_the_biggest_init_container():
+    p = pod("n", [container(cpu="500m", memory="1Gi"), container(cpu="1")],
+            init_containers=[container(cpu="2", memory="512Mi"),
+                             container(cpu="1")])
+    assert capacity.pod_requests(p) == {"cpu": 2, "memory": 2**30}
+
+
+def test_pod_requests_adds_the_overhead():
+    p = pod("n", [container(cpu="1")])
+    p.spec.overhead = {"cpu": "250m", "memory": "120Mi"}
+    assert capacity.pod_requests(p) == {"cpu": Decimal("1.25"),
+                                        "memory": 120 * 2**20}
+
+
+def test_free_per_node():
+    nodes = [node("a", cpu="4", pods="10"),
+             node("b", cpu="4", pods="10", unschedulable=True),
+             node("c", ready="False", cpu="4", pods="10")]
+    pods = [pod("a", [container(cpu="1")]),
+            pod("a", [container(cpu="500m")],
+                init_containers=[container(cpu="2")]),
+            pod("b", [container(cpu="1")]),
+            pod(None, [container(cpu="1")])]
+
+    assert capacity.free_per_node(nodes, pods) == {"a": {"cpu": 1,
+                                                         "pods": 8}}
+
+
+def test_aggregate():
+    nodes = [node("a", cpu="4"), node("b", cpu="2")]
+    free = {"a": {"cpu": Decimal(1)}, "b": {"cpu": Decimal(-1)}}
+    assert capacity.aggregate(free, nodes) == {
+        "cpu": {"allocatable": 6.0, "free": 1.0, "maxFreePerNode": 1.0}}
+
+
+def test_list_nodes_and_pods_errors(monkeypatch):
+    monkeypatch.setattr(api, "wrap_resp", lambda rsrc, fn, **kwargs: {
+        "success": False, "log": "forbidden", rsrc: {}})
+    with pytest.raises(capacity.CapacityUnknown):
+        capacity.list_nodes_and_pods()
+
+
+def test_get_capacity_needs_authorization(monkeypatch):
+    monkeypatch.setattr(capacity.utils, "get_username_from_request",
+                        lambda: "alice")
+    monkeypatch.setattr(auth, "is_authorized", lambda *args: False)
+    monkeypatch.setattr(capacity, "snapshot", lambda: ({}, {"cpu": {}}))
+
+    assert not capacity.get_capacity(namespace="user")["success"]
+
+    monkeypatch.setattr(auth, "is_authorized", lambda *args: True)
+    assert capacity.get_capacity(namespace="user")["capacity"] == {
+        "cpu": {}}
@@ -0,0 +1,67 @@
+import gzip
+
+from flask import request
+from . import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# The levels are tuned for speed, since each response is compressed once
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE = ["application/json"]
+
+
+def best_encoding():
+    '''The encoding the client prefers, of the ones available'''
+    encodings = ["gzip"]
+    if brotli is not None:
+        encodings.insert(0, "br")
+
+    accepted = [e for e in encodings if request.accept_encodings[e] > 0]
+    if not accepted:
+        return None
+
+    return max(accepted, key=lambda e: request.accept_encodings[e])
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+
+    return gzip.compress(data, GZIP_LEVEL)
+
+
+def should_compress(resp):
+    if settings.COMPRESSION_MIN_BYTES <= 0:
+        return False
+
+    # Streamed responses, i.e. the logs, are sent as they come
+    if resp.is_streamed or resp.direct_passthrough:
+        return False
+
+    if resp.mimetype not in COMPRESSIBLE or resp.status_code < 200:
+        return False
+
+    if "Content-Encoding" in resp.headers:
+        return False
+
+    return resp.content_length >= settings.COMPRESSION_MIN_BYTES
+
+
+def compress_response(resp):
+    '''Compress the JSON response, if it's large enough'''
+    if not should_compress(resp):
+        return resp
+
+    encoding = best_encoding()
+    if encoding is None:
+        return resp
+
+    resp.set_data(compress(resp.get_data(), encoding))
+    resp.headers["Content-Encoding"] = encoding
+    resp.vary.add("Accept-Encoding")
+    return resp
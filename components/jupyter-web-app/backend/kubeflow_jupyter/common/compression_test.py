@@ -0,0 +1,89 @@
+import gzip
+import json
+import types
+import zlib
+
+import flask
+import pytest
+
+from kubeflow_jupyter.common import compression, settings
+
+BODY = json.dumps({"notebooks": [{"name": "nb-%d" % i} for i in range(100)]})
+
+
+def fake_brotli_compress(data, quality):
+    return b"br:" + zlib.compress(data, 9)
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(settings, "COMPRESSION_MIN_BYTES", 1024)
+    monkeypatch.setattr(compression, "brotli",
+                        types.SimpleNamespace(compress=fake_brotli_compress))
+    return flask.Flask(__name__)
+
+
+def compress(app, resp, accept="gzip, br"):
+    with app.test_request_context("/", headers={"Accept-Encoding": accept}):
+        return compression.compress_response(resp)
+
+
+def json_response(body=BODY):
+    return flask.Response(body, mimetype="application/json")
+
+
+def test_best_encoding(app, monkeypatch):
+    for accept, encoding in (("gzip, br", "br"),
+                             ("gzip;q=1, br;q=0.5", "gzip"),
+                             ("br;q=0, gzip", "gzip"),
+                             ("deflate", None),
+                             ("", None)):
+        with app.test_request_context(
+                "/", headers={"Accept-Encoding": accept}):
+            assert compression.best_encoding() == encoding
+
+    # Without brotli installed only gzip is offered
+    monkeypatch.setattr(compression, "brotli", None)
+    with app.test_request_context("/", headers={"Accept-Encoding": "br"}):
+        assert compression.best_encoding() is None
+
+
+def test_large_responses_are_compressed(app):
+    resp = compress(app, json_response(), accept="gzip")
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in resp.vary
+    assert gzip.decompress(resp.get_data()).decode() == BODY
+    assert resp.content_length == len(resp.get_data())
+
+    resp = compress(app, json_response())
+    assert resp.headers["Content-Encoding"] == "br"
+    assert resp.get_data() == fake_brotli_compress(BODY.encode(), 5)
+
+
+def test_responses_that_are_sent_as_they_are(app):
+    streamed = flask.Response(iter([BODY]), mimetype="application/json")
+    passthrough = json_response()
+    passthrough.direct_passthrough = True
+    encoded = json_response()
+    encoded.headers["Content-Encoding"] = "gzip"
+
+    for resp in (json_response("{}"), streamed, passthrough, encoded,
+                 flask.Response(BODY, mimetype="text/plain")):
+        encoding = resp.headers.get("Content-Encoding")
+        assert compress(app, resp) is resp
+        assert resp.headers.get("Content-Encoding") == encoding
+        assert "Accept-Encoding" not in resp.vary
+
+    assert encoded.get_data().decode() == BODY
+
+
+def test_no_accepted_encoding(app):
+    resp = compress(app, json_response(), accept="identity")
+    assert "Content-Encoding" not in resp.headers
+    assert resp.get_data().decode() == BODY
+
+
+def test_compression_disabled(app, monkeypatch):
+    monkeypatch.setattr(settings, "COMPRESSION_MIN_BYTES", 0)
+    resp = compress(app, json_response())
+    assert "Content-Encoding" not in resp.headers
@@ -0,0 +1,196 @@
+import collections
+import concurrent.futures
+import functools
+import threading
+import time
+
+import urllib3
+from flask import g, has_request_context
+from . import settings
+from . import tracing
+from . import utils
+
+logger = utils.create_logger(__name__)
+
+# Number of recent latencies kept per API function, to compute the p95
+LATENCY_WINDOW = 200
+
+# Threads that run the hedged calls
+executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=settings.HEDGE_MAX_WORKERS, thread_name_prefix="hedge")
+
+
+class DeadlineExceeded(Exception):
+    '''
+    Raised when a request has used up its time budget before a call to the
+    API Server. The Flask apps turn it into a 504 response.
+    '''
+
+
+# Per request deadlines
+def start():
+    '''Start the time budget of the current request'''
+    if settings.REQUEST_DEADLINE_SECS > 0:
+        g.deadline = time.monotonic() + settings.REQUEST_DEADLINE_SECS
+
+
+def remaining():
+    '''
+    Seconds left in the current request's budget, or None if there is no
+    deadline, i.e. when called outside of a request.
+    '''
+    if not has_request_context() or g.get("deadline") is None:
+        return None
+
+    return g.deadline - time.monotonic()
+
+
+def call_timeout():
+    '''
+    The _request_timeout to use for a call to the API Server. Raises
+    DeadlineExceeded if the request has no time left.
+    '''
+    left = remaining()
+    if left is None:
+        return None
+
+    if left < settings.MIN_CALL_TIMEOUT_SECS:
+        raise exceeded()
+
+    # The client ignores float timeouts, but accepts a (connect, read) tuple
+    return (left, left)
+
+
+def exceeded():
+    return DeadlineExceeded("Request exceeded its deadline of {}s".format(
+        settings.REQUEST_DEADLINE_SECS))
+
+
+def disable_read_retries(api):
+    '''
+    By default urllib3 retries reads that timed out, each time with a fresh
+    timeout, which would overrun the request's deadline.
+    '''
+    pool_kw = api.api_client.rest_client.pool_manager.connection_pool_kw
+    pool_kw["retries"] = urllib3.Retry(3, read=0)
+
+
+# Hedged reads
+class LatencyTracker:
+    '''Keeps the latencies of the most recent calls of a function'''
+
+    def __init__(self):
+        self.samples = collections.deque(maxlen=LATENCY_WINDOW)
+        self.lock = threading.Lock()
+
+    def observe(self, secs):
+        with self.lock:
+            self.samples.append(secs)
+
+    def p95(self):
+        with self.lock:
+            if len(self.samples) < settings.HEDGE_MIN_SAMPLES:
+                return None
+            samples = sorted(self.samples)
+
+        return samples[int(len(samples) * 0.95) - 1]
+
+
+class HedgeBudget:
+    '''Allows hedging at most HEDGE_MAX_RATIO of the calls'''
+
+    def __init__(self):
+        self.calls = 0
+        self.hedges = 0
+        self.lock = threading.Lock()
+
+    def call(self):
+        with self.lock:
+            self.calls += 1
+
+    def allow(self):
+        with self.lock:
+            if self.hedges + 1 > self.calls * settings.HEDGE_MAX_RATIO:
+                return False
+            self.hedges += 1
+            return True
+
+
+budget = HedgeBudget()
+# fn.__qualname__ -> LatencyTracker
+trackers = collections.defaultdict(LatencyTracker)
+
+
+def first_result(first):
+    '''
+    The result of the first call of a hedged read, when there is no second
+    one. The call has a timeout of its own, but the request mustn't outlive
+    its deadline waiting for it either.
+    '''
+    try:
+        return first.result(timeout=remaining())
+    except concurrent.futures.TimeoutError:
+        raise exceeded()
+
+
+def hedge(name, delay, first, submit, kwargs):
+    '''
+    Send the second call of a hedged read with submit(**kwargs), with the time
+    left in the request's budget, and return the result of whichever call
+    completes first. The second call isn't sent if there is too little time
+    left, or no hedging budget.
+    '''
+    try:
+        timeout = call_timeout()
+    except DeadlineExceeded:
+        return first_result(first)
+    if not budget.allow():
+        return first_result(first)
+
+    logger.info("Hedging {} after {:.3f}s".format(name, delay))
+    if timeout is not None:
+        kwargs = dict(kwargs, _request_timeout=timeout)
+    pending = {first, submit(**kwargs)}
+    while pending:
+        done, pending = concurrent.futures.wait(
+            pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        # Prefer a successful call over a failed one
+        for f in sorted(done, key=lambda f: f.exception() is not None):
+            if f.exception() is None or not pending:
+                return f.result()
+
+
+def hedged(fn):
+    '''
+    Wrap an idempotent read of the API Server. If the call hasn't completed
+    after the p95 latency of the previous calls, a second identical call is
+    sent and the result of whichever completes first is used.
+    '''
+    tracker = trackers[fn.__qualname__]
+
+    def timed_call(parent, *args, **kwargs):
+        # The calls run in the executor's threads, under the caller's span
+        with tracing.use_span(parent):
+            start = time.monotonic()
+            res = fn(*args, **kwargs)
+            tracker.observe(time.monotonic() - start)
+            return res
+
+    @functools.wraps(fn)
+    def runner(*args, **kwargs):
+        delay = tracker.p95()
+        parent = tracing.current_span()
+        if not settings.HEDGE_ENABLED or delay is None:
+            return timed_call(parent, *args, **kwargs)
+
+        budget.call()
+        first = executor.submit(timed_call, parent, *args, **kwargs)
+        try:
+            return first.result(timeout=delay)
+        except concurrent.futures.TimeoutError:
+            pass
+
+        submit = functools.partial(executor.submit, timed_call, parent, *args)
+        return hedge(fn.__name__, delay, first, submit, kwargs)
+
+    return runner
@@ -0,0 +1,163 @@
+import threading
+import time
+
+import flask
+import pytest
+
+from kubeflow_jupyter.common import api, base_app, deadline, settings
+
+
+class SlowCall:
+    '''
+    A read whose first call blocks until released, and whose next ones
+    return right away. The kwargs of the calls are kept in 'calls'.
+    '''
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+
+    def __call__(self, **kwargs):
+        with self.lock:
+            self.calls.append(kwargs)
+            n = len(self.calls)
+        if n == 1:
+            self.release.wait(5)
+            return "first"
+        return "second"
+
+
+@pytest.fixture
+def app():
+    return flask.Flask(__name__)
+
+
+@pytest.fixture
+def hedging(monkeypatch):
+    monkeypatch.setattr(settings, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(settings, "HEDGE_MAX_RATIO", 1)
+    monkeypatch.setattr(deadline, "budget", deadline.HedgeBudget())
+    monkeypatch.setattr(deadline.LatencyTracker, "p95", lambda self: 0.05)
+
+
+@pytest.fixture
+def slow():
+    call = SlowCall()
+    yield call
+    call.release.set()
+
+
+def test_call_timeout(app, monkeypatch):
+    monkeypatch.setattr(settings, "REQUEST_DEADLINE_SECS", 10)
+    assert deadline.call_timeout() is None
+
+    with app.test_request_context("/"):
+        assert deadline.call_timeout() is None
+
+        deadline.start()
+        connect, read = deadline.call_timeout()
+        assert 9 < connect == read <= 10
+
+        flask.g.deadline = time.monotonic()
+        with pytest.raises(deadline.DeadlineExceeded):
+            deadline.call_timeout()
+
+
+def test_exceeded_deadline_is_a_504(app, monkeypatch):
+    monkeypatch.setattr(settings, "REQUEST_DEADLINE_SECS", 0.05)
+    app.before_request(deadline.start)
+    app.register_error_handler(deadline.DeadlineExceeded,
+                               base_app.deadline_exceeded)
+    called = []
+
+    @app.route("/api/namespaces/<namespace>/things")
+    def things(namespace):
+        time.sleep(0.1)
+        data = api.wrap_resp("things", lambda **kw: called.append(kw))
+        return flask.jsonify(data)
+
+    resp = app.test_client().get("/api/namespaces/ns/things")
+    assert resp.status_code == 504
+    assert resp.get_json()["success"] is False
+    assert called == []
+
+
+def test_budget_ratio(monkeypatch):
+    monkeypatch.setattr(settings, "HEDGE_MAX_RATIO", 0.1)
+    budget = deadline.HedgeBudget()
+    for _ in range(9):
+        budget.call()
+    assert not budget.allow()
+
+    budget.call()
+    assert budget.allow()
+    assert not budget.allow()
+
+    for _ in range(10):
+        budget.call()
+    assert budget.allow()
+
+
+def test_p95(monkeypatch):
+    monkeypatch.setattr(settings, "HEDGE_MIN_SAMPLES", 10)
+    tracker = deadline.LatencyTracker()
+    for secs in range(9):
+        tracker.observe(secs)
+    assert tracker.p95() is None
+
+    for secs in range(9, 100):
+        tracker.observe(secs)
+    assert tracker.p95() == 94
+
+
+def test_first_completed_wins(hedging, slow):
+    assert deadline.hedged(slow.__call__)() == "second"
+    assert len(slow.calls) == 2
+
+
+def test_no_hedge_without_budget(hedging, slow, monkeypatch):
+    monkeypatch.setattr(settings, "HEDGE_MAX_RATIO", 0)
+    threading.Timer(0.1, slow.release.set).start()
+    assert deadline.hedged(slow.__call__)() == "first"
+    assert len(slow.calls) == 1
+
+
+def test_hedge_gets_the_time_left(app, hedging, slow, monkeypatch):
+    monkeypatch.setattr(settings, "REQUEST_DEADLINE_SECS", 10)
+    with app.test_request_context("/"):
+        deadline.start()
+        timeout = deadline.call_timeout()
+        read = deadline.hedged(slow.__call__)
+        assert read(_request_timeout=timeout) == "second"
+
+    first, second = slow.calls
+    assert first["_request_timeout"] == timeout
+    assert second["_request_timeout"][1] <= timeout[1] - 0.05
+
+
+def test_no_hedge_past_the_deadline(app, hedging, slow, monkeypatch):
+    monkeypatch.setattr(settings, "REQUEST_DEADLINE_SECS", 0.2)
+    monkeypatch.setattr(settings, "MIN_CALL_TIMEOUT_SECS", 0.5)
+    with app.test_request_context("/"):
+        deadline.start()
+        start = time.monotonic()
+        with pytest.raises(deadline.DeadlineExceeded):
+            deadline.hedged(slow.__call__)()
+        assert time.monotonic() - start < 1
+
+    assert len(slow.calls) == 1
+
+
+def test_refused_hedge_waits_until_the_deadline(app, hedging, slow,
+                                                monkeypatch):
+    monkeypatch.setattr(settings, "REQUEST_DEADLINE_SECS", 0.2)
+    monkeypatch.setattr(settings, "HEDGE_MAX_RATIO", 0)
+    with app.test_request_context("/"):
+        deadline.start()
+        start = time.monotonic()
+        with pytest.raises(deadline.DeadlineExceeded):
+            deadline.hedged(slow.__call__)()
+        assert time.monotonic() - start < 1
+
+    assert len(slow.calls) == 1
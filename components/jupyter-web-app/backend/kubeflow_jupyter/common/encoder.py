@@ -0,0 +1,53 @@
+import decimal
+
+from flask.json import JSONEncoder as FlaskJSONEncoder
+from . import api
+from . import settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The JSON encoder of the Flask apps. With JSON_ENCODER=orjson, and orjson
+# installed, the responses are encoded by orjson, which is several times
+# faster than the json module. The output is the same JSON, apart from the
+# whitespace and the non-ASCII characters, which orjson writes as UTF-8.
+
+
+def use_orjson():
+    return orjson is not None and settings.JSON_ENCODER == "orjson"
+
+
+class JSONEncoder(FlaskJSONEncoder):
+    '''
+    Also encodes the kubernetes models, as the API Server would, and the
+    Decimals and sets. Datetimes are encoded as HTTP dates, like Flask does.
+    '''
+
+    def default(self, o):
+        if hasattr(o, "openapi_types") or hasattr(o, "swagger_types"):
+            return api.v1_core.api_client.sanitize_for_serialization(o)
+        if isinstance(o, decimal.Decimal):
+            return float(o)
+        if isinstance(o, (set, frozenset)):
+            return list(o)
+
+        return super().default(o)
+
+    def encode(self, o):
+        if not use_orjson():
+            return super().encode(o)
+
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if self.indent:
+            option |= orjson.OPT_INDENT_2
+
+        try:
+            return orjson.dumps(o, default=self.default,
+                                option=option).decode("utf-8")
+        except TypeError:
+            # i.e. integers larger than 64 bits, that only json can encode
+            return super().encode(o)
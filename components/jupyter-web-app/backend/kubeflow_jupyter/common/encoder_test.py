@@ -0,0 +1,89 @@
+import datetime as dt
+import decimal
+import json
+
+import pytest
+from kubernetes import client
+
+from kubeflow_jupyter.common import encoder, settings
+
+needs_orjson = pytest.mark.skipif(encoder.orjson is None,
+                                  reason="orjson is not installed")
+
+OBJ = {
+    "name": "nb",
+    "cpu": decimal.Decimal("0.5"),
+    "volumes": {"workspace"},
+    "created": dt.datetime(2020, 1, 2, 3, 4, 5),
+    "pod": client.V1Pod(metadata=client.V1ObjectMeta(name="nb-0")),
+    "ports": {8888: "notebook"},
+}
+
+EXPECTED = {
+    "name": "nb",
+    "cpu": 0.5,
+    "volumes": ["workspace"],
+    "created": "Thu, 02 Jan 2020 03:04:05 GMT",
+    "pod": {"metadata": {"name": "nb-0"}},
+    "ports": {"8888": "notebook"},
+}
+
+
+@pytest.fixture
+def json_encoder(monkeypatch):
+    def use(name):
+        monkeypatch.setattr(settings, "JSON_ENCODER", name)
+        return encoder.JSONEncoder()
+
+    return use
+
+
+def test_json(json_encoder):
+    assert json.loads(json_encoder("json").encode(OBJ)) == EXPECTED
+
+
+def test_without_orjson(json_encoder, monkeypatch):
+    monkeypatch.setattr(encoder, "orjson", None)
+    assert not encoder.use_orjson()
+    assert json.loads(json_encoder("orjson").encode(OBJ)) == EXPECTED
+
+
+@needs_orjson
+def test_orjson(json_encoder):
+    enc = json_encoder("orjson")
+    assert encoder.use_orjson()
+    assert json.loads(enc.encode(OBJ)) == EXPECTED
+
+    # Non-ASCII characters are written as UTF-8, rather than escaped
+    assert enc.encode({"name": "café"}) == '{"name":"café"}'
+
+
+@needs_orjson
+def test_orjson_options(json_encoder):
+    enc = json_encoder("orjson")
+    enc.sort_keys = True
+    assert enc.encode({"b": 1, "a": 2}) == '{"a":2,"b":1}'
+
+    enc.indent = 2
+    assert enc.encode({"a": 1}) == '{\n  "a": 1\n}'
+
+
+@needs_orjson
+def test_orjson_falls_back_to_json(json_encoder, monkeypatch):
+    # orjson can't encode integers larger than 64 bits
+    big = {"size": 2 ** 70}
+    fallbacks = []
+    encode = encoder.FlaskJSONEncoder.encode
+
+    def json_encode(self, o):
+        fallbacks.append(o)
+        return encode(self, o)
+
+    monkeypatch.setattr(encoder.FlaskJSONEncoder, "encode", json_encode)
+    enc = json_encoder("orjson")
+
+    assert json.loads(enc.encode(big)) == big
+    assert fallbacks == [big]
+
+    assert json.loads(enc.encode({"size": 1})) == {"size": 1}
+    assert fallbacks == [big]
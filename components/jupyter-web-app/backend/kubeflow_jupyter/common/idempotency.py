@@ -0,0 +1,124 @@
+import functools
+import hashlib
+import threading
+
+from flask import jsonify, make_response, request
+from . import deadline
+from . import settings
+from . import utils
+from .ttlcache import TTLCache
+
+logger = utils.create_logger(__name__)
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+# How long a retry waits for the in-flight request, if it has no deadline
+DEFAULT_WAIT_SECS = 30
+
+
+class Entry:
+    '''A request with an Idempotency-Key, in flight or completed'''
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.response = None
+
+    def complete(self, resp):
+        # Kept as plain values, a Response object can't be sent twice
+        self.response = (resp.get_data(), resp.status_code,
+                         list(resp.headers.items()))
+        self.done.set()
+
+    def fail(self):
+        self.done.set()
+
+
+# (user, method, path, key) -> Entry
+store = TTLCache(settings.IDEMPOTENCY_MAX_KEYS, settings.IDEMPOTENCY_TTL_SECS)
+lock = threading.Lock()
+
+
+def request_fingerprint():
+    return hashlib.sha256(request.get_data()).hexdigest()
+
+
+def replay(entry):
+    '''
+    Return the response of the request that the retry is attached to,
+    waiting for it if it's still in flight
+    '''
+    timeout = deadline.remaining()
+    if not entry.done.wait(DEFAULT_WAIT_SECS if timeout is None else timeout):
+        resp = jsonify({
+            "success": False,
+            "log": "A request with the same {} is still in progress".format(
+                HEADER),
+        })
+        resp.headers["Retry-After"] = "1"
+        return resp, 409
+
+    if entry.response is None:
+        # The request failed and was forgotten, so the client can retry it
+        resp = jsonify({
+            "success": False,
+            "log": "The request with the same {} failed. Try again".format(
+                HEADER),
+        })
+        resp.headers["Retry-After"] = "1"
+        return resp, 409
+
+    data, status, headers = entry.response
+    resp = make_response(data, status, headers)
+    resp.headers[REPLAYED_HEADER] = "true"
+    return resp
+
+
+def idempotent(fn):
+    '''
+    Make a POST endpoint idempotent for requests with an Idempotency-Key
+    header. The first request with a key runs, its retries wait for it and
+    get the same response, so the calls to the API Server are never redone.
+    A key can't be reused for a request with a different body.
+    '''
+    @functools.wraps(fn)
+    def runner(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return fn(*args, **kwargs)
+
+        scope = (utils.get_username_from_request(), request.method,
+                 request.path, key)
+        fingerprint = request_fingerprint()
+        with lock:
+            entry = store.get(scope)
+            retry = entry is not None
+            if not retry:
+                entry = Entry(fingerprint)
+                store.set(scope, entry)
+
+        if entry.fingerprint != fingerprint:
+            return jsonify({
+                "success": False,
+                "log": "The {} was already used for a different request"
+                       .format(HEADER),
+            }), 422
+
+        if retry:
+            logger.info("Replaying the response of {} {} with {} {}".format(
+                request.method, request.path, HEADER, key))
+            return replay(entry)
+
+        try:
+            resp = make_response(fn(*args, **kwargs))
+        except Exception:
+            # Errors like an exceeded deadline aren't replayed
+            store.pop(scope)
+            entry.fail()
+            raise
+
+        entry.complete(resp)
+        return resp
+
+    return runner
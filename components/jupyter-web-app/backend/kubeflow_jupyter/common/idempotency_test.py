@@ -0,0 +1,129 @@
+import threading
+
+import flask
+import pytest
+
+from kubeflow_jupyter.common import idempotency, utils
+from kubeflow_jupyter.common.ttlcache import TTLCache
+
+
+class Endpoint:
+    '''A POST endpoint that counts its calls and can be held or failed'''
+
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self.error = None
+
+    def __call__(self, namespace):
+        self.calls += 1
+        self.started.set()
+        self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return flask.jsonify({"success": True, "call": self.calls})
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    monkeypatch.setattr(idempotency, "store", TTLCache(100, 60))
+    return Endpoint()
+
+
+@pytest.fixture
+def client(endpoint):
+    app = flask.Flask(__name__)
+    app.add_url_rule("/api/namespaces/<namespace>/notebooks",
+                     "post_notebook", idempotency.idempotent(endpoint),
+                     methods=["POST"])
+
+    @app.errorhandler(RuntimeError)
+    def error(e):
+        return flask.jsonify({"success": False, "log": str(e)}), 500
+
+    return app.test_client()
+
+
+def post(client, key="k1", body=None, user="alice"):
+    headers = {utils.USER_HEADER: utils.USER_PREFIX + user}
+    if key is not None:
+        headers[idempotency.HEADER] = key
+    return client.post("/api/namespaces/ns/notebooks",
+                       json=body or {"name": "nb"}, headers=headers)
+
+
+def test_without_a_key(client, endpoint):
+    post(client, key=None)
+    post(client, key=None)
+    assert endpoint.calls == 2
+
+
+def test_retries_are_replayed(client, endpoint):
+    first = post(client)
+    retry = post(client)
+
+    assert endpoint.calls == 1
+    assert retry.get_json() == first.get_json() == {"success": True,
+                                                    "call": 1}
+    assert retry.headers[idempotency.REPLAYED_HEADER] == "true"
+    assert idempotency.REPLAYED_HEADER not in first.headers
+
+
+def test_keys_are_per_user(client, endpoint):
+    post(client, user="alice")
+    post(client, user="bob")
+    assert endpoint.calls == 2
+
+
+def test_key_reused_for_another_body(client, endpoint):
+    post(client, body={"name": "a"})
+    resp = post(client, body={"name": "b"})
+
+    assert resp.status_code == 422
+    assert endpoint.calls == 1
+
+
+def test_failed_requests_can_be_retried(client, endpoint):
+    endpoint.error = RuntimeError("deadline exceeded")
+    assert post(client).status_code == 500
+
+    endpoint.error = None
+    resp = post(client)
+    assert resp.status_code == 200
+    assert endpoint.calls == 2
+
+
+def test_retry_waits_for_the_request_in_flight(client, endpoint):
+    endpoint.release.clear()
+    responses = []
+    t = threading.Thread(target=lambda: responses.append(post(client)))
+    t.start()
+    endpoint.started.wait()
+
+    retry = threading.Thread(target=lambda: responses.append(post(client)))
+    retry.start()
+    endpoint.release.set()
+    t.join()
+    retry.join()
+
+    assert endpoint.calls == 1
+    assert [r.get_json()["call"] for r in responses] == [1, 1]
+
+
+def test_retry_gives_up_on_a_request_in_flight(client, endpoint,
+                                               monkeypatch):
+    monkeypatch.setattr(idempotency, "DEFAULT_WAIT_SECS", 0.05)
+    endpoint.release.clear()
+    t = threading.Thread(target=lambda: post(client))
+    t.start()
+    endpoint.started.wait()
+
+    resp = post(client)
+    endpoint.release.set()
+    t.join()
+
+    assert resp.status_code == 409
+    assert resp.headers["Retry-After"] == "1"
+    assert endpoint.calls == 1
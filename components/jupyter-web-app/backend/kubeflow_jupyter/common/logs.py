@@ -0,0 +1,144 @@
+import atexit
+import collections
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+
+from flask import has_request_context, request
+from . import metrics
+from . import settings
+from . import tracing
+
+# The loggers of the backend don't write to stdout themselves. The records are
+# put in a bounded queue and a background thread writes them, so that a
+# request never waits for a slow stdout. Messages should use %-style
+# arguments, which are only formatted if the record passes the level and the
+# filters. They are formatted before the record is queued, since the objects
+# logged, i.e. the specs, may be changed once the call returns.
+
+TEXT_FORMAT = "%(asctime)s | %(name)s | %(levelname)s | %(message)s"
+
+# The level of the log lines that dump whole specs and request bodies
+SPEC = logging.getLevelName(settings.LOG_SPEC_LEVEL.upper())
+if not isinstance(SPEC, int):
+    SPEC = logging.INFO
+
+# The attributes a record gets from the request that logged it
+CONTEXT_FIELDS = ["route", "method", "path", "trace_id"]
+
+
+class JSONFormatter(logging.Formatter):
+    '''One JSON object per record, with the request's context if any'''
+
+    def format(self, record):
+        line = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for f in CONTEXT_FIELDS:
+            value = getattr(record, f, None)
+            if value is not None:
+                line[f] = value
+
+        if getattr(record, "sample_rate", 1) > 1:
+            line["sampleRate"] = record.sample_rate
+        if record.exc_text:
+            line["exception"] = record.exc_text
+
+        return json.dumps(line, default=str)
+
+
+class ContextFilter(logging.Filter):
+    '''
+    Adds the context of the request to the record. It runs in the thread
+    that logged the record, while the request's context is still there.
+    '''
+
+    def filter(self, record):
+        if has_request_context():
+            record.route = str(request.url_rule or "")
+            record.method = request.method
+            record.path = request.path
+
+        span = tracing.current_span()
+        if span is not None:
+            record.trace_id = span.trace_id
+
+        return True
+
+
+class SampleFilter(logging.Filter):
+    '''
+    Lets through 1 in every LOG_SAMPLE_RATE of the noisy records, i.e. the
+    ones logged with extra={"sampled": True}, per route and message. The
+    first one of each is always written.
+    '''
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self.counts = collections.Counter()
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if self.rate <= 1 or not getattr(record, "sampled", False):
+            return True
+
+        key = (getattr(record, "route", None), record.msg)
+        with self.lock:
+            n = self.counts[key]
+            self.counts[key] = n + 1
+
+        record.sample_rate = self.rate
+        return n % self.rate == 0
+
+
+class Handler(logging.handlers.QueueHandler):
+    '''
+    Puts the records in the queue without waiting. The records that don't fit
+    in it are dropped and counted, instead of blocking the request.
+    '''
+
+    def prepare(self, record):
+        # The message and the traceback are formatted right away, while the
+        # arguments and the exception are the ones that were logged
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.LOG_DROPPED.inc()
+
+
+def stream_handler():
+    h = logging.StreamHandler(sys.stdout)
+    if settings.LOG_FORMAT == "json":
+        h.setFormatter(JSONFormatter())
+    else:
+        h.setFormatter(logging.Formatter(TEXT_FORMAT))
+    return h
+
+
+records = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+handler = Handler(records)
+handler.addFilter(ContextFilter())
+handler.addFilter(SampleFilter(settings.LOG_SAMPLE_RATE))
+
+listener = logging.handlers.QueueListener(records, stream_handler())
+listener.start()
+
+# Write what's left in the queue when the backend exits
+atexit.register(listener.stop)
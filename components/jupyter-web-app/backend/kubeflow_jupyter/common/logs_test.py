@@ -0,0 +1,68 @@
+import logging
+import queue
+
+import pytest
+
+from kubeflow_jupyter.common import logs
+
+
+@pytest.fixture
+def logger():
+    q = queue.Queue(maxsize=2)
+    log = logging.getLogger("logs_test")
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    h = logs.Handler(q)
+    log.addHandler(h)
+    yield log, q
+    log.removeHandler(h)
+
+
+def test_messages_are_formatted_when_logged(logger):
+    log, q = logger
+    spec = {"name": "nb"}
+    log.info("Creating Notebook: %s", spec)
+    spec["name"] = "changed"
+
+    record = q.get_nowait()
+    assert record.getMessage() == "Creating Notebook: {'name': 'nb'}"
+    assert record.args is None
+
+
+def test_filtered_messages_are_not_formatted(logger):
+    log, q = logger
+
+    class Unformattable:
+        def __str__(self):
+            raise AssertionError("formatted")
+
+    log.debug("Spec: %s", Unformattable())
+    assert q.empty()
+
+
+def test_exceptions_are_formatted(logger):
+    log, q = logger
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        log.exception("Failed")
+
+    record = q.get_nowait()
+    assert record.exc_info is None
+    assert "ValueError: boom" in record.exc_text
+
+
+def test_full_queue_drops_records(logger):
+    log, q = logger
+    for i in range(3):
+        log.info("line %d", i)
+
+    assert q.qsize() == 2
+
+
+def test_sample_filter():
+    f = logs.SampleFilter(3)
+    record = logging.LogRecord("x", logging.INFO, "", 0, "noisy", None, None)
+    record.sampled = True
+    assert [f.filter(record) for _ in range(4)] == [True, False, False, True]
+    assert record.sample_rate == 3
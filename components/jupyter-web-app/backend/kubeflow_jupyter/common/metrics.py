@@ -0,0 +1,48 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Metrics exported by the backend in the /metrics endpoint
+
+# Rate limiting
+RATELIMIT_REJECTED = Counter(
+    "jwa_ratelimit_rejected_total",
+    "API requests rejected by the rate limiters",
+    ["limiter"],
+)
+RATELIMIT_WAIT = Histogram(
+    "jwa_ratelimit_wait_seconds",
+    "Time API requests waited for the global rate limiter",
+)
+RATELIMIT_USERS = Gauge(
+    "jwa_ratelimit_tracked_users",
+    "Number of users with a rate limiting token bucket",
+)
+
+# Circuit breaker
+BREAKER_STATE = Gauge(
+    "jwa_circuit_breaker_state",
+    "State of the circuit breaker in front of the API Server",
+    ["state"],
+)
+BREAKER_OPENED = Counter(
+    "jwa_circuit_breaker_opened_total",
+    "Times the circuit breaker in front of the API Server opened",
+)
+BREAKER_REJECTED = Counter(
+    "jwa_circuit_breaker_rejected_total",
+    "Calls to the API Server not sent because the circuit breaker was open",
+)
+
+# Notebook startup
+NOTEBOOK_STARTUP = Histogram(
+    "jwa_notebook_startup_seconds",
+    "Time from the creation of a Notebook until its container is running,"
+    " in total and per phase",
+    ["namespace", "image", "phase"],
+    buckets=(1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1200, 1800),
+)
+
+# Logging
+LOG_DROPPED = Counter(
+    "jwa_log_records_dropped_total",
+    "Log records dropped because the queue of the log writer was full",
+)
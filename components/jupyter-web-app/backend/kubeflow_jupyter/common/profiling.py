@@ -0,0 +1,175 @@
+import collections
+import datetime as dt
+import json
+import os
+import re
+import sys
+import threading
+
+from . import settings
+from . import utils
+
+logger = utils.create_logger(__name__)
+
+# Requests with this header are profiled, if allowed. With "inline" the
+# profile is sent instead of the response, otherwise it's saved to a file
+# whose name is set in the PROFILE_FILE_HEADER of the response
+HEADER = "X-JWA-Profile"
+PROFILE_FILE_HEADER = "X-JWA-Profile-File"
+MODE_INLINE = "inline"
+
+# The modules summarized in the profiles
+MODULES = ["common/api.py", "common/auth.py", "common/utils.py"]
+
+PACKAGE = "kubeflow_jupyter" + os.sep
+
+
+def is_allowed():
+    if settings.DEV_MODE:
+        return True
+
+    user = utils.get_username_from_request()
+    return user is not None and user in settings.PROFILING_USERS
+
+
+def short_path(path):
+    '''The path from the package, or the site-packages, i.e. common/api.py'''
+    i = path.rfind(PACKAGE)
+    if i >= 0:
+        return path[i + len(PACKAGE):]
+
+    i = path.rfind("-packages" + os.sep)
+    if i >= 0:
+        return path[i + len("-packages" + os.sep):]
+
+    return path
+
+
+def frame_key(frame):
+    code = frame.f_code
+    return (short_path(code.co_filename), code.co_name, code.co_firstlineno)
+
+
+def frame_label(key):
+    # ';' separates the frames in the collapsed stacks
+    return "{1} ({0}:{2})".format(*key).replace(";", ":")
+
+
+class Sampler:
+    '''
+    Samples the stack of a thread, i.e. the one serving a request, from a
+    background thread. The stacks are counted as tuples of frame keys, from
+    the outermost frame, so they can be written in the collapsed format of
+    flamegraph.pl and speedscope.
+    '''
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="profiler",
+                                       daemon=True)
+        self.started_at = dt.datetime.utcnow()
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_key(frame))
+                frame = frame.f_back
+
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def samples(self):
+        return sum(self.stacks.values())
+
+    def collapsed(self):
+        return "".join("{} {}\n".format(";".join(map(frame_label, s)), n)
+                       for s, n in self.stacks.most_common())
+
+    def summary(self, top):
+        '''
+        The time spent in each of the MODULES, and the top functions of them
+        by time spent in the function and its callees (cumulative) and in the
+        function itself (self). Times are estimated from the samples, in ms.
+        '''
+        ms = self.interval * 1000
+        modules = collections.Counter()
+        cumulative = collections.Counter()
+        own = collections.Counter()
+        for stack, n in self.stacks.items():
+            tracked = [k for k in stack if k[0] in MODULES]
+            for m in {k[0] for k in tracked}:
+                modules[m] += n
+            for k in set(tracked):
+                cumulative[k] += n
+            if stack[-1][0] in MODULES:
+                own[stack[-1]] += n
+
+        return {
+            "modules": {m: modules[m] * ms for m in MODULES},
+            "functions": [{
+                "function": frame_label(k),
+                "cumulativeMs": n * ms,
+                "selfMs": own[k] * ms,
+            } for k, n in cumulative.most_common(top)],
+        }
+
+    def report(self, top):
+        return {
+            "samples": self.samples(),
+            "intervalMs": self.interval * 1000,
+            "summary": self.summary(top),
+            "collapsed": self.collapsed(),
+        }
+
+
+def start(headers):
+    '''Start sampling the current request, if asked and allowed'''
+    if HEADER not in headers or not is_allowed():
+        return None
+
+    s = Sampler(threading.get_ident(), settings.PROFILING_INTERVAL_MS / 1000)
+    s.start()
+    return s
+
+
+def profile_name(method, path, started_at):
+    path = re.sub(r"[^A-Za-z0-9_.-]+", "_", path).strip("_")
+    return "{}-{}-{}".format(started_at.strftime("%Y%m%dT%H%M%S.%f"),
+                             method, path)
+
+
+def save(sampler, method, path):
+    '''
+    Write the collapsed stacks and the summary of the profile to files in the
+    PROFILING_DIR. Returns the path of the collapsed stacks.
+    '''
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    base = os.path.join(settings.PROFILING_DIR,
+                        profile_name(method, path, sampler.started_at))
+
+    with open(base + ".collapsed", "w") as f:
+        f.write(sampler.collapsed())
+    with open(base + ".json", "w") as f:
+        json.dump(sampler.summary(settings.PROFILING_TOP), f, indent=2)
+
+    return base + ".collapsed"
+
+
+def log_summary(sampler, method, path):
+    summary = sampler.summary(settings.PROFILING_TOP)
+    modules = ", ".join("{} {:.0f}ms".format(m, t)
+                        for m, t in summary["modules"].items())
+    logger.info("Profile of {} {}: {} samples, {}".format(
+        method, path, sampler.samples(), modules))
@@ -0,0 +1,63 @@
+import threading
+import time
+
+import flask
+import pytest
+
+from kubeflow_jupyter.common import base_app, profiling
+
+
+def busy(stop):
+    while not stop.is_set():
+        sum(range(100))
+
+
+@pytest.fixture
+def sampled():
+    '''A Sampler of a thread that is busy in this module'''
+    stop = threading.Event()
+    t = threading.Thread(target=busy, args=(stop,))
+    t.start()
+    s = profiling.Sampler(t.ident, 0.001)
+    s.start()
+    time.sleep(0.05)
+    yield s
+    s.stop()
+    stop.set()
+    t.join()
+
+
+def test_short_path():
+    assert profiling.short_path(
+        "/app/kubeflow_jupyter/common/api.py") == "common/api.py"
+    assert profiling.short_path(
+        "/usr/lib/python3/site-packages/flask/app.py") == "flask/app.py"
+    assert profiling.short_path("/other.py") == "/other.py"
+
+
+def test_sampler(sampled):
+    sampled.stop()
+    assert sampled.samples() > 0
+    assert not sampled.thread.is_alive()
+
+    collapsed = sampled.collapsed()
+    assert "busy (" in collapsed
+    line = collapsed.splitlines()[0]
+    assert int(line.rsplit(" ", 1)[1]) > 0
+
+
+def test_profile_name():
+    s = profiling.Sampler(0, 0.01)
+    name = profiling.profile_name("GET", "/api/namespaces/ns/notebooks",
+                                  s.started_at)
+    assert name.endswith("-GET-api_namespaces_ns_notebooks")
+
+
+def test_teardown_stops_the_sampler(sampled):
+    app = flask.Flask(__name__)
+    with app.test_request_context("/api/namespaces/ns/notebooks"):
+        flask.g.profiler = sampled
+        base_app.stop_request_profile(RuntimeError())
+
+        assert "profiler" not in flask.g
+    assert not sampled.thread.is_alive()
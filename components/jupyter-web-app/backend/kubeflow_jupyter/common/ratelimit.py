@@ -0,0 +1,158 @@
+import collections
+import math
+import threading
+import time
+
+from . import metrics
+from . import settings
+from . import utils
+
+logger = utils.create_logger(__name__)
+
+# Upper bound for the number of users with a token bucket. The least recently
+# seen users are dropped first, their buckets are full by then anyway
+MAX_TRACKED_USERS = 10000
+
+
+class RateLimited(Exception):
+    '''
+    Raised when a request is over the limit. The Flask apps turn it into a
+    429 response with a Retry-After header.
+    '''
+
+    def __init__(self, msg, retry_after):
+        super().__init__(msg)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    '''
+    A bucket that holds up to 'burst' tokens and is refilled with 'qps'
+    tokens per second. Every request to the API needs one token.
+    '''
+
+    def __init__(self, qps, burst):
+        self.qps = qps
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, max_wait=0):
+        '''
+        Take a token, if one will be available within max_wait seconds.
+        Returns (ok, wait): if ok the caller must wait 'wait' seconds before
+        using the token, otherwise 'wait' is how long it would take to get
+        one and no token was taken.
+        '''
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.last) * self.qps)
+            self.last = now
+
+            wait = max(0, (1 - self.tokens) / self.qps)
+            if wait > max_wait:
+                return False, wait
+
+            self.tokens -= 1
+            return True, wait
+
+    def refund(self):
+        '''Give back a token that was taken but not used'''
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + 1)
+
+
+class UserLimiter:
+    '''Keeps a TokenBucket per user, so a single user can't starve others'''
+
+    def __init__(self, qps, burst):
+        self.qps = qps
+        self.burst = burst
+        self.buckets = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def bucket(self, user):
+        with self.lock:
+            b = self.buckets.get(user)
+            if b is None:
+                b = TokenBucket(self.qps, self.burst)
+                self.buckets[user] = b
+                if len(self.buckets) > MAX_TRACKED_USERS:
+                    self.buckets.popitem(last=False)
+                metrics.RATELIMIT_USERS.set(len(self.buckets))
+            else:
+                self.buckets.move_to_end(user)
+
+            return b
+
+    def acquire(self, user):
+        '''Take a token of the user's bucket, and return the bucket'''
+        b = self.bucket(user)
+        ok, wait = b.acquire()
+        if not ok:
+            metrics.RATELIMIT_REJECTED.labels("user").inc()
+            raise RateLimited(
+                "User {} is sending too many requests".format(user),
+                math.ceil(wait),
+            )
+
+        return b
+
+
+class GlobalLimiter:
+    '''
+    Limits the QPS of the whole backend. Requests wait for a token for up to
+    max_wait seconds, and are rejected after that.
+    '''
+
+    def __init__(self, qps, burst, max_wait):
+        self.bucket = TokenBucket(qps, burst)
+        self.max_wait = max_wait
+
+    def acquire(self):
+        ok, wait = self.bucket.acquire(self.max_wait)
+        if not ok:
+            metrics.RATELIMIT_REJECTED.labels("global").inc()
+            raise RateLimited("The backend is overloaded", math.ceil(wait))
+
+        metrics.RATELIMIT_WAIT.observe(wait)
+        if wait > 0:
+            time.sleep(wait)
+
+
+user_limiter = None
+if settings.RATELIMIT_USER_QPS > 0:
+    user_limiter = UserLimiter(settings.RATELIMIT_USER_QPS,
+                               settings.RATELIMIT_USER_BURST)
+
+global_limiter = None
+if settings.RATELIMIT_QPS > 0:
+    global_limiter = GlobalLimiter(settings.RATELIMIT_QPS,
+                                   settings.RATELIMIT_BURST,
+                                   settings.RATELIMIT_MAX_WAIT)
+
+
+def admit():
+    '''
+    Admit the request being served, or raise RateLimited. A request takes a
+    token of its user's bucket and one of the shared bucket, or none at all
+    if either is empty. The calls to the API Server of an admitted request
+    aren't limited, so it's never cut halfway, i.e. after creating the PVCs
+    of a Notebook but before creating the Notebook. Neither are the calls of
+    the background threads.
+    '''
+    user_bucket = None
+    if user_limiter is not None:
+        user = utils.get_username_from_request()
+        if user is not None:
+            user_bucket = user_limiter.acquire(user)
+
+    if global_limiter is not None:
+        try:
+            global_limiter.acquire()
+        except RateLimited:
+            if user_bucket is not None:
+                user_bucket.refund()
+            raise
@@ -0,0 +1,122 @@
+import flask
+import pytest
+
+from kubeflow_jupyter.common import ratelimit, utils
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", c)
+    monkeypatch.setattr(ratelimit.time, "sleep", lambda secs: None)
+    return c
+
+
+@pytest.fixture
+def app():
+    return flask.Flask(__name__)
+
+
+def request_of(app, user):
+    return app.test_request_context(
+        "/api/namespaces/ns/notebooks",
+        headers={utils.USER_HEADER: utils.USER_PREFIX + user})
+
+
+def test_bucket_burst_and_refill(clock):
+    b = ratelimit.TokenBucket(qps=2, burst=3)
+    assert [b.acquire()[0] for _ in range(4)] == [True, True, True, False]
+
+    ok, wait = b.acquire()
+    assert not ok and wait == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert b.acquire() == (True, 0)
+    clock.now += 100
+    assert [b.acquire()[0] for _ in range(4)] == [True, True, True, False]
+
+
+def test_bucket_wait(clock):
+    b = ratelimit.TokenBucket(qps=10, burst=1)
+    assert b.acquire() == (True, 0)
+    assert b.acquire(max_wait=0.05)[0] is False
+    ok, wait = b.acquire(max_wait=0.1)
+    assert ok and wait == pytest.approx(0.1)
+
+
+def test_bucket_refund(clock):
+    b = ratelimit.TokenBucket(qps=1, burst=1)
+    assert b.acquire()[0]
+    b.refund()
+    assert b.acquire()[0]
+    b.refund()
+    b.refund()
+    assert b.tokens == 1
+
+
+def test_user_limiter_is_per_user(clock):
+    limiter = ratelimit.UserLimiter(qps=1, burst=2)
+    limiter.acquire("alice")
+    limiter.acquire("alice")
+    with pytest.raises(ratelimit.RateLimited) as e:
+        limiter.acquire("alice")
+    assert e.value.retry_after == 1
+
+    limiter.acquire("bob")
+
+
+def test_user_limiter_drops_least_recent_users(clock, monkeypatch):
+    monkeypatch.setattr(ratelimit, "MAX_TRACKED_USERS", 2)
+    limiter = ratelimit.UserLimiter(qps=1, burst=1)
+    for user in ("a", "b", "a", "c"):
+        limiter.bucket(user)
+    assert list(limiter.buckets) == ["a", "c"]
+
+
+def test_admit(clock, app, monkeypatch):
+    monkeypatch.setattr(ratelimit, "user_limiter",
+                        ratelimit.UserLimiter(qps=1, burst=1))
+    monkeypatch.setattr(ratelimit, "global_limiter",
+                        ratelimit.GlobalLimiter(qps=10, burst=10, max_wait=0))
+
+    with request_of(app, "alice"):
+        ratelimit.admit()
+        with pytest.raises(ratelimit.RateLimited):
+            ratelimit.admit()
+    with request_of(app, "bob"):
+        ratelimit.admit()
+
+    # Rejected requests don't spend the shared tokens
+    assert ratelimit.global_limiter.bucket.tokens == 8
+
+
+def test_admit_spends_no_user_token_if_the_backend_is_full(clock, app,
+                                                           monkeypatch):
+    monkeypatch.setattr(ratelimit, "user_limiter",
+                        ratelimit.UserLimiter(qps=1, burst=1))
+    monkeypatch.setattr(ratelimit, "global_limiter",
+                        ratelimit.GlobalLimiter(qps=1, burst=1, max_wait=0))
+
+    with request_of(app, "alice"):
+        ratelimit.admit()
+    with request_of(app, "bob"):
+        with pytest.raises(ratelimit.RateLimited):
+            ratelimit.admit()
+
+    assert ratelimit.user_limiter.bucket("bob").tokens == 1
+
+
+def test_admit_disabled(app, monkeypatch):
+    monkeypatch.setattr(ratelimit, "user_limiter", None)
+    monkeypatch.setattr(ratelimit, "global_limiter", None)
+    with request_of(app, "alice"):
+        for _ in range(100):
+            ratelimit.admit()
@@ -0,0 +1,208 @@
+import sys
+
+from kubernetes import client
+
+# Compact records of the objects kept in the caches. Only the fields that the
+# UIs read are kept, in __slots__ classes, with the strings that repeat across
+# objects (namespaces, images, reasons etc) interned. When read from the cache
+# a record is expanded back to an object of the original shape, which has
+# only these fields set.
+
+
+def intern(s):
+    return sys.intern(s) if isinstance(s, str) else s
+
+
+def resource_items(resources):
+    return tuple((intern(k), intern(v))
+                 for k, v in (resources or {}).items()) or None
+
+
+class NotebookRecord:
+    __slots__ = ("name", "namespace", "uid", "creation_timestamp",
+                 "deletion_timestamp", "image", "cpu", "memory",
+                 "volume_mounts", "state", "state_reason", "started_at")
+
+    @classmethod
+    def from_object(cls, nb):
+        meta = nb["metadata"]
+        cntr = nb["spec"]["template"]["spec"]["containers"][0]
+        requests = cntr.get("resources", {}).get("requests", {})
+        state = nb.get("status", {}).get("containerState", {})
+
+        r = cls()
+        r.name = meta["name"]
+        r.namespace = intern(meta["namespace"])
+        r.uid = meta.get("uid")
+        r.creation_timestamp = meta["creationTimestamp"]
+        r.deletion_timestamp = meta.get("deletionTimestamp")
+        r.image = intern(cntr["image"])
+        r.cpu = intern(requests.get("cpu"))
+        r.memory = intern(requests.get("memory"))
+        r.volume_mounts = tuple(intern(m["name"])
+                                for m in cntr.get("volumeMounts", []))
+
+        # A single one of running/waiting/terminated is set
+        r.state, r.state_reason, r.started_at = None, None, None
+        for s in ("running", "waiting", "terminated"):
+            if s in state:
+                r.state = intern(s)
+                r.state_reason = intern(state[s].get("reason"))
+                r.started_at = state[s].get("startedAt")
+
+        return r
+
+    def expand(self):
+        meta = {
+            "name": self.name,
+            "namespace": self.namespace,
+            "creationTimestamp": self.creation_timestamp,
+        }
+        if self.uid is not None:
+            meta["uid"] = self.uid
+        if self.deletion_timestamp is not None:
+            meta["deletionTimestamp"] = self.deletion_timestamp
+
+        state = {}
+        if self.state is not None:
+            detail = {}
+            # The reason of a waiting container is read without a default
+            if self.state_reason is not None or self.state == "waiting":
+                detail["reason"] = self.state_reason
+            if self.started_at is not None:
+                detail["startedAt"] = self.started_at
+            state[self.state] = detail
+
+        return {
+            "metadata": meta,
+            "spec": {"template": {"spec": {"containers": [{
+                "image": self.image,
+                "resources": {"requests": {"cpu": self.cpu,
+                                           "memory": self.memory}},
+                "volumeMounts": [{"name": m} for m in self.volume_mounts],
+            }]}}},
+            "status": {"containerState": state},
+        }
+
+
+class PVCRecord:
+    __slots__ = ("name", "namespace", "labels", "size", "mode",
+                 "storage_class")
+
+    @classmethod
+    def from_object(cls, pvc):
+        r = cls()
+        r.name = pvc.metadata.name
+        r.namespace = intern(pvc.metadata.namespace)
+        r.labels = pvc.metadata.labels or None
+        r.size = intern(pvc.spec.resources.requests["storage"])
+        r.mode = intern(pvc.spec.access_modes[0])
+        r.storage_class = intern(pvc.spec.storage_class_name)
+        return r
+
+    def expand(self):
+        return client.V1PersistentVolumeClaim(
+            metadata=client.V1ObjectMeta(
+                name=self.name,
+                namespace=self.namespace,
+                labels=dict(self.labels) if self.labels else None,
+            ),
+            spec=client.V1PersistentVolumeClaimSpec(
+                access_modes=[self.mode],
+                storage_class_name=self.storage_class,
+                resources=client.V1ResourceRequirements(
+                    requests={"storage": self.size}),
+            ),
+        )
+
+
+class EventRecord:
+    __slots__ = ("name", "namespace", "creation_timestamp", "object_kind",
+                 "object_name", "type", "reason", "message")
+
+    @classmethod
+    def from_object(cls, event):
+        r = cls()
+        r.name = event.metadata.name
+        r.namespace = intern(event.metadata.namespace)
+        r.creation_timestamp = event.metadata.creation_timestamp
+        r.object_kind = intern(event.involved_object.kind)
+        r.object_name = event.involved_object.name
+        r.type = intern(event.type)
+        r.reason = intern(event.reason)
+        r.message = event.message
+        return r
+
+    def expand(self):
+        return client.V1Event(
+            metadata=client.V1ObjectMeta(
+                name=self.name,
+                namespace=self.namespace,
+                creation_timestamp=self.creation_timestamp,
+            ),
+            involved_object=client.V1ObjectReference(kind=self.object_kind,
+                                                     name=self.object_name),
+            type=self.type,
+            reason=self.reason,
+            message=self.message,
+        )
+
+
+class PodRecord:
+    '''
+    The Pods are only cached to sum their requests per node, so only the
+    node, the phase and the requests and limits of the containers are kept
+    '''
+    __slots__ = ("name", "namespace", "node_name", "phase", "containers",
+                 "init_containers", "overhead")
+
+    @staticmethod
+    def container_resources(cntr):
+        if cntr.resources is None:
+            return None, None
+
+        return (resource_items(cntr.resources.requests),
+                resource_items(cntr.resources.limits))
+
+    @classmethod
+    def from_object(cls, pod):
+        r = cls()
+        r.name = pod.metadata.name
+        r.namespace = intern(pod.metadata.namespace)
+        r.node_name = intern(pod.spec.node_name)
+        r.phase = intern(pod.status.phase) if pod.status else None
+        r.containers = tuple(cls.container_resources(c)
+                             for c in pod.spec.containers)
+        r.init_containers = tuple(cls.container_resources(c)
+                                  for c in pod.spec.init_containers or [])
+        # Only clients from v11 on have the overhead in their models
+        r.overhead = resource_items(getattr(pod.spec, "overhead", None))
+        return r
+
+    @staticmethod
+    def expand_container(resources):
+        requests, limits = resources
+        return client.V1Container(
+            name="",
+            resources=client.V1ResourceRequirements(
+                requests=dict(requests) if requests else None,
+                limits=dict(limits) if limits else None,
+            ),
+        )
+
+    def expand(self):
+        spec = client.V1PodSpec(
+            node_name=self.node_name,
+            containers=[self.expand_container(c) for c in self.containers],
+            init_containers=[self.expand_container(c)
+                             for c in self.init_containers] or None,
+        )
+        if self.overhead is not None:
+            spec.overhead = dict(self.overhead)
+
+        return client.V1Pod(
+            metadata=client.V1ObjectMeta(name=self.name,
+                                         namespace=self.namespace),
+            spec=spec,
+            status=client.V1PodStatus(phase=self.phase),
+        )
@@ -0,0 +1,78 @@
+import datetime as dt
+
+from kubernetes import client
+
+from kubeflow_jupyter.common import capacity, records, utils
+
+
+def notebook(state):
+    return {
+        "metadata": {"namespace": "user", "name": "nb", "uid": "1",
+                     "creationTimestamp": "2019-08-05T12:34:56Z"},
+        "spec": {"template": {"spec": {"containers": [{
+            "image": "jupyter",
+            "resources": {"requests": {"cpu": "1", "memory": "1Gi"}},
+            "volumeMounts": [{"name": "workspace"}],
+        }]}}},
+        "status": {"containerState": state},
+    }
+
+
+def round_trip(nb):
+    return records.NotebookRecord.from_object(nb).expand()
+
+
+def test_notebook_round_trip():
+    nb = notebook({"running": {"startedAt": "2019-08-05T12:35:56Z"}})
+    assert round_trip(nb) == nb
+
+
+def test_notebook_waiting_always_has_a_reason():
+    nb = round_trip(notebook({"waiting": {}}))
+    assert nb["status"]["containerState"] == {"waiting": {"reason": None}}
+    assert utils.process_status(nb, []) == (utils.STATUS_WAITING, None)
+
+    nb = round_trip(notebook({"waiting": {"reason": "ContainerCreating"}}))
+    assert nb["status"]["containerState"] == {
+        "waiting": {"reason": "ContainerCreating"}}
+
+
+def test_notebook_without_state():
+    nb = round_trip(notebook({}))
+    assert nb["status"]["containerState"] == {}
+
+
+def test_event_round_trip():
+    event = client.V1Event(
+        metadata=client.V1ObjectMeta(
+            name="nb.1", namespace="user",
+            creation_timestamp=dt.datetime(2019, 8, 5, 12, 34, 56)),
+        involved_object=client.V1ObjectReference(kind="Notebook", name="nb"),
+        type="Warning", reason="FailedScheduling", message="No nodes")
+    assert records.EventRecord.from_object(event).expand() == event
+
+
+def test_pod_keeps_what_the_capacity_reads():
+    def container(requests, limits=None):
+        return client.V1Container(
+            name="c", image="jupyter",
+            resources=client.V1ResourceRequirements(requests=requests,
+                                                    limits=limits))
+
+    pod = client.V1Pod(
+        metadata=client.V1ObjectMeta(name="nb-0", namespace="user",
+                                     labels={"notebook-name": "nb"}),
+        spec=client.V1PodSpec(
+            node_name="node-1",
+            containers=[container({"cpu": "1"}, {"nvidia.com/gpu": "1"}),
+                        client.V1Container(name="sidecar")],
+            init_containers=[container({"cpu": "2", "memory": "1Gi"})]),
+        status=client.V1PodStatus(phase="Running", pod_ip="10.0.0.1"))
+    pod.spec.overhead = {"cpu": "250m"}
+
+    expanded = records.PodRecord.from_object(pod).expand()
+    assert expanded.metadata.name == "nb-0"
+    assert expanded.metadata.namespace == "user"
+    assert expanded.spec.node_name == "node-1"
+    assert expanded.status.phase == "Running"
+    assert capacity.pod_requests(expanded) == capacity.pod_requests(pod)
@@ -1,2 +1,161 @@
+import os
+
 # Variables for configuring the Backend's behavior
 DEV_MODE = False
+
+# Logging: the records are written by a background thread from a queue of
+# LOG_QUEUE_SIZE records, as text or as JSON lines with LOG_FORMAT=json. Only
+# 1 in LOG_SAMPLE_RATE of the noisy messages, i.e. for every static file
+# served, is written. The dumps of specs and request bodies are logged at
+# LOG_SPEC_LEVEL, i.e. "debug" to hide them
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "info").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_RATE = int(os.environ.get("LOG_SAMPLE_RATE", "100"))
+LOG_SPEC_LEVEL = os.environ.get("LOG_SPEC_LEVEL", "info")
+
+# Watch-backed caches for the resources that the backend lists. When enabled,
+# the LIST calls are served from memory instead of hitting the API Server
+CACHE_ENABLED = os.environ.get("CACHE_ENABLED", "false") == "true"
+# Each watch is restarted after CACHE_WATCH_TIMEOUT_SECS, so that a connection
+# that silently died doesn't leave a cache stale
+CACHE_WATCH_TIMEOUT_SECS = int(os.environ.get("CACHE_WATCH_TIMEOUT_SECS",
+                                              "300"))
+
+# Optional file on local disk for warm-starting the caches after a restart.
+# The caches are snapshotted every CACHE_SNAPSHOT_PERIOD seconds. Snapshots
+# older than CACHE_SNAPSHOT_MAX_AGE_SECS are ignored
+CACHE_SNAPSHOT_FILE = os.environ.get("CACHE_SNAPSHOT_FILE", "")
+CACHE_SNAPSHOT_PERIOD = int(os.environ.get("CACHE_SNAPSHOT_PERIOD", "60"))
+CACHE_SNAPSHOT_MAX_AGE_SECS = int(
+    os.environ.get("CACHE_SNAPSHOT_MAX_AGE_SECS", "600"))
+
+# Rate limiting of the API requests. It doesn't bound the calls to the API
+# Server, since a request may make many of them. Each user gets a token bucket
+# of RATELIMIT_USER_QPS/RATELIMIT_USER_BURST, and all the requests share a
+# bucket of RATELIMIT_QPS/RATELIMIT_BURST. Requests wait for a token of the
+# shared bucket for up to RATELIMIT_MAX_WAIT seconds. A QPS of 0 disables the
+# respective limiter
+RATELIMIT_USER_QPS = float(os.environ.get("RATELIMIT_USER_QPS", "0"))
+RATELIMIT_USER_BURST = int(os.environ.get("RATELIMIT_USER_BURST", "50"))
+RATELIMIT_QPS = float(os.environ.get("RATELIMIT_QPS", "0"))
+RATELIMIT_BURST = int(os.environ.get("RATELIMIT_BURST", "100"))
+RATELIMIT_MAX_WAIT = float(os.environ.get("RATELIMIT_MAX_WAIT", "1"))
+
+# Tracing of the requests, and of the calls they make. TRACING_EXPORTER can be
+# "file", to append the spans to TRACING_FILE, or "otlp" to send them to an
+# OTLP/HTTP collector at TRACING_OTLP_ENDPOINT. Disabled if empty
+TRACING_EXPORTER = os.environ.get("TRACING_EXPORTER", "")
+TRACING_FILE = os.environ.get("TRACING_FILE", "/tmp/jwa-traces.jsonl")
+TRACING_OTLP_ENDPOINT = os.environ.get(
+    "TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+
+# Time budget of each incoming request. The calls to the API Server get the
+# remaining budget as their timeout, and are not sent if less than
+# MIN_CALL_TIMEOUT_SECS is left. A budget of 0 disables the deadlines
+REQUEST_DEADLINE_SECS = float(os.environ.get("REQUEST_DEADLINE_SECS", "30"))
+MIN_CALL_TIMEOUT_SECS = float(os.environ.get("MIN_CALL_TIMEOUT_SECS", "0.1"))
+
+# Hedged reads: idempotent LIST calls that take longer than the p95 of the
+# last calls are sent a second time, for at most HEDGE_MAX_RATIO of the calls.
+# The p95 is only used after HEDGE_MIN_SAMPLES calls
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "false") == "true"
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MAX_RATIO = float(os.environ.get("HEDGE_MAX_RATIO", "0.1"))
+HEDGE_MAX_WORKERS = int(os.environ.get("HEDGE_MAX_WORKERS", "16"))
+
+# Circuit breaker in front of the API Server. It opens when at least
+# BREAKER_ERROR_RATIO of the last BREAKER_WINDOW calls failed with a 429/5xx
+# or a timeout, given at least BREAKER_MIN_CALLS calls. While open, reads are
+# served from their last result if it's newer than BREAKER_STALE_TTL_SECS,
+# and the SubjectAccessReviews from their last decision if it's newer than
+# BREAKER_STALE_AUTH_TTL_SECS, so that a revoked permission isn't honored for
+# long. The rest fail fast. A probe call is let through after
+# BREAKER_COOLDOWN_SECS
+BREAKER_ENABLED = os.environ.get("BREAKER_ENABLED", "false") == "true"
+BREAKER_WINDOW = int(os.environ.get("BREAKER_WINDOW", "50"))
+BREAKER_MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", "20"))
+BREAKER_ERROR_RATIO = float(os.environ.get("BREAKER_ERROR_RATIO", "0.5"))
+BREAKER_COOLDOWN_SECS = float(os.environ.get("BREAKER_COOLDOWN_SECS", "10"))
+BREAKER_STALE_TTL_SECS = float(
+    os.environ.get("BREAKER_STALE_TTL_SECS", "300"))
+BREAKER_STALE_AUTH_TTL_SECS = float(
+    os.environ.get("BREAKER_STALE_AUTH_TTL_SECS", "10"))
+
+# The startup latency of a Notebook is only recorded if its container started
+# less than STARTUP_METRICS_MAX_AGE_SECS ago
+STARTUP_METRICS_MAX_AGE_SECS = int(
+    os.environ.get("STARTUP_METRICS_MAX_AGE_SECS", "3600"))
+
+# Warm pool of workspace PVCs: WARM_POOL_SIZE unclaimed PVCs, as described by
+# the workspaceVolume defaults, are kept in each of WARM_POOL_NAMESPACES (comma
+# separated) and are refilled every WARM_POOL_PERIOD seconds
+WARM_POOL_SIZE = int(os.environ.get("WARM_POOL_SIZE", "0"))
+WARM_POOL_NAMESPACES = [
+    ns for ns in os.environ.get("WARM_POOL_NAMESPACES", "").split(",") if ns]
+WARM_POOL_PERIOD = float(os.environ.get("WARM_POOL_PERIOD", "30"))
+
+# Capacity of the cluster, as served to the spawner form. It's recomputed at
+# most every CAPACITY_TTL_SECS. With CAPACITY_CHECK=true, Notebooks whose
+# requests don't fit in any node are rejected instead of staying Pending
+CAPACITY_TTL_SECS = float(os.environ.get("CAPACITY_TTL_SECS", "5"))
+CAPACITY_CHECK = os.environ.get("CAPACITY_CHECK", "false") == "true"
+
+# Namespace sharding: the backend runs as SHARD_COUNT shards, i.e. the Pods of
+# a StatefulSet, each caching the namespaces it owns on a consistent hash
+# ring. SHARD_INDEX defaults to the ordinal of the Pod's hostname. Requests for
+# namespaces owned by another shard are forwarded to SHARD_ADDRESS, with
+# '{index}' replaced by the owner's index, or rejected with that address if
+# SHARD_MODE=redirect
+SHARD_COUNT = int(os.environ.get("SHARD_COUNT", "1"))
+SHARD_INDEX = os.environ.get("SHARD_INDEX",
+                             os.environ.get("HOSTNAME", "").split("-")[-1])
+SHARD_INDEX = int(SHARD_INDEX) if SHARD_INDEX.isdigit() else 0
+SHARD_ADDRESS = os.environ.get(
+    "SHARD_ADDRESS", "http://jupyter-web-app-{index}.jupyter-web-app:5000")
+SHARD_MODE = os.environ.get("SHARD_MODE", "forward")
+SHARD_VNODES = int(os.environ.get("SHARD_VNODES", "100"))
+
+# Permission snapshots: with AUTH_RULES_REVIEW=true the rules of a user in a
+# namespace are fetched with a single SelfSubjectRulesReview, impersonating
+# the user, and answer the authorization checks for AUTH_RULES_TTL_SECS
+AUTH_RULES_REVIEW = os.environ.get("AUTH_RULES_REVIEW", "false") == "true"
+AUTH_RULES_TTL_SECS = float(os.environ.get("AUTH_RULES_TTL_SECS", "10"))
+
+# Resource usage of the Notebooks, from the metrics API. The usage of all the
+# Notebooks is sampled in the background every USAGE_SAMPLE_PERIOD_SECS and
+# the last USAGE_HISTORY_SAMPLES of each Notebook are kept. Given
+# USAGE_MIN_SAMPLES, the suggested requests are the p95 of the usage plus
+# USAGE_HEADROOM
+USAGE_SAMPLE_PERIOD_SECS = float(
+    os.environ.get("USAGE_SAMPLE_PERIOD_SECS", "15"))
+USAGE_HISTORY_SAMPLES = int(os.environ.get("USAGE_HISTORY_SAMPLES", "240"))
+USAGE_MIN_SAMPLES = int(os.environ.get("USAGE_MIN_SAMPLES", "20"))
+USAGE_HEADROOM = float(os.environ.get("USAGE_HEADROOM", "0.2"))
+
+# Idempotency keys: the responses of POSTs with an Idempotency-Key header are
+# kept for IDEMPOTENCY_TTL_SECS, for at most IDEMPOTENCY_MAX_KEYS keys, and
+# are replayed to the retries of the same request
+IDEMPOTENCY_TTL_SECS = float(os.environ.get("IDEMPOTENCY_TTL_SECS", "600"))
+IDEMPOTENCY_MAX_KEYS = int(os.environ.get("IDEMPOTENCY_MAX_KEYS", "10000"))
+
+# Per-request profiling: requests with an X-JWA-Profile header are sampled
+# every PROFILING_INTERVAL_MS, if the backend is in DEV_MODE or the user is in
+# PROFILING_USERS (comma separated). The profiles are saved in PROFILING_DIR
+# and summarize the top PROFILING_TOP functions of the api, auth and utils
+PROFILING_USERS = [
+    u for u in os.environ.get("PROFILING_USERS", "").split(",") if u]
+PROFILING_DIR = os.environ.get("PROFILING_DIR", "/tmp/jwa-profiles")
+PROFILING_INTERVAL_MS = float(os.environ.get("PROFILING_INTERVAL_MS", "1"))
+PROFILING_TOP = int(os.environ.get("PROFILING_TOP", "20"))
+
+# Encoding of the API responses: JSON_ENCODER=orjson encodes them with orjson,
+# if installed, and "json" with the json module. The JSON responses larger
+# than COMPRESSION_MIN_BYTES are gzip or brotli compressed, if the client
+# accepts it. A COMPRESSION_MIN_BYTES of 0 disables the compression
+JSON_ENCODER = os.environ.get("JSON_ENCODER", "orjson")
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+
+# The Rok UI caches the decoded Rok tokens for ROK_TOKEN_TTL_SECS, or until a
+# watch sees their secret change. A TTL of 0 disables the cache
+ROK_TOKEN_TTL_SECS = float(os.environ.get("ROK_TOKEN_TTL_SECS", "30"))
@@ -0,0 +1,163 @@
+import bisect
+import hashlib
+import http.client
+import urllib.parse
+
+from flask import Response, jsonify, request
+from . import deadline
+from . import settings
+from . import tracing
+from . import utils
+
+logger = utils.create_logger(__name__)
+
+MODE_FORWARD = "forward"
+MODE_REDIRECT = "redirect"
+
+# Set on forwarded requests, so that they are never forwarded again
+FORWARDED_HEADER = "X-JWA-Forwarded-By"
+# The shard that owns the namespace, when the request is rejected
+OWNER_HEADER = "X-JWA-Shard"
+
+# Hop-by-hop headers, which must not be copied by a proxy
+HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "host",
+    "content-length",
+}
+
+
+def hash_key(key):
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+
+class HashRing:
+    '''
+    A consistent hash ring of the shards. Each shard is placed on the ring
+    'vnodes' times, so that the namespaces are spread evenly and only about
+    1/N of them move when a shard is added or removed.
+    '''
+
+    def __init__(self, shards, vnodes):
+        points = sorted((hash_key("{}-{}".format(shard, i)), shard)
+                        for shard in range(shards) for i in range(vnodes))
+        self.keys = [k for k, _ in points]
+        self.shards = [s for _, s in points]
+
+    def owner(self, namespace):
+        i = bisect.bisect(self.keys, hash_key(namespace)) % len(self.keys)
+        return self.shards[i]
+
+
+ring = HashRing(max(settings.SHARD_COUNT, 1), settings.SHARD_VNODES)
+
+
+def enabled():
+    return settings.SHARD_COUNT > 1
+
+
+def owner(namespace):
+    return ring.owner(namespace)
+
+
+def owns(namespace):
+    '''
+    Whether this shard owns the namespace. Everything is owned when sharding
+    is disabled, and so are cluster scoped objects, with a None namespace.
+    '''
+    if not enabled() or namespace is None:
+        return True
+
+    return owner(namespace) == settings.SHARD_INDEX
+
+
+def address(shard):
+    return settings.SHARD_ADDRESS.format(index=shard)
+
+
+def route():
+    '''
+    Called before each request. Requests for a namespace of another shard are
+    forwarded to it, or rejected with its address. Returns None if the
+    request should be served here.
+    '''
+    namespace = (request.view_args or {}).get("namespace")
+    if namespace is None or owns(namespace):
+        return None
+
+    # A shard that got a forwarded request for a namespace it doesn't own,
+    # i.e. while the shards disagree on their count, serves it uncached
+    if FORWARDED_HEADER in request.headers:
+        return None
+
+    shard = owner(namespace)
+    if settings.SHARD_MODE == MODE_REDIRECT:
+        resp = jsonify({
+            "success": False,
+            "log": "Namespace {} is served by shard {}".format(namespace,
+                                                               shard),
+            "shard": address(shard),
+        })
+        resp.headers[OWNER_HEADER] = address(shard)
+        return resp, 421
+
+    return forward(address(shard))
+
+
+def forward(base_url):
+    url = urllib.parse.urlsplit(base_url + request.path)
+    path = url.path
+    if request.query_string:
+        path += "?" + request.query_string.decode("utf-8")
+
+    headers = {k: v for k, v in request.headers.items()
+               if k.lower() not in HOP_HEADERS}
+    headers[FORWARDED_HEADER] = str(settings.SHARD_INDEX)
+
+    # Like the API Server's streams, a followed log may stay idle for long,
+    # so the deadline only bounds the connection and the response's headers
+    follow = request.args.get("follow", "false") == "true"
+
+    with tracing.span("shard.forward", url=url.geturl()) as s:
+        if s is not None:
+            headers["traceparent"] = s.traceparent()
+
+        if url.scheme == "https":
+            conn_class = http.client.HTTPSConnection
+        else:
+            conn_class = http.client.HTTPConnection
+
+        timeout = deadline.call_timeout()
+        conn = conn_class(url.netloc, timeout=timeout and timeout[0])
+        try:
+            conn.request(request.method, path,
+                         body=request.get_data() or None, headers=headers)
+            # The response takes over the socket if it closes the connection
+            sock = conn.sock
+            resp = conn.getresponse()
+            if follow:
+                sock.settimeout(None)
+        except (http.client.HTTPException, OSError) as e:
+            logger.error("Error forwarding to {}: {}".format(url.geturl(),
+                                                             e))
+            tracing.set_error(str(e))
+            conn.close()
+            return jsonify({"success": False,
+                            "log": "Error forwarding the request to the"
+                                   " shard at {}".format(base_url)}), 502
+
+        # Streamed line by line, so that followed logs aren't held back
+        return Response(
+            stream_body(conn, resp),
+            status=resp.status,
+            headers=[(k, v) for k, v in resp.getheaders()
+                     if k.lower() not in HOP_HEADERS],
+        )
+
+
+def stream_body(conn, resp):
+    try:
+        for line in resp:
+            yield line
+    finally:
+        conn.close()
@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import flask
+import pytest
+
+from kubeflow_jupyter.common import deadline, settings, sharding
+
+NAMESPACES = ["user-{}".format(i) for i in range(2000)]
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeShard(BaseHTTPRequestHandler):
+    '''Answers with the path it got, after 'idle' seconds if it's followed'''
+    idle = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("X-Forwarded-By",
+                         self.headers[sharding.FORWARDED_HEADER])
+        self.end_headers()
+        self.wfile.write(b"first\n")
+        self.wfile.flush()
+        if "follow=true" in self.path:
+            time.sleep(type(self).idle)
+        self.wfile.write(self.path.encode("utf-8") + b"\n")
+
+
+@pytest.fixture
+def shard():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeShard)
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    yield "http://127.0.0.1:{}".format(server.server_address[1])
+    server.shutdown()
+
+
+@pytest.fixture
+def app():
+    app = flask.Flask(__name__)
+
+    @app.route("/api/namespaces/<namespace>/notebooks")
+    def notebooks(namespace):
+        return ""
+
+    return app
+
+
+@pytest.fixture
+def sharded(monkeypatch):
+    monkeypatch.setattr(settings, "SHARD_COUNT", 3)
+    monkeypatch.setattr(settings, "SHARD_INDEX", 0)
+    monkeypatch.setattr(sharding, "ring", sharding.HashRing(3, 100))
+
+
+def test_ring_spreads_the_namespaces():
+    ring = sharding.HashRing(4, 100)
+    counts = Counter(ring.owner(ns) for ns in NAMESPACES)
+    assert set(counts) == {0, 1, 2, 3}
+    assert all(c > len(NAMESPACES) / 4 * 0.7 for c in counts.values())
+
+
+def test_ring_moves_few_namespaces_when_growing():
+    before, after = sharding.HashRing(4, 100), sharding.HashRing(5, 100)
+    moved = [ns for ns in NAMESPACES if before.owner(ns) != after.owner(ns)]
+
+    # Only to the new shard, and about a fifth of them
+    assert all(after.owner(ns) == 4 for ns in moved)
+    assert len(moved) < len(NAMESPACES) / 5 * 1.3
+
+
+def test_owns(sharded):
+    owned = [ns for ns in NAMESPACES if sharding.owns(ns)]
+    assert 0 < len(owned) < len(NAMESPACES)
+    assert all(sharding.owner(ns) == 0 for ns in owned)
+    assert sharding.owns(None)
+
+
+def test_owns_everything_unsharded(monkeypatch):
+    monkeypatch.setattr(settings, "SHARD_COUNT", 1)
+    assert all(sharding.owns(ns) for ns in NAMESPACES)
+
+
+def test_route(sharded, app, monkeypatch):
+    monkeypatch.setattr(settings, "SHARD_MODE", sharding.MODE_REDIRECT)
+    mine = next(ns for ns in NAMESPACES if sharding.owns(ns))
+    theirs = next(ns for ns in NAMESPACES if not sharding.owns(ns))
+
+    with app.test_request_context("/api/namespaces/{}/notebooks".format(
+            mine)):
+        assert sharding.route() is None
+
+    with app.test_request_context("/api/namespaces/{}/notebooks".format(
+            theirs)):
+        resp, status = sharding.route()
+        assert status == 421
+        assert resp.headers[sharding.OWNER_HEADER] == sharding.address(
+            sharding.owner(theirs))
+
+    # Never forwarded twice
+    with app.test_request_context(
+            "/api/namespaces/{}/notebooks".format(theirs),
+            headers={sharding.FORWARDED_HEADER: "1"}):
+        assert sharding.route() is None
+
+
+def test_forward(shard, app):
+    with app.test_request_context("/api/namespaces/ns/notebooks?a=1"):
+        resp = sharding.forward(shard)
+        assert resp.status_code == 200
+        assert resp.headers["X-Forwarded-By"] == str(settings.SHARD_INDEX)
+        assert b"".join(resp.response) == (
+            b"first\n/api/namespaces/ns/notebooks?a=1\n")
+
+
+def test_forward_keeps_idle_followed_streams(shard, app, monkeypatch):
+    monkeypatch.setattr(FakeShard, "idle", 0.5)
+    monkeypatch.setattr(deadline, "call_timeout", lambda: (0.2, 0.2))
+
+    with app.test_request_context("/api/namespaces/ns/notebooks?follow=true"):
+        resp = sharding.forward(shard)
+        assert b"".join(resp.response).endswith(b"follow=true\n")
+
+
+def test_forward_error(app):
+    with app.test_request_context("/api/namespaces/ns/notebooks"):
+        _, status = sharding.forward("http://127.0.0.1:1")
+        assert status == 502
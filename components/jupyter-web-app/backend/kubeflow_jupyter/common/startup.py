@@ -0,0 +1,157 @@
+import datetime as dt
+
+from . import cache
+from . import metrics
+from . import settings
+from . import utils
+from .ttlcache import TTLCache
+
+logger = utils.create_logger(__name__)
+
+# The Notebook Controller reissues the events of the Notebook's Pod on the
+# Notebook, so the kubelet's events mark the phases of the startup
+EVENT_SCHEDULED = "Scheduled"
+EVENT_PULLING = "Pulling"
+EVENT_PULLED = "Pulled"
+
+PHASE_TOTAL = "total"
+PHASE_SCHEDULING = "scheduling"
+PHASE_IMAGE_PULL = "image_pull"
+PHASE_CONTAINER_START = "container_start"
+
+# The Notebook Controller prepends a condition to the Notebook's status each
+# time the state of its container changes
+CONDITION_RUNNING = "Running"
+CONDITION_TERMINATED = "Terminated"
+
+# Notebooks whose startup was already recorded, by uid
+MAX_OBSERVED = 100000
+observed = TTLCache(MAX_OBSERVED, 2 * settings.STARTUP_METRICS_MAX_AGE_SECS)
+
+
+def parse_time(t):
+    return dt.datetime.strptime(t, "%Y-%m-%dT%H:%M:%SZ")
+
+
+def first_event(events, reason):
+    times = [utils.event_timestamp(e) for e in events if e.reason == reason]
+    return min(times) if times else None
+
+
+def startup_phases(nb, events):
+    '''
+    Return the durations, in seconds, of the startup of a running Notebook:
+    in total, until its Pod got scheduled, pulling the image and starting the
+    container. Phases that can't be determined from the events are omitted.
+    '''
+    created = parse_time(nb["metadata"]["creationTimestamp"])
+    running = parse_time(
+        nb["status"]["containerState"]["running"]["startedAt"])
+
+    phases = {PHASE_TOTAL: running - created}
+
+    scheduled = first_event(events, EVENT_SCHEDULED)
+    if scheduled is not None:
+        phases.update(pod_phases(events, created, scheduled, running))
+
+    return {p: max(d.total_seconds(), 0) for p, d in phases.items()}
+
+
+def pod_phases(events, created, scheduled, running):
+    phases = {PHASE_SCHEDULING: scheduled - created}
+
+    # No Pulling event means that the image was already on the node
+    pulling = first_event(events, EVENT_PULLING)
+    pulled = first_event(events, EVENT_PULLED)
+    pull_done = scheduled
+    if pulling is not None and pulled is not None:
+        phases[PHASE_IMAGE_PULL] = pulled - pulling
+        pull_done = pulled
+    elif pulling is None:
+        phases[PHASE_IMAGE_PULL] = dt.timedelta(0)
+        pull_done = pulled or scheduled
+
+    phases[PHASE_CONTAINER_START] = running - pull_done
+    return phases
+
+
+def restarted(nb, pod=None):
+    '''
+    Whether the container of the Notebook ran before, i.e. it crashed or the
+    Notebook was stopped and started again. The time since the creation of
+    the Notebook isn't a startup latency then.
+    '''
+    for c in nb["status"].get("conditions", [])[1:]:
+        if c.get("type") in (CONDITION_RUNNING, CONDITION_TERMINATED):
+            return True
+
+    if pod is None or not pod.status.container_statuses:
+        return False
+
+    return any(s.restart_count > 0 for s in pod.status.container_statuses)
+
+
+def observe(nb, events, pod=None):
+    '''
+    Record the startup latency of a Notebook that is running, once per
+    Notebook. Notebooks that were created or started long ago, i.e. before
+    the backend was running, and Notebooks that restarted are ignored.
+    '''
+    uid = nb["metadata"].get("uid", nb["metadata"]["name"])
+    if observed.get(uid) is not None:
+        return
+
+    try:
+        phases = startup_phases(nb, events)
+        created = parse_time(nb["metadata"]["creationTimestamp"])
+        started = parse_time(
+            nb["status"]["containerState"]["running"]["startedAt"])
+        skip = restarted(nb, pod)
+    except (KeyError, ValueError) as e:
+        logger.warning("Can't compute startup of Notebook {}: {}".format(
+            nb["metadata"]["name"], e))
+        return
+
+    observed.set(uid, True)
+    now = dt.datetime.utcnow()
+    max_age = settings.STARTUP_METRICS_MAX_AGE_SECS
+    if skip or any((now - t).total_seconds() > max_age
+                   for t in (created, started)):
+        return
+
+    namespace = nb["metadata"]["namespace"]
+    image = nb["spec"]["template"]["spec"]["containers"][0]["image"]
+    for phase, secs in phases.items():
+        metrics.NOTEBOOK_STARTUP.labels(namespace, image, phase).observe(secs)
+
+
+def on_notebook_update(nb):
+    '''
+    Called by the notebooks cache for each Notebook its watch sees, so that
+    a startup is recorded once its container runs, whether or not the
+    Notebooks get listed. The events and the Pod are read from their caches.
+    '''
+    if not nb.get("status", {}).get("containerState", {}).get("running"):
+        return
+
+    namespace = nb["metadata"]["namespace"]
+    name = nb["metadata"]["name"]
+    created = parse_time(nb["metadata"]["creationTimestamp"])
+
+    events = []
+    events_cache = cache.get("notebook-events")
+    if events_cache is not None:
+        events = events_cache.list(
+            namespace, lambda e: e.involved_object.name == name)
+        # Events of a deleted Notebook with the same name don't count
+        events = [e for e in events if utils.event_timestamp(e) >= created]
+
+    pod = None
+    pods_cache = cache.get("pods")
+    if pods_cache is not None:
+        # The Pod is the single replica of the Notebook's StatefulSet
+        pods = pods_cache.list(
+            namespace, lambda p: p.metadata.name == name + "-0")
+        pod = pods[0] if pods else None
+
+    observe(nb, events, pod)
@@ -0,0 +1,144 @@
+import datetime as dt
+
+import pytest
+from kubernetes import client
+
+from kubeflow_jupyter.common import metrics, startup
+from kubeflow_jupyter.common.ttlcache import TTLCache
+
+FMT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+class Histogram:
+    def __init__(self):
+        self.observed = {}
+
+    def labels(self, namespace, image, phase):
+        return Observer(self.observed, phase)
+
+
+class Observer:
+    def __init__(self, observed, phase):
+        self.observed = observed
+        self.phase = phase
+
+    def observe(self, secs):
+        self.observed[self.phase] = secs
+
+
+@pytest.fixture
+def histogram(monkeypatch):
+    h = Histogram()
+    monkeypatch.setattr(metrics, "NOTEBOOK_STARTUP", h)
+    monkeypatch.setattr(startup, "observed", TTLCache(10, 60))
+    return h
+
+
+def notebook(created_ago=120, started_ago=30, conditions=("Running",)):
+    now = dt.datetime.utcnow()
+    return {
+        "metadata": {
+            "namespace": "user", "name": "nb", "uid": "1",
+            "creationTimestamp": (now - dt.timedelta(seconds=created_ago))
+            .strftime(FMT)},
+        "spec": {"template": {"spec": {"containers": [{"image": "jupyter"}]}}},
+        "status": {
+            "containerState": {"running": {
+                "startedAt": (now - dt.timedelta(seconds=started_ago))
+                .strftime(FMT)}},
+            "conditions": [{"type": c} for c in conditions],
+        },
+    }
+
+
+def event(reason, secs_after, nb):
+    created = startup.parse_time(nb["metadata"]["creationTimestamp"])
+    return client.V1Event(
+        metadata=client.V1ObjectMeta(
+            creation_timestamp=created + dt.timedelta(seconds=secs_after)),
+        involved_object=client.V1ObjectReference(name="nb"),
+        reason=reason)
+
+
+def pod(restarts):
+    return client.V1Pod(
+        metadata=client.V1ObjectMeta(name="nb-0"),
+        status=client.V1PodStatus(container_statuses=[
+            client.V1ContainerStatus(image="jupyter", image_id="", name="nb",
+                                     ready=True, restart_count=restarts)]))
+
+
+def test_startup_phases():
+    nb = notebook()
+    events = [event("Scheduled", 5, nb), event("Pulling", 10, nb),
+              event("Pulled", 70, nb)]
+
+    assert startup.startup_phases(nb, events) == {
+        "total": 90, "scheduling": 5, "image_pull": 60,
+        "container_start": 20}
+
+
+def test_startup_phases_without_pull():
+    nb = notebook()
+    phases = startup.startup_phases(nb, [event("Scheduled", 5, nb)])
+    assert phases["image_pull"] == 0
+    assert phases["container_start"] == 85
+
+
+def test_restarted():
+    assert not startup.restarted(notebook())
+    assert not startup.restarted(notebook(conditions=("Running", "Waiting")))
+    assert not startup.restarted(notebook(), pod(0))
+
+    # Stopped and started again
+    assert startup.restarted(notebook(
+        conditions=("Running", "Waiting", "Running", "Waiting")))
+    # Crashed
+    assert startup.restarted(notebook(
+        conditions=("Running", "Waiting", "Terminated", "Running")))
+    assert startup.restarted(notebook(), pod(1))
+
+
+def test_observe_once(histogram):
+    nb = notebook()
+    startup.observe(nb, [])
+    assert histogram.observed == {"total": 90}
+
+    histogram.observed.clear()
+    startup.observe(nb, [])
+    assert histogram.observed == {}
+
+
+@pytest.mark.parametrize("nb, p", [
+    (notebook(created_ago=7200, started_ago=60), None),
+    (notebook(created_ago=7200, started_ago=7100), None),
+    (notebook(conditions=("Running", "Terminated", "Running")), None),
+    (notebook(), pod(2)),
+])
+def test_observe_skips(histogram, nb, p):
+    startup.observe(nb, [], p)
+    assert histogram.observed == {}
+
+
+def test_on_notebook_update(histogram, monkeypatch):
+    nb = notebook()
+    stale = event("Scheduled", -60, nb)
+    events = [stale, event("Scheduled", 5, nb)]
+
+    class Cache:
+        def __init__(self, objs):
+            self.objs = objs
+
+        def list(self, namespace, predicate):
+            return [o for o in self.objs if predicate(o)]
+
+    caches = {"notebook-events": Cache(events), "pods": Cache([pod(0)])}
+    monkeypatch.setattr(startup.cache, "get", caches.get)
+
+    waiting = notebook()
+    waiting["status"]["containerState"] = {"waiting": {}}
+    startup.on_notebook_update(waiting)
+    assert histogram.observed == {}
+
+    startup.on_notebook_update(nb)
+    assert histogram.observed["scheduling"] == 5
@@ -0,0 +1,154 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+from flask import Response, request, send_file
+from werkzeug.exceptions import NotFound
+from . import utils
+
+logger = utils.create_logger(__name__)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# The static files of the frontend are indexed once. The small ones are kept
+# in memory, the compressible ones also gzip and brotli compressed, and the
+# rest are sent from the disk.
+INDEX = "index.html"
+
+# Files larger than this are sent from the disk, with the server's
+# wsgi.file_wrapper, i.e. sendfile
+MAX_MEMORY_BYTES = 512 * 1024
+
+# Files smaller than this aren't worth compressing. A compressed variant is
+# only kept if it's at most MAX_COMPRESSED_RATIO of the original
+MIN_COMPRESS_BYTES = 1024
+MAX_COMPRESSED_RATIO = 0.9
+COMPRESSIBLE = re.compile(
+    r"^(text/.*|application/(javascript|json|xml)|image/svg\+xml)$")
+
+# The bundles of the Angular build have a hash in their names, i.e.
+# main.8a3c0e2b4d6f8a1c3e5b.js, so they never change
+HASHED = re.compile(r"\.[0-9a-f]{16,}\.")
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDATE = "no-cache"
+
+
+def compress(data):
+    '''The compressed variants of the data that are worth keeping'''
+    variants = {"gzip": gzip.compress(data, 9)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(data, quality=11)
+
+    return {enc: v for enc, v in variants.items()
+            if len(v) <= len(data) * MAX_COMPRESSED_RATIO}
+
+
+class Asset:
+    def __init__(self, path, name):
+        self.path = path
+        self.size = os.path.getsize(path)
+        mimetype, _ = mimetypes.guess_type(name)
+        self.mimetype = mimetype or "application/octet-stream"
+        self.cache_control = CACHE_REVALIDATE
+        if HASHED.search(os.path.basename(name)):
+            self.cache_control = CACHE_IMMUTABLE
+
+        with open(path, "rb") as f:
+            data = f.read()
+        self.etag = hashlib.sha1(data).hexdigest()[:20]
+
+        self.variants = {}
+        if self.size <= MAX_MEMORY_BYTES:
+            self.variants["identity"] = data
+        if self.size >= MIN_COMPRESS_BYTES and COMPRESSIBLE.match(
+                self.mimetype):
+            self.variants.update(compress(data))
+
+    def encoding(self):
+        '''The best encoding the client accepts, identity if none'''
+        for enc in ("br", "gzip"):
+            if enc in self.variants and request.accept_encodings[enc] > 0:
+                return enc
+
+        return "identity"
+
+    def response(self):
+        enc = self.encoding()
+        if enc == "identity" and enc not in self.variants:
+            resp = send_file(self.path, mimetype=self.mimetype,
+                             conditional=True)
+        else:
+            resp = Response(self.variants[enc], mimetype=self.mimetype)
+            if enc != "identity":
+                resp.headers["Content-Encoding"] = enc
+            resp.set_etag(self.etag if enc == "identity"
+                          else "{}-{}".format(self.etag, enc))
+            resp.make_conditional(request)
+
+        resp.headers["Cache-Control"] = self.cache_control
+        if set(self.variants) - {"identity"}:
+            resp.vary.add("Accept-Encoding")
+        return resp
+
+
+class StaticFiles:
+    '''
+    The index of an app's static directory. It's built by load(), or on its
+    first use. Only the files found then are served, so the paths can't
+    escape the directory.
+    '''
+
+    def __init__(self, root):
+        self.root = root
+        self.assets = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            if self.assets is not None:
+                return
+
+            assets = {}
+            for dirpath, _, files in os.walk(self.root):
+                for f in files:
+                    path = os.path.join(dirpath, f)
+                    name = os.path.relpath(path, self.root)
+                    assets[name.replace(os.sep, "/")] = Asset(path, name)
+
+            compressed = sum(bool(set(a.variants) - {"identity"})
+                             for a in assets.values())
+            logger.info("Indexed %d static files in %s, %d compressed",
+                        len(assets), self.root, compressed)
+            self.assets = assets
+
+    def send(self, path):
+        '''Respond with the file at path, or raise NotFound'''
+        if self.assets is None:
+            self.load()
+
+        asset = self.assets.get(path)
+        if asset is None:
+            raise NotFound()
+
+        return asset.response()
+
+    def send_index(self):
+        return self.send(INDEX)
+
+
+def init_app(app):
+    '''The StaticFiles of the app's static directory'''
+    files = StaticFiles(os.path.join(app.root_path, "static"))
+    app.extensions["static_files"] = files
+    return files
+
+
+def load(app):
+    '''Index and compress the app's static files, i.e. at startup'''
+    app.extensions["static_files"].load()
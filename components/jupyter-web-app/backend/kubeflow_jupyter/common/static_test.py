@@ -0,0 +1,113 @@
+import gzip
+import types
+import zlib
+
+import flask
+import pytest
+from werkzeug.exceptions import NotFound
+
+from kubeflow_jupyter.common import static
+
+INDEX = b"<html><body>" + b"<app-root></app-root>" * 100 + b"</body></html>"
+BUNDLE = b"console.log('kubeflow');\n" * 100
+BUNDLE_NAME = "main.8a3c0e2b4d6f8a1c3e5b.js"
+
+
+def fake_brotli_compress(data, quality):
+    return b"br:" + zlib.compress(data, 9)
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    monkeypatch.setattr(static, "brotli",
+                        types.SimpleNamespace(compress=fake_brotli_compress))
+    monkeypatch.setattr(static, "MAX_MEMORY_BYTES", 64 * 1024)
+
+    (tmp_path / "index.html").write_bytes(INDEX)
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "assets" / "logo.png").write_bytes(b"\x89PNG" * 10)
+    (tmp_path / BUNDLE_NAME).write_bytes(BUNDLE)
+    (tmp_path / "large.bin").write_bytes(b"\0" * 100 * 1024)
+    return static.StaticFiles(str(tmp_path))
+
+
+@pytest.fixture
+def app():
+    return flask.Flask(__name__)
+
+
+def send(app, files, path, headers=None):
+    with app.test_request_context("/" + path, headers=headers or {}):
+        resp = files.send(path)
+        resp.direct_passthrough = False
+        return resp
+
+
+def test_index(app, files):
+    with app.test_request_context("/"):
+        resp = files.send_index()
+    assert resp.get_data() == INDEX
+    assert resp.mimetype == "text/html"
+    assert resp.headers["Cache-Control"] == static.CACHE_REVALIDATE
+
+    files.load()
+    assert set(files.assets) == {"index.html", "assets/logo.png",
+                                 BUNDLE_NAME, "large.bin"}
+    # Too small to be worth compressing
+    assert set(files.assets["assets/logo.png"].variants) == {"identity"}
+
+
+def test_unknown_paths_are_not_found(app, files):
+    for path in ("missing.js", "../index.html", "assets"):
+        with pytest.raises(NotFound):
+            send(app, files, path)
+
+
+def test_encoding_negotiation(app, files):
+    resp = send(app, files, "index.html", {"Accept-Encoding": "gzip, br"})
+    assert resp.headers["Content-Encoding"] == "br"
+    assert resp.get_data() == fake_brotli_compress(INDEX, 11)
+
+    resp = send(app, files, "index.html",
+                {"Accept-Encoding": "br;q=0, gzip"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(resp.get_data()) == INDEX
+
+    resp = send(app, files, "index.html")
+    assert "Content-Encoding" not in resp.headers
+    assert resp.get_data() == INDEX
+    assert "Accept-Encoding" in resp.vary
+
+
+def test_hashed_bundles_are_immutable(app, files):
+    resp = send(app, files, BUNDLE_NAME, {"Accept-Encoding": "gzip"})
+    assert resp.headers["Cache-Control"] == static.CACHE_IMMUTABLE
+    assert resp.mimetype in ("application/javascript", "text/javascript")
+    assert gzip.decompress(resp.get_data()) == BUNDLE
+
+
+def test_etag_per_encoding(app, files):
+    plain = send(app, files, "index.html")
+    gzipped = send(app, files, "index.html", {"Accept-Encoding": "gzip"})
+    etag, _ = plain.get_etag()
+    gzip_etag, _ = gzipped.get_etag()
+    assert gzip_etag == etag + "-gzip"
+
+    resp = send(app, files, "index.html", {"If-None-Match": '"%s"' % etag})
+    assert resp.status_code == 304
+
+    # The ETag of another encoding doesn't match
+    resp = send(app, files, "index.html", {"If-None-Match": '"%s"' % etag,
+                                           "Accept-Encoding": "gzip"})
+    assert resp.status_code == 200
+
+
+def test_large_files_are_sent_from_the_disk(app, files):
+    files.load()
+    asset = files.assets["large.bin"]
+    assert "identity" not in asset.variants
+
+    resp = send(app, files, "large.bin")
+    assert resp.status_code == 200
+    assert resp.get_data() == b"\0" * 100 * 1024
+    assert resp.headers["Cache-Control"] == static.CACHE_REVALIDATE
@@ -0,0 +1,298 @@
+import contextlib
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.request
+
+from . import settings
+
+# utils imports this module, so we can't use utils.create_logger here
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "jupyter-web-app"
+EXPORT_BATCH_SIZE = 512
+EXPORT_PERIOD_SECS = 5
+
+# OTLP status codes
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# The span of the current request/call, per thread
+local = threading.local()
+
+
+def now_ns():
+    return int(time.time() * 1e9)
+
+
+def current_span():
+    return getattr(local, "span", None)
+
+
+class Span:
+    '''
+    A timed operation, modeled after the OpenTelemetry spans. Spans of the
+    same request share a trace_id and are linked with their parent_id.
+    '''
+
+    def __init__(self, name, trace_id=None, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.status = STATUS_OK
+        self.message = ""
+        self.start = now_ns()
+        self.end = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, message):
+        self.status = STATUS_ERROR
+        self.message = message
+
+    def traceparent(self):
+        '''The W3C traceparent header to continue this trace downstream'''
+        return "00-{}-{}-01".format(self.trace_id, self.span_id)
+
+    def finish(self):
+        self.end = now_ns()
+        exporter.export(self)
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": [
+                {"key": k, "value": {"stringValue": str(v)}}
+                for k, v in self.attributes.items()
+            ],
+            "status": {"code": self.status, "message": self.message},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+
+        return span
+
+
+class Exporter:
+    '''
+    Exports the finished spans in a background thread, in batches, in the
+    OTLP/JSON format. Spans are written as one JSON line per batch to a local
+    file, or POSTed to an OTLP/HTTP collector.
+    '''
+
+    def __init__(self, kind, target):
+        self.kind = kind
+        self.target = target
+        self.queue = queue.Queue(maxsize=EXPORT_BATCH_SIZE * 10)
+
+    def export(self, span):
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            logger.warning("Dropping span '{}', export queue is full".format(
+                span.name))
+
+    def start(self):
+        t = threading.Thread(target=self.run, name="trace-exporter",
+                             daemon=True)
+        t.start()
+
+    def run(self):
+        while True:
+            spans = [self.queue.get()]
+            deadline = time.monotonic() + EXPORT_PERIOD_SECS
+            while len(spans) < EXPORT_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    spans.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            try:
+                self.write(spans)
+            except Exception as e:
+                logger.error("Couldn't export {} spans: {}".format(len(spans),
+                                                                   e))
+
+    def flush(self):
+        spans = []
+        while not self.queue.empty():
+            spans.append(self.queue.get_nowait())
+        if spans:
+            self.write(spans)
+
+    def write(self, spans):
+        data = json.dumps(otlp_payload(spans))
+
+        if self.kind == "file":
+            with open(self.target, "a") as f:
+                f.write(data + "\n")
+            return
+
+        req = urllib.request.Request(
+            self.target,
+            data=data.encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            resp.read()
+
+
+class NoopExporter:
+    def export(self, span):
+        pass
+
+    def start(self):
+        pass
+
+    def flush(self):
+        pass
+
+
+def otlp_payload(spans):
+    return {
+        "resourceSpans": [{
+            "resource": {
+                "attributes": [{
+                    "key": "service.name",
+                    "value": {"stringValue": SERVICE_NAME},
+                }],
+            },
+            "scopeSpans": [{
+                "scope": {"name": "kubeflow_jupyter"},
+                "spans": [s.to_otlp() for s in spans],
+            }],
+        }],
+    }
+
+
+def create_exporter():
+    if settings.TRACING_EXPORTER == "file":
+        return Exporter("file", settings.TRACING_FILE)
+    if settings.TRACING_EXPORTER == "otlp":
+        return Exporter("otlp", settings.TRACING_OTLP_ENDPOINT)
+    if settings.TRACING_EXPORTER:
+        logger.warning("Unknown TRACING_EXPORTER '{}'. Tracing is disabled"
+                       .format(settings.TRACING_EXPORTER))
+
+    return NoopExporter()
+
+
+exporter = create_exporter()
+
+
+def enabled():
+    return not isinstance(exporter, NoopExporter)
+
+
+def start():
+    exporter.start()
+
+
+# Creating spans
+def start_span(name, attributes=None, traceparent=None):
+    '''
+    Start a span as a child of the current one and make it current. A W3C
+    traceparent header can be given to continue a trace of the caller.
+    Returns the span and the previously current span, for end_span.
+    '''
+    parent = current_span()
+    trace_id, parent_id = None, None
+    if parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    elif traceparent:
+        trace_id, parent_id = parse_traceparent(traceparent)
+
+    s = Span(name, trace_id, parent_id, attributes)
+    local.span = s
+    return s, parent
+
+
+def end_span(s, previous):
+    local.span = previous
+    s.finish()
+
+
+@contextlib.contextmanager
+def use_span(s):
+    '''
+    Make s the current span of this thread, i.e. of a worker thread that runs
+    a call for the request that started s.
+    '''
+    previous = current_span()
+    local.span = s
+    try:
+        yield s
+    finally:
+        local.span = previous
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    if not enabled():
+        yield None
+        return
+
+    s, previous = start_span(name, attributes)
+    try:
+        yield s
+    except Exception as e:
+        s.set_error(str(e))
+        raise
+    finally:
+        end_span(s, previous)
+
+
+def set_error(message):
+    '''Mark the current span as failed'''
+    s = current_span()
+    if s is not None:
+        s.set_error(message)
+
+
+def traced(name, *params):
+    '''
+    Decorator that runs the function inside a span. The values of the
+    function's arguments named in 'params' are recorded as span attributes.
+    '''
+    def wrapper(func):
+        sig = inspect.signature(func)
+
+        @functools.wraps(func)
+        def runner(*args, **kwargs):
+            if not enabled():
+                return func(*args, **kwargs)
+
+            bound = sig.bind(*args, **kwargs).arguments
+            attrs = {p: bound.get(p) for p in params}
+            with span(name, **attrs):
+                return func(*args, **kwargs)
+
+        return runner
+
+    return wrapper
+
+
+def parse_traceparent(header):
+    # version-traceid-parentid-flags
+    parts = header.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+
+    return parts[1], parts[2]
@@ -0,0 +1,121 @@
+import json
+
+import flask
+import pytest
+
+from kubeflow_jupyter.common import (api, base_app, deadline, settings,
+                                     tracing)
+
+TRACE_ID = "0af7651916cd43dd8448eb211c80319c"
+PARENT_ID = "b7ad6b7169203331"
+
+
+def list_things(_request_timeout=None):
+    with tracing.span("inner"):
+        return ["thing"]
+
+
+@pytest.fixture
+def exported(tmp_path, monkeypatch):
+    '''The spans written by the file exporter, by name'''
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing, "exporter",
+                        tracing.Exporter("file", str(path)))
+
+    def spans():
+        tracing.exporter.flush()
+        lines = path.read_text().splitlines()
+        payloads = [json.loads(line) for line in lines]
+        return payloads, {s["name"]: s for p in payloads
+                          for s in p["resourceSpans"][0]["scopeSpans"][0][
+                              "spans"]}
+
+    return spans
+
+
+@pytest.fixture
+def client():
+    app = flask.Flask(__name__)
+    app.before_request(base_app.start_request_span)
+    app.after_request(base_app.set_request_span_status)
+    app.teardown_request(base_app.end_request_span)
+
+    @app.route("/api/namespaces/<namespace>/things")
+    def things(namespace):
+        data = api.wrap_resp("things", list_things)
+        return flask.jsonify(data["things"])
+
+    @app.route("/api/namespaces/<namespace>/hedged")
+    def hedged(namespace):
+        data = api.wrap_resp("things", deadline.hedged(list_things))
+        return flask.jsonify(data["things"])
+
+    return app.test_client()
+
+
+def test_request_spans(client, exported):
+    resp = client.get("/api/namespaces/ns/things",
+                      headers={"traceparent": "00-{}-{}-01".format(
+                          TRACE_ID, PARENT_ID)})
+    assert resp.get_json() == ["thing"]
+
+    payloads, spans = exported()
+    root = spans["GET /api/namespaces/<namespace>/things"]
+    call = spans["k8s.list_things"]
+    inner = spans["inner"]
+    assert {s["traceId"] for s in spans.values()} == {TRACE_ID}
+    assert root["parentSpanId"] == PARENT_ID
+    assert call["parentSpanId"] == root["spanId"]
+    assert inner["parentSpanId"] == call["spanId"]
+    assert tracing.current_span() is None
+
+    # OTLP/JSON
+    resource = payloads[0]["resourceSpans"][0]["resource"]
+    assert resource["attributes"] == [{
+        "key": "service.name",
+        "value": {"stringValue": tracing.SERVICE_NAME}}]
+    assert len(root["spanId"]) == 16
+    assert int(root["startTimeUnixNano"]) <= int(call["startTimeUnixNano"])
+    assert int(call["endTimeUnixNano"]) <= int(root["endTimeUnixNano"])
+    assert root["status"] == {"code": tracing.STATUS_OK, "message": ""}
+    assert {"key": "http.status_code", "value": {"stringValue": "200"}} \
+        in root["attributes"]
+    assert {"key": "resource", "value": {"stringValue": "things"}} \
+        in call["attributes"]
+
+
+def test_request_without_traceparent(client, exported):
+    client.get("/api/namespaces/ns/things")
+
+    _, spans = exported()
+    root = spans["GET /api/namespaces/<namespace>/things"]
+    assert "parentSpanId" not in root
+    assert spans["inner"]["traceId"] == root["traceId"]
+
+
+def test_hedged_calls_keep_their_parent(client, exported, monkeypatch):
+    monkeypatch.setattr(settings, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(deadline.LatencyTracker, "p95", lambda self: 10)
+
+    client.get("/api/namespaces/ns/hedged")
+
+    _, spans = exported()
+    # The call ran in one of the executor's threads
+    assert spans["inner"]["parentSpanId"] == spans["k8s.list_things"][
+        "spanId"]
+
+
+def test_errors_are_recorded(exported):
+    with pytest.raises(RuntimeError):
+        with tracing.span("failing"):
+            raise RuntimeError("boom")
+
+    _, spans = exported()
+    assert spans["failing"]["status"] == {"code": tracing.STATUS_ERROR,
+                                          "message": "boom"}
+
+
+def test_parse_traceparent():
+    assert tracing.parse_traceparent(
+        "00-{}-{}-01".format(TRACE_ID, PARENT_ID)) == (TRACE_ID, PARENT_ID)
+    assert tracing.parse_traceparent("garbage") == (None, None)
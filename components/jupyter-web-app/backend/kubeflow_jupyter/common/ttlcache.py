@@ -0,0 +1,55 @@
+import collections
+import threading
+import time
+
+
+class TTLCache:
+    '''
+    A thread-safe dict whose entries expire after 'ttl' seconds. It holds at
+    most 'maxsize' entries, the least recently set ones are dropped first.
+    '''
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def set(self, key, value):
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = (time.monotonic(), value)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def get(self, key, default=None):
+        '''Return the value of a key, or default if missing or expired'''
+        value, _ = self.get_with_age(key)
+        return default if value is None else value
+
+    def get_with_age(self, key):
+        '''Return (value, seconds since it was set), or (None, None)'''
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                return None, None
+
+            age = time.monotonic() - entry[0]
+            if age > self.ttl:
+                del self.data[key]
+                return None, None
+
+            return entry[1], age
+
+    def pop(self, key, default=None):
+        with self.lock:
+            entry = self.data.pop(key, None)
+
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
@@ -0,0 +1,197 @@
+import collections
+import math
+import threading
+import time
+
+from kubernetes.client.rest import ApiException
+from . import api
+from . import auth
+from . import capacity
+from . import settings
+from . import sharding
+from . import utils
+
+logger = utils.create_logger(__name__)
+
+# The Notebook Controller labels the Notebook's Pod with its name
+NOTEBOOK_LABEL = "notebook-name"
+
+# Number of Notebooks with a usage history, the least recently sampled ones
+# are dropped first
+MAX_TRACKED_NOTEBOOKS = 10000
+
+# namespace -> the usage of its Notebooks, as of the last sample
+latest = {}
+
+
+class UsageHistory:
+    '''The last samples of the CPU (cores) and memory (bytes) of a Notebook'''
+
+    def __init__(self):
+        self.samples = collections.deque(
+            maxlen=settings.USAGE_HISTORY_SAMPLES)
+        self.last_timestamp = None
+
+    def add(self, timestamp, cpu, memory):
+        # The metrics API serves the same sample until its next scrape
+        if timestamp is not None and timestamp == self.last_timestamp:
+            return
+
+        self.last_timestamp = timestamp
+        self.samples.append((cpu, memory))
+
+    def percentile(self, index, q):
+        values = sorted(s[index] for s in self.samples)
+        return values[max(math.ceil(len(values) * q) - 1, 0)]
+
+    def recommend(self):
+        '''
+        The suggested CPU and memory requests, formatted like the spawner's
+        form values, or None if there aren't enough samples yet
+        '''
+        if len(self.samples) < settings.USAGE_MIN_SAMPLES:
+            return None
+
+        headroom = 1 + settings.USAGE_HEADROOM
+        cpu = self.percentile(0, 0.95) * headroom
+        memory = self.percentile(1, 0.95) * headroom / 2**30
+        return {
+            "cpu": round_up(cpu),
+            "memory": round_up(memory) + "Gi",
+        }
+
+
+histories = collections.OrderedDict()
+histories_lock = threading.Lock()
+
+
+def round_up(value):
+    '''Round up to a tenth, i.e. 0.23 -> "0.3", as used in the form'''
+    return "{:.1f}".format(max(math.ceil(value * 10) / 10, 0.1))
+
+
+def history(namespace, notebook):
+    key = (namespace, notebook)
+    with histories_lock:
+        h = histories.pop(key, None) or UsageHistory()
+        histories[key] = h
+        while len(histories) > MAX_TRACKED_NOTEBOOKS:
+            histories.popitem(last=False)
+
+    return h
+
+
+def notebook_of(pod_metrics):
+    meta = pod_metrics["metadata"]
+    name = (meta.get("labels") or {}).get(NOTEBOOK_LABEL)
+    if name is None and meta["name"].endswith("-0"):
+        name = meta["name"][:-2]
+
+    return name
+
+
+def record(namespace, items):
+    '''
+    Add the PodMetrics of the namespace's Notebooks to their histories and
+    return their current usage and suggested requests
+    '''
+    notebooks = {}
+    for item in items:
+        name = notebook_of(item)
+        cntr = next((c for c in item.get("containers", [])
+                     if c["name"] == name), None)
+        if cntr is None:
+            continue
+
+        try:
+            cpu = float(capacity.parse_quantity(cntr["usage"]["cpu"]))
+            memory = float(capacity.parse_quantity(cntr["usage"]["memory"]))
+        except (KeyError, ValueError) as e:
+            logger.warning("Invalid metrics for Notebook {}/{}: {}".format(
+                namespace, name, e))
+            continue
+
+        h = history(namespace, name)
+        h.add(item.get("timestamp"), cpu, memory)
+        notebooks[name] = {
+            "cpu": cpu,
+            "memory": memory,
+            "samples": len(h.samples),
+            "recommended": h.recommend(),
+        }
+
+    return {
+        "notebooks": notebooks,
+        "recommended": namespace_recommendation(notebooks.values()),
+    }
+
+
+def namespace_recommendation(notebooks):
+    '''The largest suggestion across the Notebooks, for new ones'''
+    recs = [nb["recommended"] for nb in notebooks if nb["recommended"]]
+    if not recs:
+        return None
+
+    return {
+        "cpu": max(recs, key=lambda r: float(r["cpu"]))["cpu"],
+        "memory": max(recs, key=lambda r: float(r["memory"][:-2]))["memory"],
+    }
+
+
+def sample():
+    '''
+    Read the usage of all the Notebooks from the metrics API, with a single
+    LIST, and record it for the namespaces this shard owns
+    '''
+    global latest
+
+    metrics = api.custom_api.list_cluster_custom_object(
+        "metrics.k8s.io", "v1beta1", "pods", label_selector=NOTEBOOK_LABEL)
+
+    items = collections.defaultdict(list)
+    for item in metrics["items"]:
+        namespace = item["metadata"]["namespace"]
+        if sharding.owns(namespace):
+            items[namespace].append(item)
+
+    latest = {namespace: record(namespace, ns_items)
+              for namespace, ns_items in items.items()}
+
+
+def sample_loop(period):
+    while True:
+        try:
+            sample()
+        except ApiException as e:
+            logger.error("Error reading the usage of the Notebooks: {}"
+                         .format(api.parse_error(e)))
+        except Exception as e:
+            logger.error("Error reading the usage of the Notebooks: {}"
+                         .format(e))
+
+        time.sleep(period)
+
+
+@auth.needs_authorization("list", "metrics.k8s.io", "v1beta1", "pods")
+def namespace_usage(namespace):
+    '''
+    The usage of the namespace's Notebooks, as of the last sample, and the
+    requests suggested from their history
+    '''
+    usage = latest.get(namespace)
+    if usage is None:
+        usage = {"notebooks": {}, "recommended": None}
+
+    return {"success": True, "log": "", "usage": usage}
+
+
+def start():
+    '''
+    Start sampling the usage of the Notebooks. The samples are taken at a
+    steady period, so that the history doesn't depend on how often the
+    usage is read.
+    '''
+    t = threading.Thread(target=sample_loop, name="usage",
+                         args=(settings.USAGE_SAMPLE_PERIOD_SECS,),
+                         daemon=True)
+    t.start()
@@ -0,0 +1,94 @@
+import collections
+
+import pytest
+
+from kubeflow_jupyter.common import api, auth, settings, sharding, usage
+
+
+def pod_metrics(namespace, notebook, cpu, memory, timestamp="t1"):
+    return {
+        "metadata": {"namespace": namespace, "name": notebook + "-0",
+                     "labels": {usage.NOTEBOOK_LABEL: notebook}},
+        "timestamp": timestamp,
+        "containers": [
+            {"name": notebook, "usage": {"cpu": cpu, "memory": memory}},
+            {"name": "istio-proxy", "usage": {"cpu": "1", "memory": "1Gi"}},
+        ],
+    }
+
+
+@pytest.fixture
+def histories(monkeypatch):
+    monkeypatch.setattr(usage, "histories", collections.OrderedDict())
+    monkeypatch.setattr(usage, "latest", {})
+    monkeypatch.setattr(settings, "USAGE_MIN_SAMPLES", 3)
+    monkeypatch.setattr(settings, "USAGE_HEADROOM", 0.2)
+
+
+def test_history_skips_repeated_samples(histories):
+    h = usage.UsageHistory()
+    h.add("t1", 1, 1)
+    h.add("t1", 1, 1)
+    h.add("t2", 2, 2)
+    assert list(h.samples) == [(1, 1), (2, 2)]
+
+
+def test_recommend(histories):
+    h = usage.UsageHistory()
+    for i, cpu in enumerate([0.1, 0.5, 0.2]):
+        assert h.recommend() is None
+        h.add(i, cpu, 2**30)
+
+    assert h.recommend() == {"cpu": "0.6", "memory": "1.2Gi"}
+
+
+def test_notebook_of():
+    assert usage.notebook_of(pod_metrics("ns", "nb", "1", "1Gi")) == "nb"
+    unlabelled = {"metadata": {"name": "other-0"}}
+    assert usage.notebook_of(unlabelled) == "other"
+
+
+def test_sample_records_the_owned_namespaces(histories, monkeypatch):
+    items = [pod_metrics("mine", "a", "500m", "1Gi"),
+             pod_metrics("mine", "b", "1", "2Gi"),
+             pod_metrics("theirs", "c", "1", "2Gi")]
+    calls = []
+
+    def list_metrics(group, version, plural, label_selector):
+        calls.append(label_selector)
+        return {"items": items}
+
+    monkeypatch.setattr(api.custom_api, "list_cluster_custom_object",
+                        list_metrics)
+    monkeypatch.setattr(sharding, "owns", lambda ns: ns == "mine")
+
+    usage.sample()
+
+    assert calls == [usage.NOTEBOOK_LABEL]
+    assert set(usage.latest) == {"mine"}
+    notebooks = usage.latest["mine"]["notebooks"]
+    assert notebooks["a"]["cpu"] == 0.5
+    assert notebooks["b"]["memory"] == 2 * 2**30
+    assert set(usage.histories) == {("mine", "a"), ("mine", "b")}
+
+
+def test_namespace_usage_reads_the_last_sample(histories, monkeypatch):
+    monkeypatch.setattr(auth, "is_authorized", lambda *args: True)
+    monkeypatch.setattr(usage.utils, "get_username_from_request",
+                        lambda: "alice")
+    usage.latest["mine"] = {"notebooks": {"a": {}}, "recommended": None}
+
+    data = usage.namespace_usage(namespace="mine")
+    assert data["usage"]["notebooks"] == {"a": {}}
+
+    data = usage.namespace_usage(namespace="other")
+    assert data["usage"] == {"notebooks": {}, "recommended": None}
+
+
+def test_namespace_recommendation():
+    recs = [{"recommended": {"cpu": "0.5", "memory": "2.0Gi"}},
+            {"recommended": {"cpu": "1.5", "memory": "1.0Gi"}},
+            {"recommended": None}]
+    assert usage.namespace_recommendation(recs) == {"cpu": "1.5",
+                                                    "memory": "2.0Gi"}
+    assert usage.namespace_recommendation([{"recommended": None}]) is None
@@ -2,7 +2,6 @@ import datetime as dt
 import json
 import logging
 import os
-import sys
 
 import yaml
 from collections import defaultdict
@@ -10,6 +9,9 @@ from flask import request
 from kubernetes import client
 
 from . import api
+from . import logs
+from . import settings
+from . import tracing
 
 # The backend will send the first config it will successfully load
 CONFIGS = [
@@ -32,15 +34,9 @@ STATUS_WAITING = "waiting"
 
 # Logging
 def create_logger(name):
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setFormatter(
-        logging.Formatter(
-            "%(asctime)s | %(name)s | %(levelname)s | %(message)s"
-        )
-    )
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    logger.addHandler(handler)
+    logger.setLevel(settings.LOG_LEVEL)
+    logger.addHandler(logs.handler)
     return logger
 
 
@@ -64,6 +60,7 @@ def get_username_from_request():
     return username
 
 
+@tracing.traced("utils.load_param_yaml")
 def load_param_yaml(f, **kwargs):
     c = None
     try:
@@ -85,6 +82,7 @@ def load_param_yaml(f, **kwargs):
         return None
 
 
+@tracing.traced("utils.spawner_ui_config")
 def spawner_ui_config():
     for config in CONFIGS:
         c = None
@@ -101,7 +99,8 @@ def spawner_ui_config():
                 return {}
             else:
                 # YAML exists and is not empty
-                logger.info("Sending config file '{}'".format(config))
+                logger.info("Sending config file '%s'", config,
+                            extra={"sampled": True})
                 return yaml.safe_load(c)["spawnerFormDefaults"]
         except yaml.YAMLError:
             logger.error("Notebook config is not a valid yaml")
@@ -159,6 +158,19 @@ def handle_storage_class(vol):
         return vol["class"]
 
 
+# The annotations that mark the default StorageClass
+DEFAULT_STORAGE_CLASS_ANNOTATIONS = [
+    "storageclass.kubernetes.io/is-default-class",
+    "storageclass.beta.kubernetes.io/is-default-class"  # GKE
+]
+
+
+def is_default_storage_class(sc):
+    annotations = sc.metadata.annotations or {}
+    return any(annotations.get(key, "false") == "true"
+               for key in DEFAULT_STORAGE_CLASS_ANNOTATIONS)
+
+
 # Volume handling functions
 def volume_from_config(config_vol, notebook):
     """
@@ -209,13 +221,13 @@ def get_workspace_vol(body, defaults):
 
     if defaults["workspaceVolume"].get("readOnly", False):
         ws = default_ws
-        logger.info("Using the default Workspace Volume: {}".format(ws))
+        logger.info("Using the default Workspace Volume: %s", ws)
     elif form_ws is not None:
         ws = form_ws
-        logger.info("Using form's Workspace Volume: {}".format(ws))
+        logger.info("Using form's Workspace Volume: %s", ws)
     else:
         ws = default_ws
-        logger.info("Using the default Workspace Volume: {}".format(ws))
+        logger.info("Using the default Workspace Volume: %s", ws)
 
     return ws
 
@@ -235,13 +247,13 @@ def get_data_vols(body, defaults):
 
     if defaults["dataVolumes"].get("readOnly", False):
         vols = default_vols
-        logger.info("Using the default Data Volumes: {}".format(vols))
+        logger.info("Using the default Data Volumes: %s", vols)
     elif "datavols" in body:
         vols = form_vols
-        logger.info("Using the form's Data Volumes: {}".format(vols))
+        logger.info("Using the form's Data Volumes: %s", vols)
     else:
         vols = default_vols
-        logger.info("Using the default Data Volumes: {}".format(vols))
+        logger.info("Using the default Data Volumes: %s", vols)
 
     return vols
 
@@ -334,6 +346,41 @@ def event_timestamp(event):
     return event.metadata.creation_timestamp.replace(tzinfo=None)
 
 
+# Streaming responses
+STREAM_CHUNK_SIZE = 4096
+
+
+def stream_chunks(resp):
+    '''
+    Yield the body of a urllib3 response as it arrives, without reading all
+    of it in memory, and release the connection once done
+    '''
+    try:
+        for chunk in resp.stream(STREAM_CHUNK_SIZE, decode_content=True):
+            yield chunk
+    finally:
+        resp.release_conn()
+
+
+def stream_lines(resp):
+    '''Yield the lines of a streamed urllib3 response, without the newline'''
+    partial = b""
+    for chunk in stream_chunks(resp):
+        lines = (partial + chunk).split(b"\n")
+        partial = lines.pop()
+        for line in lines:
+            yield line
+
+    if partial:
+        yield partial
+
+
+def sse_events(lines):
+    '''Format each line as a Server-Sent Event'''
+    for line in lines:
+        yield b"data: " + line + b"\n\n"
+
+
 # Notebook YAML processing
 def set_notebook_image(notebook, body, defaults):
     """
@@ -341,16 +388,16 @@ def set_notebook_image(notebook, body, defaults):
     """
     if defaults["image"].get("readOnly", False):
         image = defaults["image"]["value"]
-        logger.info("Using default Image: " + image)
+        logger.info("Using default Image: %s", image)
     elif body.get("customImageCheck", False):
         image = body["customImage"]
-        logger.info("Using form's custom Image: " + image)
+        logger.info("Using form's custom Image: %s", image)
     elif "image" in body:
         image = body["image"]
-        logger.info("Using form's Image: " + image)
+        logger.info("Using form's Image: %s", image)
     else:
         image = defaults["image"]["value"]
-        logger.info("Using default Image: " + image)
+        logger.info("Using default Image: %s", image)
 
     notebook["spec"]["template"]["spec"]["containers"][0]["image"] = image
 
@@ -360,13 +407,13 @@ def set_notebook_cpu(notebook, body, defaults):
 
     if defaults["cpu"].get("readOnly", False):
         cpu = defaults["cpu"]["value"]
-        logger.info("Using default CPU: " + cpu)
+        logger.info("Using default CPU: %s", cpu)
     elif body.get("cpu", ""):
         cpu = body["cpu"]
-        logger.info("Using form's CPU: " + cpu)
+        logger.info("Using form's CPU: %s", cpu)
     else:
         cpu = defaults["cpu"]["value"]
-        logger.info("Using default CPU: " + cpu)
+        logger.info("Using default CPU: %s", cpu)
 
     container["resources"]["requests"]["cpu"] = cpu
 
@@ -376,13 +423,13 @@ def set_notebook_memory(notebook, body, defaults):
 
     if defaults["memory"].get("readOnly", False):
         memory = defaults["memory"]["value"]
-        logger.info("Using default Memory: " + memory)
+        logger.info("Using default Memory: %s", memory)
     elif body.get("memory", ""):
         memory = body["memory"]
-        logger.info("Using form's Memory: " + memory)
+        logger.info("Using form's Memory: %s", memory)
     else:
         memory = defaults["memory"]["value"]
-        logger.info("Using default Memory: " + memory)
+        logger.info("Using default Memory: %s", memory)
 
     container["resources"]["requests"]["memory"] = memory
 
@@ -394,7 +441,7 @@ def set_notebook_gpus(notebook, body, defaults):
         # The server should not allow the user to set the GPUs
         # if the config's value is readOnly. Use the config's value
         gpus = gpuDefaults["value"]
-        logger.info(f"Using default GPU config: {gpus}")
+        logger.info("Using default GPU config: %s", gpus)
 
     elif "gpus" not in body:
         # Try to load the default values. If they don't exist, don't use GPUs
@@ -406,12 +453,12 @@ def set_notebook_gpus(notebook, body, defaults):
             return
         else:
             gpus = gpuDefaults["value"]
-            logger.info(f"Using default GPU config: {gpus}")
+            logger.info("Using default GPU config: %s", gpus)
 
     else:
         # Make sure the GPUs value in the request is properly formatted
         gpus = body["gpus"]
-        logger.info(f"Using form's GPUs: {gpus}")
+        logger.info("Using form's GPUs: %s", gpus)
 
         if "num" not in gpus:
             logger.error("'gpus' must have a 'num' field")
@@ -447,13 +494,13 @@ def set_notebook_configurations(notebook, body, defaults):
 
     if defaults["configurations"].get("readOnly", False):
         labels = defaults["configurations"]["value"]
-        logger.info("Using default Configurations: {}".format(labels))
+        logger.info("Using default Configurations: %s", labels)
     elif body.get("configurations", None) is not None:
         labels = body["configurations"]
-        logger.info("Using form's Configurations: {}".format(labels))
+        logger.info("Using form's Configurations: %s", labels)
     else:
         labels = defaults["configurations"]["value"]
-        logger.info("Using default Configurations: {}".format(labels))
+        logger.info("Using default Configurations: %s", labels)
 
     if not isinstance(labels, list):
         logger.warning(
@@ -471,13 +518,13 @@ def set_notebook_extra_resources(notebook, body, defaults):
 
     if defaults["extraResources"].get("readOnly", False):
         resources_str = defaults["extraResources"]["value"]
-        logger.info("Using the default Extra Resources: " + resources_str)
+        logger.info("Using the default Extra Resources: %s", resources_str)
     elif body.get("extra", ""):
         resources_str = body["extra"]
-        logger.info("Using the form's Extra Resources: " + resources_str)
+        logger.info("Using the form's Extra Resources: %s", resources_str)
     else:
         resources_str = defaults["extraResources"]["value"]
-        logger.info("Using the default Extra Resources: " + resources_str)
+        logger.info("Using the default Extra Resources: %s", resources_str)
 
     try:
         extra = json.loads(resources_str)
@@ -0,0 +1,241 @@
+import hashlib
+import itertools
+import threading
+
+from kubernetes.client.rest import ApiException
+from . import api
+from . import auth
+from . import settings
+from . import sharding
+from . import utils
+
+logger = utils.create_logger(__name__)
+
+# Pooled PVCs are labelled as available until a Notebook claims them. The key
+# label identifies the size, access mode and StorageClass of the PVC, so that
+# PVCs made from older defaults aren't handed out
+POOL_LABEL = "notebooks.kubeflow.org/warm-pool"
+POOL_KEY_LABEL = "notebooks.kubeflow.org/warm-pool-key"
+CLAIMED_BY_ANNOTATION = "notebooks.kubeflow.org/claimed-by"
+AVAILABLE = "available"
+CLAIMED = "claimed"
+WAIT_FOR_FIRST_CONSUMER = "WaitForFirstConsumer"
+
+# Wakes up the refill loop right after a claim
+claimed_event = threading.Event()
+
+
+def enabled(namespace=None):
+    if settings.WARM_POOL_SIZE <= 0:
+        return False
+
+    return namespace is None or namespace in settings.WARM_POOL_NAMESPACES
+
+
+def is_available(pvc):
+    labels = pvc.metadata.labels or {}
+    return labels.get(POOL_LABEL) == AVAILABLE
+
+
+def pool_key(vol):
+    key = "{}/{}/{}".format(vol["size"], vol["mode"],
+                            utils.handle_storage_class(vol))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:10]
+
+
+def pool_volume(defaults):
+    '''
+    The Volume Dict of the pooled PVCs, from the workspaceVolume defaults.
+    Their names follow the default name, with 'pool-' as the Notebook name,
+    and end with the pool key and an index.
+    '''
+    return utils.volume_from_config(defaults["workspaceVolume"]["value"],
+                                    {"name": "pool-"})
+
+
+def selector(key, state=AVAILABLE):
+    if state is None:
+        return "{}={}".format(POOL_KEY_LABEL, key)
+
+    return "{}={},{}={}".format(POOL_LABEL, state, POOL_KEY_LABEL, key)
+
+
+def list_available(namespace, key, **kwargs):
+    pvcs = api.v1_core.list_namespaced_persistent_volume_claim(
+        namespace, label_selector=selector(key), **kwargs).items
+
+    # Prefer the PVCs that are already bound to a volume, then the oldest
+    return sorted(pvcs, key=lambda p: (p.status.phase != "Bound",
+                                       p.metadata.creation_timestamp))
+
+
+def pvc_names(vol, key, taken):
+    '''The names of the pool's PVCs that aren't taken, in order'''
+    names = ("{}{}-{}".format(vol["name"], key, i) for i in itertools.count())
+    return (name for name in names if name not in taken)
+
+
+def fill(namespace, vol):
+    '''
+    Create the PVCs missing from the namespace's pool. Each missing PVC gets
+    the first free name of the pool, so if another replica fills the same
+    pool at the same time its duplicate creates fail with 409.
+    '''
+    key = pool_key(vol)
+    pvcs = api.v1_core.list_namespaced_persistent_volume_claim(
+        namespace, label_selector=selector(key, state=None)).items
+    missing = settings.WARM_POOL_SIZE - len([p for p in pvcs
+                                             if is_available(p)])
+    if missing <= 0:
+        return 0
+
+    logger.info("Adding {} PVCs to the warm pool of namespace {}".format(
+        missing, namespace))
+    taken = {p.metadata.name for p in pvcs}
+    created = 0
+    for name in itertools.islice(pvc_names(vol, key, taken), missing):
+        pvc = utils.pvc_from_dict(vol, namespace)
+        pvc.metadata.name = name
+        pvc.metadata.labels = {POOL_LABEL: AVAILABLE, POOL_KEY_LABEL: key}
+        try:
+            api.v1_core.create_namespaced_persistent_volume_claim(namespace,
+                                                                  pvc)
+        except ApiException as e:
+            # Created by another replica in the meantime
+            if e.status != 409:
+                raise
+            continue
+
+        created += 1
+
+    return created
+
+
+def binds_on_first_consumer(vol):
+    '''
+    Whether the StorageClass of the Volume Dict waits for a Pod to use a PVC
+    before provisioning its volume. Pooling these PVCs gains nothing.
+    '''
+    name = utils.handle_storage_class(vol)
+    if name == "":
+        return False
+
+    for sc in api.storage_api.list_storage_class().items:
+        if name is None and not utils.is_default_storage_class(sc):
+            continue
+        if name is not None and sc.metadata.name != name:
+            continue
+
+        return sc.volume_binding_mode == WAIT_FOR_FIRST_CONSUMER
+
+    return False
+
+
+def refill_loop(period):
+    while True:
+        claimed_event.clear()
+        try:
+            vol = pool_volume(utils.spawner_ui_config())
+            # Only new workspaces of the default shape can come from the
+            # pool, and only if their volumes are provisioned ahead of time
+            if vol["type"] != "New" or binds_on_first_consumer(vol):
+                vol = None
+        except Exception as e:
+            logger.error("Can't read the workspaceVolume defaults: {}"
+                         .format(e))
+            vol = None
+
+        if vol is not None:
+            for namespace in settings.WARM_POOL_NAMESPACES:
+                # Each pool is refilled by the shard that owns it
+                if not sharding.owns(namespace):
+                    continue
+
+                try:
+                    fill(namespace, vol)
+                except ApiException as e:
+                    logger.error("Error refilling the warm pool of namespace"
+                                 " {}: {}".format(namespace,
+                                                  api.parse_error(e)))
+
+        claimed_event.wait(period)
+
+
+def claim(vol, namespace, notebook, _request_timeout=None):
+    '''
+    Claim an available PVC of the pool that matches the Volume Dict, for the
+    Notebook. The PVC is relabelled with its resourceVersion as a
+    precondition, so that it can't be claimed twice. Returns the name of the
+    PVC, or None if the pool has no match.
+    '''
+    kwargs = {"_request_timeout": _request_timeout}
+    for pvc in list_available(namespace, pool_key(vol), **kwargs):
+        patch = {
+            "metadata": {
+                "resourceVersion": pvc.metadata.resource_version,
+                "labels": {POOL_LABEL: CLAIMED},
+                "annotations": {CLAIMED_BY_ANNOTATION: notebook},
+            },
+        }
+        try:
+            api.v1_core.patch_namespaced_persistent_volume_claim(
+                pvc.metadata.name, namespace, patch, **kwargs)
+        except ApiException as e:
+            # Claimed by someone else in the meantime
+            if e.status in (404, 409):
+                continue
+            raise
+
+        logger.info("Notebook {}/{} claimed pooled PVC {}".format(
+            namespace, notebook, pvc.metadata.name))
+        claimed_event.set()
+        return pvc.metadata.name
+
+    return None
+
+
+def release(pvc, namespace):
+    '''
+    Put a claimed PVC back into the pool, i.e. if the Notebook that claimed
+    it couldn't be created. Nothing is done if pvc is None.
+    '''
+    if pvc is None:
+        return
+
+    patch = {
+        "metadata": {
+            "labels": {POOL_LABEL: AVAILABLE},
+            "annotations": {CLAIMED_BY_ANNOTATION: None},
+        },
+    }
+    try:
+        api.v1_core.patch_namespaced_persistent_volume_claim(pvc, namespace,
+                                                             patch)
+    except ApiException as e:
+        logger.error("Couldn't release pooled PVC {}/{}: {}".format(
+            namespace, pvc, api.parse_error(e)))
+        return
+
+    logger.info("Released pooled PVC {}/{}".format(namespace, pvc))
+
+
+@auth.needs_authorization("create", "", "v1", "persistentvolumeclaims")
+def claim_pvc(vol, notebook, namespace):
+    '''
+    Try to get the workspace PVC of a new Notebook from the warm pool. The
+    "pvc" of the response is the PVC's name, or None if none was claimed.
+    '''
+    if not enabled(namespace):
+        return {"success": True, "log": "", "pvc": None}
+
+    return api.wrap_resp("pvc", claim, vol, namespace, notebook)
+
+
+def start():
+    '''Start keeping the warm pools full, if enabled'''
+    if not enabled():
+        return
+
+    t = threading.Thread(target=refill_loop, name="warm-pool",
+                         args=(settings.WARM_POOL_PERIOD,), daemon=True)
+    t.start()
@@ -0,0 +1,140 @@
+import pytest
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+
+from kubeflow_jupyter.common import api, settings, sharding, warmpool
+
+VOL = {"name": "workspace-pool-", "type": "New", "size": "10Gi",
+       "mode": "ReadWriteOnce", "class": "standard"}
+KEY = warmpool.pool_key(VOL)
+
+
+def pvc(name, state):
+    return client.V1PersistentVolumeClaim(
+        metadata=client.V1ObjectMeta(
+            name=name, labels={warmpool.POOL_LABEL: state,
+                               warmpool.POOL_KEY_LABEL: KEY}))
+
+
+def storage_class(name, mode, default=False):
+    key = warmpool.utils.DEFAULT_STORAGE_CLASS_ANNOTATIONS[0]
+    annotations = {key: "true"} if default else {}
+    return client.V1StorageClass(
+        metadata=client.V1ObjectMeta(name=name, annotations=annotations),
+        provisioner="test", volume_binding_mode=mode)
+
+
+class FakeCoreV1Api:
+    def __init__(self, pvcs, exists=()):
+        self.pvcs = pvcs
+        self.exists = set(exists)
+        self.created = []
+        self.patched = []
+
+    def list_namespaced_persistent_volume_claim(self, namespace,
+                                                label_selector):
+        return client.V1PersistentVolumeClaimList(items=self.pvcs)
+
+    def create_namespaced_persistent_volume_claim(self, namespace, body):
+        if body.metadata.name in self.exists:
+            raise ApiException(status=409)
+        self.created.append(body.metadata.name)
+
+    def patch_namespaced_persistent_volume_claim(self, name, namespace,
+                                                 body):
+        self.patched.append((name, body))
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(settings, "WARM_POOL_SIZE", 3)
+
+
+def name(i):
+    return "workspace-pool-{}-{}".format(KEY, i)
+
+
+def test_fill_takes_the_free_names(pool, monkeypatch):
+    core = FakeCoreV1Api([pvc(name(0), warmpool.CLAIMED),
+                          pvc(name(2), warmpool.AVAILABLE)])
+    monkeypatch.setattr(api, "v1_core", core)
+
+    assert warmpool.fill("user", VOL) == 2
+    assert core.created == [name(1), name(3)]
+
+
+def test_fill_skips_names_created_by_another_replica(pool, monkeypatch):
+    core = FakeCoreV1Api([], exists=[name(0), name(1)])
+    monkeypatch.setattr(api, "v1_core", core)
+
+    assert warmpool.fill("user", VOL) == 1
+    assert core.created == [name(2)]
+
+
+def test_fill_full(pool, monkeypatch):
+    core = FakeCoreV1Api([pvc(name(i), warmpool.AVAILABLE)
+                          for i in range(3)])
+    monkeypatch.setattr(api, "v1_core", core)
+
+    assert warmpool.fill("user", VOL) == 0
+    assert core.created == []
+
+
+@pytest.mark.parametrize("cls, expected", [
+    ("standard", True),
+    ("fast", False),
+    (None, False),
+    ("", False),
+])
+def test_binds_on_first_consumer(monkeypatch, cls, expected):
+    classes = client.V1StorageClassList(items=[
+        storage_class("standard", warmpool.WAIT_FOR_FIRST_CONSUMER),
+        storage_class("fast", "Immediate", default=True)])
+    monkeypatch.setattr(api.storage_api, "list_storage_class",
+                        lambda: classes)
+
+    vol = dict(VOL)
+    if cls is None:
+        del vol["class"]
+    else:
+        vol["class"] = cls
+    assert warmpool.binds_on_first_consumer(vol) == expected
+
+
+def test_release(monkeypatch):
+    core = FakeCoreV1Api([])
+    monkeypatch.setattr(api, "v1_core", core)
+
+    warmpool.release(None, "user")
+    assert core.patched == []
+
+    warmpool.release(name(0), "user")
+    (patched, body), = core.patched
+    assert patched == name(0)
+    assert body["metadata"]["labels"] == {
+        warmpool.POOL_LABEL: warmpool.AVAILABLE}
+    assert body["metadata"]["annotations"] == {
+        warmpool.CLAIMED_BY_ANNOTATION: None}
+
+
+def test_refill_loop_fills_owned_namespaces(monkeypatch):
+    filled = []
+
+    class Stop(Exception):
+        pass
+
+    def wait(period):
+        raise Stop()
+
+    monkeypatch.setattr(settings, "WARM_POOL_NAMESPACES", ["mine", "theirs"])
+    monkeypatch.setattr(sharding, "owns", lambda ns: ns == "mine")
+    monkeypatch.setattr(warmpool.utils, "spawner_ui_config", lambda: None)
+    monkeypatch.setattr(warmpool, "pool_volume", lambda defaults: VOL)
+    monkeypatch.setattr(warmpool, "binds_on_first_consumer", lambda v: False)
+    monkeypatch.setattr(warmpool, "fill",
+                        lambda ns, vol: filled.append(ns))
+    monkeypatch.setattr(warmpool.claimed_event, "wait", wait)
+
+    with pytest.raises(Stop):
+        warmpool.refill_loop(30)
+    assert filled == ["mine"]
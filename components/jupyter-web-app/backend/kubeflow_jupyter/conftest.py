@@ -0,0 +1,25 @@
+import json
+import os
+import tempfile
+
+# The api module loads the kubeconfig when imported. The tests never reach
+# the API Server, so one for an address nothing listens on will do
+KUBECONFIG = {
+    "apiVersion": "v1",
+    "kind": "Config",
+    "clusters": [{"name": "test",
+                  "cluster": {"server": "http://127.0.0.1:1"}}],
+    "users": [{"name": "test", "user": {"token": "test"}}],
+    "contexts": [{"name": "test",
+                  "context": {"cluster": "test", "user": "test"}}],
+    "current-context": "test",
+}
+
+_, path = tempfile.mkstemp(suffix=".kubeconfig")
+with open(path, "w") as f:
+    json.dump(KUBECONFIG, f)
+os.environ["KUBECONFIG"] = path
+
+# The modules of the package import each other through api, so it's imported
+# first, as the apps do
+from kubeflow_jupyter.common import api  # noqa: E402,F401
@@ -0,0 +1,270 @@
+import concurrent.futures
+import datetime as dt
+import json
+import logging
+import os
+import sys
+import time
+import urllib.request
+
+from kubernetes import client, config
+from kubernetes.client.rest import ApiException
+from kubernetes.config import ConfigException
+from prometheus_client import Counter, Gauge, start_http_server
+
+# The culler stops Notebooks whose Jupyter server has been idle for too long.
+# It uses the same annotation as the Notebook Controller's culler: when set,
+# the controller scales the Notebook's StatefulSet to 0. The PVCs are kept.
+STOP_ANNOTATION = "kubeflow-resource-stopped"
+
+# Namespaces can override the idle time (in minutes) with this annotation
+IDLE_TIME_ANNOTATION = "notebooks.kubeflow.org/idle-time"
+
+# The constants with name 'DEFAULT_{ENV_Var}' are the default values to be
+# used, if the respective ENV vars are not present. Times are in minutes.
+DEFAULT_IDLE_TIME = "1440"  # One day
+DEFAULT_CULLING_CHECK_PERIOD = "1"
+DEFAULT_ENABLE_CULLING = "false"
+DEFAULT_CLUSTER_DOMAIN = "cluster.local"
+DEFAULT_CULLING_MAX_CONCURRENCY = "32"
+DEFAULT_CULLING_BATCH_SIZE = "500"
+DEFAULT_CULLING_PROBE_TIMEOUT = "10"
+DEFAULT_CULLING_METRICS_PORT = "8080"
+DEFAULT_NOTEBOOK_URL = ("http://{name}.{namespace}.svc.{domain}"
+                        "/notebook/{namespace}/{name}")
+
+# Labelled by namespace only: a series per Notebook would grow without bound
+# as Notebooks come and go. The culled Notebooks are logged by name
+CULLING_COUNT = Counter(
+    "notebook_culling_total",
+    "Total times of culling notebooks",
+    ["namespace"],
+)
+CULLING_TIMESTAMP = Gauge(
+    "last_notebook_culling_timestamp_seconds",
+    "Timestamp of the last notebook culling in seconds",
+    ["namespace"],
+)
+
+logger = logging.getLogger("culler")
+
+
+def get_env_default(variable, default):
+    return os.environ.get(variable) or default
+
+
+def parse_time(t):
+    '''Parse the timestamps of the Jupyter API, i.e. 2019-08-05T12:34:56.1Z'''
+    for fmt in ("%Y-%m-%dT%H:%M:%S.%fZ", "%Y-%m-%dT%H:%M:%SZ"):
+        try:
+            return dt.datetime.strptime(t, fmt).replace(tzinfo=dt.timezone.utc)
+        except ValueError:
+            continue
+
+    raise ValueError("Unknown time format: {}".format(t))
+
+
+def fetch_json(url, timeout):
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+    except Exception as e:
+        logger.info("Error talking to {}: {}".format(url, e))
+        return None
+
+
+def is_stopped(nb):
+    annotations = nb["metadata"].get("annotations") or {}
+    return STOP_ANNOTATION in annotations
+
+
+def is_running(nb):
+    return "running" in nb.get("status", {}).get("containerState", {})
+
+
+class Culler:
+    '''
+    Periodically goes through the Notebooks of all namespaces and stops the
+    ones that are idle for longer than their namespace's idle time.
+
+    Notebooks are listed one namespace at a time and are probed in batches of
+    at most batch_size, with at most max_concurrency probes in flight, so
+    that thousands of Notebooks can be checked with bounded memory and
+    without flooding the network.
+    '''
+
+    def __init__(self, custom_api, core_api, idle_time, url_template,
+                 max_concurrency, batch_size, probe_timeout,
+                 domain=DEFAULT_CLUSTER_DOMAIN):
+        self.custom_api = custom_api
+        self.core_api = core_api
+        self.idle_time = idle_time
+        self.url_template = url_template
+        self.batch_size = batch_size
+        self.probe_timeout = probe_timeout
+        self.domain = domain
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="probe")
+
+    def run(self, period):
+        while True:
+            start = time.monotonic()
+            try:
+                self.cull_all()
+            except Exception as e:
+                logger.error("Error while culling Notebooks: {}".format(e))
+
+            time.sleep(max(0, period - (time.monotonic() - start)))
+
+    def cull_all(self):
+        culled = 0
+        for ns in self.core_api.list_namespace().items:
+            try:
+                culled += self.cull_namespace(ns.metadata.name,
+                                              self.namespace_idle_time(ns))
+            except ApiException as e:
+                logger.error("Error culling Notebooks in namespace {}: {}"
+                             .format(ns.metadata.name, e.reason))
+
+        logger.info("Culling done, stopped {} Notebooks".format(culled))
+        return culled
+
+    def namespace_idle_time(self, ns):
+        annotations = ns.metadata.annotations or {}
+        idle_time = annotations.get(IDLE_TIME_ANNOTATION)
+        if idle_time is None:
+            return self.idle_time
+
+        try:
+            return dt.timedelta(minutes=int(idle_time))
+        except ValueError:
+            logger.warning(
+                "{} of namespace {} should be Int. Got '{}'. Using default"
+                " value.".format(IDLE_TIME_ANNOTATION, ns.metadata.name,
+                                 idle_time))
+            return self.idle_time
+
+    def cull_namespace(self, namespace, idle_time):
+        nbs = self.custom_api.list_namespaced_custom_object(
+            "kubeflow.org", "v1beta1", namespace, "notebooks")["items"]
+
+        # Only running Notebooks have a Jupyter server to ask
+        nbs = [nb for nb in nbs if is_running(nb) and not is_stopped(nb)]
+
+        culled = 0
+        for i in range(0, len(nbs), self.batch_size):
+            batch = nbs[i:i + self.batch_size]
+            now = dt.datetime.now(dt.timezone.utc)
+            activities = self.executor.map(self.last_activity, batch)
+            for nb, last_activity in zip(batch, activities):
+                if last_activity is None:
+                    continue
+
+                if now - last_activity <= idle_time:
+                    continue
+
+                try:
+                    self.stop(nb)
+                    culled += 1
+                except ApiException as e:
+                    logger.error("Error stopping Notebook {}/{}: {}".format(
+                        namespace, nb["metadata"]["name"], e.reason))
+
+        return culled
+
+    def notebook_url(self, nb):
+        return self.url_template.format(name=nb["metadata"]["name"],
+                                        namespace=nb["metadata"]["namespace"],
+                                        domain=self.domain)
+
+    def last_activity(self, nb):
+        '''
+        The last activity of the Notebook's Jupyter server, from its status
+        and kernels API. Returns None if it can't be determined, in which case
+        the Notebook must not be culled.
+        '''
+        url = self.notebook_url(nb)
+        status = fetch_json(url + "/api/status", self.probe_timeout)
+        kernels = fetch_json(url + "/api/kernels", self.probe_timeout)
+        if status is None or kernels is None:
+            return None
+
+        # A busy kernel is running a cell right now
+        now = dt.datetime.now(dt.timezone.utc)
+        if any(k.get("execution_state") == "busy" for k in kernels):
+            return now
+
+        try:
+            times = [parse_time(status["last_activity"])]
+            times += [parse_time(k["last_activity"]) for k in kernels
+                      if "last_activity" in k]
+        except (KeyError, ValueError) as e:
+            logger.info("Error parsing the activity of Notebook {}/{}: {}"
+                        .format(nb["metadata"]["namespace"],
+                                nb["metadata"]["name"], e))
+            return None
+
+        return max(times)
+
+    def stop(self, nb):
+        name = nb["metadata"]["name"]
+        namespace = nb["metadata"]["namespace"]
+        now = dt.datetime.now(dt.timezone.utc)
+        logger.info("Stopping idle Notebook {}/{}".format(namespace, name))
+
+        patch = {
+            "metadata": {
+                "annotations": {
+                    STOP_ANNOTATION: now.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                },
+            },
+        }
+        self.custom_api.patch_namespaced_custom_object(
+            "kubeflow.org", "v1beta1", namespace, "notebooks", name, patch)
+
+        CULLING_COUNT.labels(namespace).inc()
+        CULLING_TIMESTAMP.labels(namespace).set(now.timestamp())
+
+
+def main():
+    logging.basicConfig(
+        stream=sys.stdout,
+        level=logging.INFO,
+        format="%(asctime)s | %(name)s | %(levelname)s | %(message)s",
+    )
+
+    if get_env_default("ENABLE_CULLING", DEFAULT_ENABLE_CULLING) != "true":
+        logger.info("Culling of idle Notebooks is Disabled. To enable it set"
+                    " the ENV Var 'ENABLE_CULLING=true'")
+        return
+
+    try:
+        config.load_incluster_config()
+    except ConfigException:
+        config.load_kube_config()
+
+    idle_time = int(get_env_default("IDLE_TIME", DEFAULT_IDLE_TIME))
+    period = int(get_env_default("CULLING_CHECK_PERIOD",
+                                 DEFAULT_CULLING_CHECK_PERIOD))
+
+    culler = Culler(
+        client.CustomObjectsApi(),
+        client.CoreV1Api(),
+        idle_time=dt.timedelta(minutes=idle_time),
+        url_template=get_env_default("NOTEBOOK_URL", DEFAULT_NOTEBOOK_URL),
+        max_concurrency=int(get_env_default(
+            "CULLING_MAX_CONCURRENCY", DEFAULT_CULLING_MAX_CONCURRENCY)),
+        batch_size=int(get_env_default(
+            "CULLING_BATCH_SIZE", DEFAULT_CULLING_BATCH_SIZE)),
+        probe_timeout=int(get_env_default(
+            "CULLING_PROBE_TIMEOUT", DEFAULT_CULLING_PROBE_TIMEOUT)),
+        domain=get_env_default("CLUSTER_DOMAIN", DEFAULT_CLUSTER_DOMAIN),
+    )
+
+    start_http_server(int(get_env_default("CULLING_METRICS_PORT",
+                                          DEFAULT_CULLING_METRICS_PORT)))
+    culler.run(period * 60)
+
+
+if __name__ == "__main__":
+    main()
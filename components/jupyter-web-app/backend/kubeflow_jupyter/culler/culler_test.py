@@ -0,0 +1,197 @@
+import datetime as dt
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import pytest
+from kubernetes import client
+
+from kubeflow_jupyter.culler import culler
+
+
+def timestamp(minutes_ago):
+    t = dt.datetime.utcnow() - dt.timedelta(minutes=minutes_ago)
+    return t.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeJupyter(BaseHTTPRequestHandler):
+    '''
+    Serves /notebook/<namespace>/<name>/api/{status,kernels} of all the
+    Notebooks in 'servers', as a Jupyter server would.
+    '''
+    servers = {}
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+    delay = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        time.sleep(cls.delay)
+
+        _, _, namespace, name, _, api = self.path.split("/")
+        server = cls.servers.get((namespace, name))
+        with cls.lock:
+            cls.in_flight -= 1
+
+        if server is None:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        body = json.dumps(server[api]).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeCustomObjectsApi:
+    def __init__(self, notebooks):
+        self.notebooks = notebooks
+        self.patches = {}
+
+    def list_namespaced_custom_object(self, group, version, namespace,
+                                      plural):
+        return {"items": [nb for nb in self.notebooks
+                          if nb["metadata"]["namespace"] == namespace]}
+
+    def patch_namespaced_custom_object(self, group, version, namespace,
+                                       plural, name, body):
+        self.patches[(namespace, name)] = body
+
+
+class FakeCoreV1Api:
+    def __init__(self, namespaces):
+        self.namespaces = namespaces
+
+    def list_namespace(self):
+        return client.V1NamespaceList(items=[
+            client.V1Namespace(metadata=client.V1ObjectMeta(
+                name=name, annotations=annotations))
+            for name, annotations in self.namespaces.items()
+        ])
+
+
+def notebook(namespace, name, running=True, stopped=False):
+    nb = {
+        "metadata": {"name": name, "namespace": namespace, "annotations": {}},
+        "status": {"containerState": {"running": {}} if running else {}},
+    }
+    if stopped:
+        nb["metadata"]["annotations"][culler.STOP_ANNOTATION] = "now"
+    return nb
+
+
+def jupyter(status_minutes_ago, kernels=()):
+    return {
+        "status": {"last_activity": timestamp(status_minutes_ago)},
+        "kernels": list(kernels),
+    }
+
+
+@pytest.fixture
+def server():
+    FakeJupyter.servers = {}
+    FakeJupyter.max_in_flight = 0
+    FakeJupyter.delay = 0
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), FakeJupyter)
+    t = threading.Thread(target=srv.serve_forever, daemon=True)
+    t.start()
+    yield srv
+    srv.shutdown()
+
+
+def make_culler(server, notebooks, namespaces, max_concurrency=4,
+                batch_size=10):
+    custom_api = FakeCustomObjectsApi(notebooks)
+    url = "http://127.0.0.1:{}/notebook/{{namespace}}/{{name}}".format(
+        server.server_address[1])
+    c = culler.Culler(custom_api, FakeCoreV1Api(namespaces),
+                      idle_time=dt.timedelta(minutes=60), url_template=url,
+                      max_concurrency=max_concurrency, batch_size=batch_size,
+                      probe_timeout=5)
+    return c, custom_api
+
+
+def test_parse_time():
+    t = culler.parse_time("2019-08-05T12:34:56.123456Z")
+    assert t == dt.datetime(2019, 8, 5, 12, 34, 56, 123456,
+                            tzinfo=dt.timezone.utc)
+    assert culler.parse_time("2019-08-05T12:34:56Z").second == 56
+
+    with pytest.raises(ValueError):
+        culler.parse_time("yesterday")
+
+
+def test_cull_idle_notebooks(server):
+    FakeJupyter.servers = {
+        ("ns", "idle"): jupyter(120),
+        ("ns", "active"): jupyter(5),
+        ("ns", "recent-kernel"): jupyter(120, [
+            {"execution_state": "idle", "last_activity": timestamp(5)},
+        ]),
+        ("ns", "busy-kernel"): jupyter(120, [
+            {"execution_state": "busy", "last_activity": timestamp(120)},
+        ]),
+        ("ns", "stopped"): jupyter(120),
+    }
+    notebooks = [
+        notebook("ns", "idle"),
+        notebook("ns", "active"),
+        notebook("ns", "recent-kernel"),
+        notebook("ns", "busy-kernel"),
+        notebook("ns", "stopped", stopped=True),
+        notebook("ns", "pending", running=False),
+        notebook("ns", "unreachable"),
+    ]
+    c, custom_api = make_culler(server, notebooks, {"ns": None})
+
+    assert c.cull_all() == 1
+    assert list(custom_api.patches) == [("ns", "idle")]
+
+    annotations = custom_api.patches[("ns", "idle")]["metadata"]["annotations"]
+    assert culler.STOP_ANNOTATION in annotations
+
+
+def test_namespace_idle_time(server):
+    FakeJupyter.servers = {
+        ("short", "nb"): jupyter(30),
+        ("default", "nb"): jupyter(30),
+        ("invalid", "nb"): jupyter(30),
+    }
+    notebooks = [notebook(ns, "nb") for ns in ("short", "default", "invalid")]
+    namespaces = {
+        "short": {culler.IDLE_TIME_ANNOTATION: "10"},
+        "default": None,
+        "invalid": {culler.IDLE_TIME_ANNOTATION: "ten"},
+    }
+    c, custom_api = make_culler(server, notebooks, namespaces)
+
+    assert c.cull_all() == 1
+    assert list(custom_api.patches) == [("short", "nb")]
+
+
+def test_bounded_concurrency(server):
+    FakeJupyter.delay = 0.02
+    notebooks = [notebook("ns", "nb-{}".format(i)) for i in range(50)]
+    FakeJupyter.servers = {("ns", nb["metadata"]["name"]): jupyter(120)
+                           for nb in notebooks}
+    c, custom_api = make_culler(server, notebooks, {"ns": None},
+                                max_concurrency=3, batch_size=7)
+
+    assert c.cull_all() == 50
+    assert 1 < FakeJupyter.max_in_flight <= 3
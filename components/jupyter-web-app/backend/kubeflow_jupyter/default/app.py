@@ -1,61 +1,46 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify
 from ..common.base_app import app as base
-from ..common import utils, api
+from ..common import utils, api, capacity, idempotency, logs, settings
+from ..common import static, warmpool
 
 app = Flask(__name__)
 app.register_blueprint(base)
 logger = utils.create_logger(__name__)
+static_files = static.init_app(app)
 
 NOTEBOOK = "./kubeflow_jupyter/common/yaml/notebook.yaml"
 
 
-# POSTers
-@app.route("/api/namespaces/<namespace>/notebooks", methods=["POST"])
-def post_notebook(namespace):
-    body = request.get_json()
-    defaults = utils.spawner_ui_config()
-    logger.info("Got Notebook: {}".format(body))
-
-    notebook = utils.load_param_yaml(NOTEBOOK,
-                                     name=body["name"],
-                                     namespace=namespace,
-                                     serviceAccount="default-editor")
-
-    utils.set_notebook_image(notebook, body, defaults)
-    utils.set_notebook_cpu(notebook, body, defaults)
-    utils.set_notebook_memory(notebook, body, defaults)
-    utils.set_notebook_gpus(notebook, body, defaults)
-    utils.set_notebook_configurations(notebook, body, defaults)
+def create_workspace(workspace_vol, notebook_name, namespace):
+    '''
+    Claim a PVC of the warm pool for a new workspace volume, or create it if
+    there is none. Returns the response, and the name of the pooled PVC that
+    was claimed or None.
+    '''
+    r = warmpool.claim_pvc(workspace_vol, notebook_name, namespace=namespace)
+    if not r["success"] or r["pvc"] is not None:
+        return r, r.get("pvc")
 
-    # Workspace Volume
-    workspace_vol = utils.get_workspace_vol(body, defaults)
-    if not body.get("noWorkspace", False) and workspace_vol["type"] == "New":
-        # Create the PVC
-        ws_pvc = utils.pvc_from_dict(workspace_vol, namespace)
+    # Create the PVC
+    ws_pvc = utils.pvc_from_dict(workspace_vol, namespace)
 
-        logger.info("Creating Workspace Volume: {}".format(ws_pvc.to_dict()))
-        r = api.create_pvc(ws_pvc, namespace=namespace)
-        if not r["success"]:
-            return jsonify(r)
+    logger.log(logs.SPEC, "Creating Workspace Volume: %s", ws_pvc)
+    return api.create_pvc(ws_pvc, namespace=namespace), None
 
-    if not body.get("noWorkspace", False) and workspace_vol["type"] != "None":
-        utils.add_notebook_volume(
-            notebook,
-            workspace_vol["name"],
-            workspace_vol["name"],
-            "/home/jovyan",
-        )
 
-    # Add the Data Volumes
+def create_notebook(notebook, body, defaults, namespace):
+    '''
+    Create the data volumes of a Notebook, and then the Notebook itself
+    '''
     for vol in utils.get_data_vols(body, defaults):
         if vol["type"] == "New":
             # Create the PVC
             dtvol_pvc = utils.pvc_from_dict(vol, namespace)
 
-            logger.info("Creating Data Volume {}:".format(dtvol_pvc))
+            logger.log(logs.SPEC, "Creating Data Volume: %s", dtvol_pvc)
             r = api.create_pvc(dtvol_pvc, namespace=namespace)
             if not r["success"]:
-                return jsonify(r)
+                return r
 
         utils.add_notebook_volume(
             notebook,
@@ -67,23 +52,80 @@ def post_notebook(namespace):
     # shm
     utils.set_notebook_shm(notebook, body, defaults)
 
-    logger.info("Creating Notebook: {}".format(notebook))
-    return jsonify(api.create_notebook(notebook, namespace=namespace))
+    logger.log(logs.SPEC, "Creating Notebook: %s", notebook)
+    return api.create_notebook(notebook, namespace=namespace)
+
+
+# POSTers
+@app.route("/api/namespaces/<namespace>/notebooks", methods=["POST"])
+@idempotency.idempotent
+def post_notebook(namespace):
+    body = request.get_json()
+    defaults = utils.spawner_ui_config()
+    logger.log(logs.SPEC, "Got Notebook: %s", body)
+
+    notebook = utils.load_param_yaml(NOTEBOOK,
+                                     name=body["name"],
+                                     namespace=namespace,
+                                     serviceAccount="default-editor")
+
+    utils.set_notebook_image(notebook, body, defaults)
+    utils.set_notebook_cpu(notebook, body, defaults)
+    utils.set_notebook_memory(notebook, body, defaults)
+    utils.set_notebook_gpus(notebook, body, defaults)
+    utils.set_notebook_configurations(notebook, body, defaults)
+
+    if settings.CAPACITY_CHECK:
+        msg = capacity.check_fit(notebook)
+        if msg is not None:
+            return jsonify({"success": False, "log": msg})
+
+    # Workspace Volume
+    workspace_vol = utils.get_workspace_vol(body, defaults)
+    ws_claim = workspace_vol["name"]
+    no_workspace = body.get("noWorkspace", False)
+    pooled_pvc = None
+    if not no_workspace and workspace_vol["type"] == "New":
+        r, pooled_pvc = create_workspace(workspace_vol, body["name"],
+                                         namespace)
+        if not r["success"]:
+            return jsonify(r)
+        ws_claim = pooled_pvc or ws_claim
+
+    created = False
+    try:
+        if not no_workspace and workspace_vol["type"] != "None":
+            utils.add_notebook_volume(
+                notebook,
+                workspace_vol["name"],
+                ws_claim,
+                "/home/jovyan",
+            )
+
+        r = create_notebook(notebook, body, defaults, namespace)
+        created = r["success"]
+        return jsonify(r)
+    finally:
+        # Whatever went wrong, i.e. an exception too, the pooled workspace
+        # can be claimed by the next Notebook
+        if not created:
+            warmpool.release(pooled_pvc, namespace)
 
 
 # Since Angular is a SPA, we serve index.html every time
 @app.route("/")
 def serve_root():
-    return send_from_directory("./static/", "index.html")
+    return static_files.send_index()
 
 
 @app.route("/<path:path>", methods=["GET"])
 def static_proxy(path):
-    logger.info("Sending file '/static/{}' for path: {}".format(path, path))
-    return send_from_directory("./static/", path)
+    logger.info("Sending file '/static/%s' for path: %s", path, path,
+                extra={"sampled": True})
+    return static_files.send(path)
 
 
 @app.errorhandler(404)
 def page_not_found(e):
-    logger.info("Sending file 'index.html'")
-    return send_from_directory("./static/", "index.html")
+    logger.info("Sending file 'index.html'", extra={"sampled": True})
+    return static_files.send_index()
@@ -0,0 +1,63 @@
+import pytest
+
+from kubeflow_jupyter.common import deadline
+from kubeflow_jupyter.default import app as default
+
+
+@pytest.fixture
+def released(monkeypatch):
+    '''The PVCs released back into the warm pool'''
+    released = []
+    monkeypatch.setattr(default.settings, "CAPACITY_CHECK", False)
+    monkeypatch.setattr(
+        default.warmpool, "claim_pvc",
+        lambda vol, nb, namespace: {"success": True, "log": "",
+                                    "pvc": "workspace-pool-0"})
+    monkeypatch.setattr(default.warmpool, "release",
+                        lambda pvc, namespace: released.append(
+                            (pvc, namespace)))
+    monkeypatch.setattr(default.utils, "get_data_vols", lambda b, d: [])
+    return released
+
+
+def post():
+    with default.app.test_request_context(
+            "/api/namespaces/ns/notebooks", method="POST",
+            json={"name": "nb"}):
+        return default.post_notebook("ns")
+
+
+def create(monkeypatch, fn):
+    monkeypatch.setattr(default.api, "create_notebook", fn)
+
+
+def test_created_notebook_keeps_its_workspace(monkeypatch, released):
+    created = []
+    create(monkeypatch, lambda nb, namespace: created.append(nb) or {
+        "success": True, "log": ""})
+
+    assert post().get_json()["success"]
+    volumes = created[0]["spec"]["template"]["spec"]["volumes"]
+    assert {"name": "workspace-nb",
+            "persistentVolumeClaim": {"claimName": "workspace-pool-0"}} \
+        in volumes
+    assert released == []
+
+
+def test_failed_notebook_releases_its_workspace(monkeypatch, released):
+    create(monkeypatch, lambda nb, namespace: {"success": False,
+                                               "log": "invalid"})
+
+    assert not post().get_json()["success"]
+    assert released == [("workspace-pool-0", "ns")]
+
+
+def test_exception_releases_the_workspace(monkeypatch, released):
+    def exceeded(nb, namespace):
+        raise deadline.DeadlineExceeded("no time left")
+
+    create(monkeypatch, exceeded)
+
+    with pytest.raises(deadline.DeadlineExceeded):
+        post()
+    assert released == [("workspace-pool-0", "ns")]
@@ -0,0 +1,228 @@
+import datetime as dt
+import hashlib
+import logging
+import sys
+from argparse import ArgumentParser
+from collections import Counter
+
+import yaml
+from kubernetes import client, config
+from kubernetes.client.rest import ApiException
+from kubernetes.config import ConfigException
+
+# The pre-pull planner keeps the most popular Notebook images on every node,
+# so that spawning a Notebook on a fresh node doesn't wait for the image pull.
+# Only the images offered in the spawner's config are considered. They are
+# ranked by how many Notebooks were recently created with them, and the top
+# ones get a DaemonSet whose init container pulls the image on each node.
+
+# The planner uses the same config as the backend
+CONFIGS = [
+    "/etc/config/spawner_ui_config.yaml",
+    "./kubeflow_jupyter/common/yaml/spawner_ui_config.yaml",
+]
+
+PREPULL_LABEL = "app"
+PREPULL_LABEL_VALUE = "jupyter-prepull"
+IMAGE_ANNOTATION = "notebooks.kubeflow.org/prepull-image"
+PAUSE_IMAGE = "k8s.gcr.io/pause:3.1"
+# The Notebook images may have no shell, or no binaries at all. So a static
+# busybox is copied into a volume, and run from the Notebook image as "true"
+BUSYBOX_IMAGE = "busybox:1.31.1"
+TOOLS_VOLUME = "prepull-tools"
+TOOLS_PATH = "/prepull-tools"
+
+logger = logging.getLogger("prepull")
+
+
+def load_image_options(configs=CONFIGS):
+    '''
+    The images of spawnerFormDefaults.image in the first config found. The
+    default image comes first, then the options in their config order.
+    '''
+    for path in configs:
+        try:
+            with open(path, "r") as f:
+                c = yaml.safe_load(f)
+        except IOError:
+            continue
+
+        image = c["spawnerFormDefaults"]["image"]
+        images = [image["value"]] + image.get("options", [])
+        return list(dict.fromkeys(images))
+
+    logger.warning("Couldn't load any config")
+    return []
+
+
+def notebook_image(nb):
+    return nb["spec"]["template"]["spec"]["containers"][0]["image"]
+
+
+def notebook_created(nb):
+    return dt.datetime.strptime(nb["metadata"]["creationTimestamp"],
+                                "%Y-%m-%dT%H:%M:%SZ")
+
+
+def rank_images(options, notebooks, window, now=None):
+    '''
+    Return the image options sorted by the number of Notebooks created with
+    them during the last 'window', as [(image, count)]. Ties keep the order
+    of the config, so the default image wins them.
+    '''
+    now = now or dt.datetime.utcnow()
+    counts = Counter(notebook_image(nb) for nb in notebooks
+                     if now - notebook_created(nb) <= window)
+
+    ranked = sorted(enumerate(options), key=lambda o: (-counts[o[1]], o[0]))
+    return [(image, counts[image]) for _, image in ranked]
+
+
+def daemonset_name(image):
+    digest = hashlib.sha1(image.encode("utf-8")).hexdigest()[:10]
+    return "jupyter-prepull-" + digest
+
+
+def minimal_resources():
+    return {"requests": {"cpu": "1m", "memory": "8Mi"}}
+
+
+def tools_mount():
+    return {"name": TOOLS_VOLUME, "mountPath": TOOLS_PATH}
+
+
+def prepull_daemonset(image, namespace):
+    '''
+    A DaemonSet that pulls the image on every node. The init container of
+    the image runs a static "true", copied in by the first init container,
+    and exits right away. The pause container keeps the Pod, and thus the
+    image, around with practically no resources.
+    '''
+    name = daemonset_name(image)
+    labels = {PREPULL_LABEL: PREPULL_LABEL_VALUE, "prepull": name}
+
+    return {
+        "apiVersion": "apps/v1",
+        "kind": "DaemonSet",
+        "metadata": {
+            "name": name,
+            "namespace": namespace,
+            "labels": dict(labels),
+            "annotations": {IMAGE_ANNOTATION: image},
+        },
+        "spec": {
+            "selector": {"matchLabels": dict(labels)},
+            "template": {
+                "metadata": {"labels": dict(labels)},
+                "spec": {
+                    "initContainers": [{
+                        "name": "tools",
+                        "image": BUSYBOX_IMAGE,
+                        "command": ["cp", "/bin/busybox",
+                                    TOOLS_PATH + "/true"],
+                        "resources": minimal_resources(),
+                        "volumeMounts": [tools_mount()],
+                    }, {
+                        "name": "prepull",
+                        "image": image,
+                        "command": [TOOLS_PATH + "/true"],
+                        "resources": minimal_resources(),
+                        "volumeMounts": [tools_mount()],
+                    }],
+                    "containers": [{
+                        "name": "pause",
+                        "image": PAUSE_IMAGE,
+                        "resources": minimal_resources(),
+                    }],
+                    "tolerations": [{"operator": "Exists"}],
+                    "volumes": [{"name": TOOLS_VOLUME, "emptyDir": {}}],
+                },
+            },
+        },
+    }
+
+
+def plan(options, notebooks, top, window, namespace):
+    '''Return the ranking and the DaemonSets for the top images'''
+    ranking = rank_images(options, notebooks, window)
+    daemonsets = [prepull_daemonset(image, namespace)
+                  for image, _ in ranking[:top]]
+    return ranking, daemonsets
+
+
+def print_plan(ranking, daemonsets, top):
+    print("# Image ranking (Notebooks created in the window):")
+    for i, (image, count) in enumerate(ranking):
+        mark = "pre-pull" if i < top else "skip"
+        print("#   {:>4}  {:<8}  {}".format(count, mark, image))
+
+    print(yaml.safe_dump_all(daemonsets, default_flow_style=False))
+
+
+def apply_plan(apps_api, daemonsets, namespace):
+    '''Create or replace the planned DaemonSets and delete the stale ones'''
+    wanted = {ds["metadata"]["name"]: ds for ds in daemonsets}
+
+    existing = apps_api.list_namespaced_daemon_set(
+        namespace,
+        label_selector="{}={}".format(PREPULL_LABEL, PREPULL_LABEL_VALUE))
+    existing = {ds.metadata.name for ds in existing.items}
+
+    for name, ds in wanted.items():
+        if name in existing:
+            logger.info("Replacing DaemonSet {}".format(name))
+            apps_api.replace_namespaced_daemon_set(name, namespace, ds)
+        else:
+            logger.info("Creating DaemonSet {}".format(name))
+            apps_api.create_namespaced_daemon_set(namespace, ds)
+
+    for name in existing - set(wanted):
+        logger.info("Deleting stale DaemonSet {}".format(name))
+        try:
+            apps_api.delete_namespaced_daemon_set(
+                name, namespace, body=client.V1DeleteOptions())
+        except ApiException as e:
+            if e.status != 404:
+                raise
+
+
+def main():
+    parser = ArgumentParser(
+        description="Keep the most spawned Notebook images warm on nodes")
+    parser.add_argument("--top", type=int, default=3,
+                        help="number of images to keep pulled")
+    parser.add_argument("--window-days", type=int, default=14,
+                        help="only count Notebooks created in these days")
+    parser.add_argument("--namespace", type=str, default="kubeflow",
+                        help="namespace of the pre-pull DaemonSets")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="print the plan instead of applying it")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        stream=sys.stdout,
+        level=logging.INFO,
+        format="%(asctime)s | %(name)s | %(levelname)s | %(message)s",
+    )
+
+    try:
+        config.load_incluster_config()
+    except ConfigException:
+        config.load_kube_config()
+
+    options = load_image_options()
+    notebooks = client.CustomObjectsApi().list_cluster_custom_object(
+        "kubeflow.org", "v1beta1", "notebooks")["items"]
+
+    ranking, daemonsets = plan(options, notebooks, args.top,
+                               dt.timedelta(days=args.window_days),
+                               args.namespace)
+    if args.dry_run:
+        print_plan(ranking, daemonsets, args.top)
+        return
+
+    apply_plan(client.AppsV1Api(), daemonsets, args.namespace)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import datetime as dt
+
+import yaml
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+
+from kubeflow_jupyter.prepull import prepull
+
+NOW = dt.datetime(2019, 8, 20, 12, 0, 0)
+WINDOW = dt.timedelta(days=14)
+
+
+def notebook(image, days_ago, now=NOW):
+    created = now - dt.timedelta(days=days_ago)
+    return {
+        "metadata": {"creationTimestamp": created.strftime(
+            "%Y-%m-%dT%H:%M:%SZ")},
+        "spec": {"template": {"spec": {"containers": [{"image": image}]}}},
+    }
+
+
+class FakeAppsV1Api:
+    def __init__(self, existing, missing=()):
+        self.existing = existing
+        self.missing = set(missing)
+        self.calls = []
+
+    def list_namespaced_daemon_set(self, namespace, label_selector):
+        return client.V1DaemonSetList(items=[
+            client.V1DaemonSet(metadata=client.V1ObjectMeta(name=name))
+            for name in self.existing])
+
+    def create_namespaced_daemon_set(self, namespace, body):
+        self.calls.append(("create", body["metadata"]["name"]))
+
+    def replace_namespaced_daemon_set(self, name, namespace, body):
+        self.calls.append(("replace", name))
+
+    def delete_namespaced_daemon_set(self, name, namespace, body):
+        self.calls.append(("delete", name))
+        if name in self.missing:
+            raise ApiException(status=404)
+
+
+def test_load_image_options(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text(yaml.safe_dump({"spawnerFormDefaults": {"image": {
+        "value": "b", "options": ["a", "b", "c"]}}}))
+
+    options = prepull.load_image_options([str(tmp_path / "missing"),
+                                          str(path)])
+    assert options == ["b", "a", "c"]
+    assert prepull.load_image_options([str(tmp_path / "missing")]) == []
+
+
+def test_rank_images():
+    notebooks = [notebook("a", 1), notebook("c", 1), notebook("c", 2),
+                 notebook("b", 3), notebook("a", 30), notebook("a", 40),
+                 notebook("unknown", 1)]
+
+    ranking = prepull.rank_images(["a", "b", "c", "d"], notebooks, WINDOW,
+                                  now=NOW)
+    assert ranking == [("c", 2), ("a", 1), ("b", 1), ("d", 0)]
+
+
+def test_rank_images_ties_keep_the_config_order():
+    ranking = prepull.rank_images(["b", "a"], [], WINDOW, now=NOW)
+    assert ranking == [("b", 0), ("a", 0)]
+
+
+def test_daemonset_name():
+    name = prepull.daemonset_name("jupyter:1.0")
+    assert name == prepull.daemonset_name("jupyter:1.0")
+    assert name != prepull.daemonset_name("jupyter:2.0")
+    assert name.startswith("jupyter-prepull-") and len(name) <= 63
+
+
+def test_prepull_daemonset_needs_no_shell():
+    ds = prepull.prepull_daemonset("distroless", "kubeflow")
+    spec = ds["spec"]["template"]["spec"]
+
+    tools, pull = spec["initContainers"]
+    assert pull["image"] == "distroless"
+    assert pull["command"] == [prepull.TOOLS_PATH + "/true"]
+    assert tools["command"][-1] == pull["command"][0]
+    assert spec["volumes"][0]["name"] == prepull.TOOLS_VOLUME
+    annotations = ds["metadata"]["annotations"]
+    assert annotations[prepull.IMAGE_ANNOTATION] == "distroless"
+    labels = ds["spec"]["template"]["metadata"]["labels"]
+    assert ds["spec"]["selector"]["matchLabels"] == labels
+
+
+def test_plan_top():
+    notebooks = [notebook("c", 1, now=dt.datetime.utcnow())]
+    ranking, daemonsets = prepull.plan(["a", "b", "c"], notebooks, 2, WINDOW,
+                                       "kubeflow")
+    assert [image for image, _ in ranking] == ["c", "a", "b"]
+    assert [ds["metadata"]["annotations"][prepull.IMAGE_ANNOTATION]
+            for ds in daemonsets] == ["c", "a"]
+
+
+def test_apply_plan():
+    daemonsets = [prepull.prepull_daemonset(i, "kubeflow") for i in "ab"]
+    a, b = (ds["metadata"]["name"] for ds in daemonsets)
+    api = FakeAppsV1Api([a, "stale", "gone"], missing=["gone"])
+
+    prepull.apply_plan(api, daemonsets, "kubeflow")
+
+    assert sorted(api.calls) == sorted([
+        ("replace", a), ("create", b), ("delete", "stale"),
+        ("delete", "gone")])
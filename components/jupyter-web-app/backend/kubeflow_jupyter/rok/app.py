@@ -1,13 +1,15 @@
-import base64
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify
 from ..common.base_app import app as base
-from ..common import utils, api
+from ..common import utils, api, capacity, idempotency, logs, settings
+from ..common import static
 from . import rok
+from . import tokens
 
 # Use the BaseApp, override the POST Notebook Endpoint
 app = Flask(__name__)
 app.register_blueprint(base)
 logger = utils.create_logger(__name__)
+static_files = static.init_app(app)
 
 NOTEBOOK = "./kubeflow_jupyter/common/yaml/notebook.yaml"
 
@@ -16,14 +18,13 @@ NOTEBOOK = "./kubeflow_jupyter/common/yaml/notebook.yaml"
 @app.route("/api/rok/namespaces/<namespace>/token")
 def get_token(namespace):
     '''Retrieve the token to authenticate with Rok.'''
-    secret = None
     name = rok.rok_secret_name()
     token = {
         "name": name,
         "value": "",
     }
 
-    data = api.get_secret(name, namespace=namespace)
+    data = tokens.get_token(namespace=namespace)
     if not data["success"]:
         logger.warning("Couldn't load ROK token in namespace '{}': {}".format(
             namespace, data["log"]
@@ -31,8 +32,7 @@ def get_token(namespace):
         data["token"] = token
         return jsonify(data)
 
-    secret = data["secret"]
-    if secret.data is None:
+    if data["token"] is None:
         logger.warning(
             "ROK Secret doesn't exist in namespace '%s'" % namespace
         )
@@ -42,22 +42,21 @@ def get_token(namespace):
             "token": token
         })
 
-    token = secret.data.get("token", "")
     data["token"] = {
-        "value": base64.b64decode(token).decode("utf-8"),
+        "value": data["token"],
         "name": name
     }
-    del data["secret"]
 
     return jsonify(data)
 
 
 # POSTers
 @app.route("/api/namespaces/<namespace>/notebooks", methods=["POST"])
+@idempotency.idempotent
 def post_notebook(namespace):
     body = request.get_json()
     defaults = utils.spawner_ui_config()
-    logger.info("Got Notebook: {}".format(body))
+    logger.log(logs.SPEC, "Got Notebook: %s", body)
 
     notebook = utils.load_param_yaml(NOTEBOOK,
                                      name=body["name"],
@@ -71,6 +70,11 @@ def post_notebook(namespace):
     utils.set_notebook_gpus(notebook, body, defaults)
     utils.set_notebook_configurations(notebook, body, defaults)
 
+    if settings.CAPACITY_CHECK:
+        msg = capacity.check_fit(notebook)
+        if msg is not None:
+            return jsonify({"success": False, "log": msg})
+
     # Workspace Volume
     workspace_vol = utils.get_workspace_vol(body, defaults)
     if not body.get("noWorkspace", False) and workspace_vol["type"] != "None":
@@ -80,7 +84,7 @@ def post_notebook(namespace):
         if workspace_vol["type"] == "Existing":
             rok.add_workspace_volume_annotations(ws_pvc, workspace_vol)
 
-        logger.info("Creating Workspace Volume: {}".format(ws_pvc.to_dict()))
+        logger.log(logs.SPEC, "Creating Workspace Volume: %s", ws_pvc)
         r = api.create_pvc(ws_pvc, namespace=namespace)
         if not r["success"]:
             return jsonify(r)
@@ -100,7 +104,7 @@ def post_notebook(namespace):
         if vol["type"] == "Existing":
             rok.add_data_volume_annotations(dtvol_pvc, vol)
 
-        logger.info("Creating Data Volume {}:".format(dtvol_pvc))
+        logger.log(logs.SPEC, "Creating Data Volume: %s", dtvol_pvc)
         r = api.create_pvc(dtvol_pvc, namespace=namespace)
         if not r["success"]:
             return jsonify(r)
@@ -115,22 +119,22 @@ def post_notebook(namespace):
     # shm
     utils.set_notebook_shm(notebook, body, defaults)
 
-    logger.info("Creating Notebook: {}".format(notebook))
+    logger.log(logs.SPEC, "Creating Notebook: %s", notebook)
     return jsonify(api.create_notebook(notebook, namespace=namespace))
 
 
 # Since Angular is a SPA, we serve index.html every time
 @app.route("/")
 def serve_root():
-    return send_from_directory("./static/", "index.html")
+    return static_files.send_index()
 
 
 @app.route("/<path:path>", methods=["GET"])
 def static_proxy(path):
-    return send_from_directory("./static/", path)
+    return static_files.send(path)
 
 
 @app.errorhandler(404)
 def page_not_found(e):
-    logger.info("Sending file 'index.html'")
-    return send_from_directory("./static/", "index.html")
+    logger.info("Sending file 'index.html'", extra={"sampled": True})
+    return static_files.send_index()
@@ -0,0 +1,86 @@
+import base64
+import threading
+import time
+
+from kubernetes import watch
+from ..common import api, auth, cache, settings, utils
+from ..common.ttlcache import TTLCache
+from . import rok
+
+logger = utils.create_logger(__name__)
+
+# The decoded Rok tokens, per namespace. An entry is dropped when its secret
+# changes, as seen by a watch on the secrets with the Rok secret's name, and
+# expires after ROK_TOKEN_TTL_SECS in any case, i.e. if the watch is down.
+# Every read is still authorized for the user, the cache only saves the
+# read of the secret and its decoding.
+MAX_TOKENS = 4096
+RETRY_BACKOFF_SECS = 5
+
+tokens = TTLCache(MAX_TOKENS, settings.ROK_TOKEN_TTL_SECS)
+
+
+def read_token(name, namespace):
+    '''The decoded token of the secret. The token is None if it has none'''
+    data = api.wrap_resp("secret", api.v1_core.read_namespaced_secret, name,
+                         namespace)
+    if not data["success"]:
+        return data
+
+    secret = data.pop("secret")
+    data["token"] = None
+    if secret.data is not None:
+        token = secret.data.get("token", "")
+        data["token"] = base64.b64decode(token).decode("utf-8")
+        if not data.get("stale"):
+            tokens.set(namespace, data["token"])
+
+    return data
+
+
+@auth.needs_authorization("get", "", "v1", "secrets")
+def get_token(namespace):
+    token = tokens.get(namespace)
+    if token is not None:
+        return {"success": True, "log": "", "token": token}
+
+    return read_token(rok.rok_secret_name(), namespace)
+
+
+def invalidate_loop():
+    '''Drop the token of a namespace whenever its secret changes'''
+    selector = "metadata.name=" + rok.rok_secret_name()
+    timeout = settings.CACHE_WATCH_TIMEOUT_SECS
+    while True:
+        # Changes could have been missed while the watch was down
+        tokens.clear()
+        try:
+            # The stream ends after the timeout, like the caches' watches, so
+            # that a connection that silently died is noticed
+            w = watch.Watch()
+            stream = w.stream(
+                api.v1_core.list_secret_for_all_namespaces,
+                field_selector=selector, timeout_seconds=timeout,
+                _request_timeout=timeout + cache.WATCH_READ_GRACE_SECS)
+            for event in stream:
+                obj = event["object"]
+                if event["type"] == "ERROR":
+                    logger.warning("Watch error for the Rok secrets: %s",
+                                   event["raw_object"].get("message"))
+                    time.sleep(RETRY_BACKOFF_SECS)
+                    break
+
+                tokens.pop(obj.metadata.namespace)
+        except Exception as e:
+            logger.error("Error watching the Rok secrets: %s", e)
+            time.sleep(RETRY_BACKOFF_SECS)
+
+
+def start():
+    '''Start invalidating the cached tokens, if they are cached'''
+    if settings.ROK_TOKEN_TTL_SECS <= 0:
+        return
+
+    t = threading.Thread(target=invalidate_loop, name="rok-tokens",
+                         daemon=True)
+    t.start()
@@ -0,0 +1,142 @@
+import base64
+
+import flask
+import pytest
+from kubernetes import client
+
+from kubeflow_jupyter.common import auth, breaker, settings, utils
+from kubeflow_jupyter.common.ttlcache import TTLCache
+from kubeflow_jupyter.rok import tokens
+
+
+class StopWatching(BaseException):
+    '''Ends invalidate_loop, which otherwise watches forever'''
+
+
+def secret(namespace, token):
+    return client.V1Secret(
+        metadata=client.V1ObjectMeta(name="secret-rok-user",
+                                     namespace=namespace),
+        data={"token": base64.b64encode(token.encode()).decode()})
+
+
+class FakeCoreV1Api:
+    '''Serves the Rok secrets of each namespace'''
+
+    def __init__(self):
+        self.secrets = {}
+        self.reads = []
+
+    def read_namespaced_secret(self, name, namespace, _request_timeout=None):
+        self.reads.append((name, namespace))
+        return self.secrets[namespace]
+
+    def list_secret_for_all_namespaces(self, **kwargs):
+        raise AssertionError("Only watched through the fake watch")
+
+
+class FakeWatch:
+    '''Streams the given events, then stops the loop'''
+
+    def __init__(self, events):
+        self.events = events
+        self.calls = []
+
+    def __call__(self):
+        return self
+
+    def stream(self, fn, **kwargs):
+        self.calls.append(kwargs)
+        yield from self.events
+        raise StopWatching()
+
+
+@pytest.fixture
+def core(monkeypatch):
+    fake = FakeCoreV1Api()
+    fake.secrets["user"] = secret("user", "t0ken")
+    monkeypatch.setattr(tokens.api, "v1_core", fake)
+    monkeypatch.setattr(tokens, "tokens", TTLCache(10, 60))
+    monkeypatch.setattr(auth, "is_authorized", lambda *args: True)
+    monkeypatch.setattr(breaker, "api_server", breaker.NoopBreaker())
+    return fake
+
+
+def get_token(namespace="user"):
+    app = flask.Flask(__name__)
+    with app.test_request_context("/", headers={
+            utils.USER_HEADER: utils.USER_PREFIX + "alice"}):
+        return tokens.get_token(namespace=namespace)
+
+
+def test_tokens_are_cached_per_namespace(core):
+    core.secrets["other"] = secret("other", "other-t0ken")
+
+    assert get_token()["token"] == "t0ken"
+    assert get_token()["token"] == "t0ken"
+    assert get_token("other")["token"] == "other-t0ken"
+    assert core.reads == [("secret-rok-user", "user"),
+                          ("secret-rok-user", "other")]
+
+
+def test_tokens_are_still_authorized(core, monkeypatch):
+    get_token()
+    monkeypatch.setattr(auth, "is_authorized", lambda *args: False)
+
+    data = get_token()
+    assert not data["success"]
+    assert "token" not in data
+
+
+def test_secret_without_data(core):
+    core.secrets["user"].data = None
+
+    assert get_token()["token"] is None
+    assert get_token()["token"] is None
+    assert len(core.reads) == 2
+
+
+def test_stale_secrets_are_not_cached(core, monkeypatch):
+    wrap_resp = tokens.api.wrap_resp
+
+    def stale(*args, **kwargs):
+        return dict(wrap_resp(*args, **kwargs), stale=True)
+
+    monkeypatch.setattr(tokens.api, "wrap_resp", stale)
+    assert get_token()["token"] == "t0ken"
+    assert len(tokens.tokens) == 0
+
+    monkeypatch.setattr(tokens.api, "wrap_resp", wrap_resp)
+    get_token()
+    get_token()
+    assert len(core.reads) == 2
+
+
+def test_changed_secrets_are_invalidated(core, monkeypatch):
+    core.secrets["other"] = secret("other", "other-t0ken")
+    get_token()
+
+    def events():
+        # The tokens cached before the watch started were dropped
+        assert len(tokens.tokens) == 0
+
+        get_token()
+        get_token("other")
+        core.secrets["user"] = secret("user", "n3w")
+        yield {"type": "MODIFIED", "object": core.secrets["user"]}
+
+    w = FakeWatch(events())
+    monkeypatch.setattr(tokens.watch, "Watch", w)
+    monkeypatch.setattr(settings, "CACHE_WATCH_TIMEOUT_SECS", 120)
+    with pytest.raises(StopWatching):
+        tokens.invalidate_loop()
+
+    assert w.calls[0]["field_selector"] == "metadata.name=secret-rok-user"
+    assert w.calls[0]["timeout_seconds"] == 120
+    assert w.calls[0]["_request_timeout"] > 120
+    assert "user" not in tokens.tokens.data
+    assert "other" in tokens.tokens.data
+
+    assert get_token()["token"] == "n3w"
+    assert get_token("other")["token"] == "other-t0ken"
+    assert len(core.reads) == 4
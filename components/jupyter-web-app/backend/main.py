@@ -5,6 +5,8 @@ from flask_cors import CORS
 from kubeflow_jupyter.common import settings
 from kubeflow_jupyter.default.app import app as default
 from kubeflow_jupyter.rok.app import app as rok
+from kubeflow_jupyter.rok import tokens as rok_tokens
+from kubeflow_jupyter.common import cache, static, tracing, usage, warmpool
 
 logger = logging.getLogger("entrypoint")
 
@@ -17,14 +19,21 @@ apps = {
 
 try:
     app = apps[ui]
-
-    if "--dev" in sys.argv:
-        settings.DEV_MODE = True
-
-        logger.warning("Enabling CORS")
-        CORS(app)
-
-    app.run(host="0.0.0.0")
 except KeyError:
     logger.warning("There is no " + ui + " UI to load.")
     exit(1)
+
+if "--dev" in sys.argv:
+    settings.DEV_MODE = True
+
+    logger.warning("Enabling CORS")
+    CORS(app)
+
+cache.start()
+tracing.start()
+warmpool.start()
+usage.start()
+static.load(app)
+if ui == "rok":
+    rok_tokens.start()
+app.run(host="0.0.0.0")
@@ -1,7 +1,7 @@
 import { Component, OnInit, Input } from '@angular/core';
 import { FormGroup, ValidatorFn, AbstractControl } from '@angular/forms';
 import { Subscription } from 'rxjs';
-import { GPUVendor } from 'src/app/utils/types';
+import { GPUVendor, Capacity } from 'src/app/utils/types';
 
 @Component({
   selector: 'app-form-gpus',
@@ -11,6 +11,7 @@ import { GPUVendor } from 'src/app/utils/types';
 export class FormGpusComponent implements OnInit {
   @Input() parentForm: FormGroup;
   @Input() vendors: GPUVendor[];
+  @Input() capacity: Capacity;
   private gpuCtrl: FormGroup;
   subscriptions = new Subscription();
 
@@ -39,6 +40,24 @@ export class FormGpusComponent implements OnInit {
     );
   }
 
+  // Free GPUs of the selected vendor, as reported by the backend
+  public getAvailability() {
+    const vendor = this.gpuCtrl.get('vendor').value;
+    if (!this.capacity || !vendor) {
+      return '';
+    }
+
+    const gpus = this.capacity[vendor];
+    if (!gpus) {
+      return `There are no ${vendor} GPUs in the cluster`;
+    }
+
+    return (
+      `${gpus.free} of ${gpus.allocatable} GPUs are free, ` +
+      `at most ${gpus.maxFreePerNode} on a single node`
+    );
+  }
+
   // Custom Validation
   public getVendorError() {
     const vendorCtrl = this.parentForm.get('gpus').get('vendor');
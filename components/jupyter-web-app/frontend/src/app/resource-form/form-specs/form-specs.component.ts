@@ -1,5 +1,6 @@
 import { Component, OnInit, Input } from "@angular/core";
 import { FormGroup } from "@angular/forms";
+import { Recommendation } from "src/app/utils/types";
 
 @Component({
   selector: "app-form-specs",
@@ -10,6 +11,7 @@ export class FormSpecsComponent implements OnInit {
   @Input() parentForm: FormGroup;
   @Input() readonlyCPU: boolean;
   @Input() readonlyMemory: boolean;
+  @Input() recommended: Recommendation;
 
   constructor() {}
 
@@ -5,7 +5,13 @@ import { KubernetesService } from '../services/kubernetes.service';
 import { Router } from '@angular/router';
 import { catchError } from 'rxjs/operators';
 import { Subscription, of } from 'rxjs';
-import { Volume, Config, SnackType } from '../utils/types';
+import {
+  Volume,
+  Config,
+  SnackType,
+  Capacity,
+  Usage,
+} from '../utils/types';
 import { SnackBarService } from '../services/snack-bar.service';
 import { getFormDefaults, initFormControls } from '../utils/common';
 
@@ -18,6 +24,8 @@ export class ResourceFormComponent implements OnInit, OnDestroy {
   currNamespace = '';
   formCtrl: FormGroup;
   config: Config;
+  capacity: Capacity;
+  usage: Usage;
 
   ephemeral = false;
   defaultStorageclass = false;
@@ -58,6 +66,17 @@ export class ResourceFormComponent implements OnInit, OnDestroy {
         this.k8s.getVolumes(namespace).subscribe(pvcs => {
           this.pvcs = pvcs;
         });
+
+        // Get the usage of the Notebooks, to suggest the CPU/RAM
+        this.k8s.getUsage(namespace).subscribe(usage => {
+          this.usage = usage;
+        });
+
+        // Get the free resources of the cluster, to show them next to the
+        // GPUs. Only users that can create Notebooks here may see them
+        this.k8s.getCapacity(namespace).subscribe(capacity => {
+          this.capacity = capacity;
+        });
       }),
     );
 
@@ -1,7 +1,7 @@
 import { Injectable } from "@angular/core";
 import { HttpClient, HttpErrorResponse } from "@angular/common/http";
 
-import { Observable, throwError } from "rxjs";
+import { Observable, throwError, of } from "rxjs";
 import { tap, map, catchError } from "rxjs/operators";
 import { environment } from "src/environments/environment";
 
@@ -11,10 +11,24 @@ import {
   SnackType,
   Volume,
   Config,
-  PodDefault
+  PodDefault,
+  Capacity,
+  Usage
 } from "../utils/types";
 import { SnackBarService } from "../services/snack-bar.service";
 
+// A random key, unique to each submission of the form
+function idempotencyKey(): string {
+  const bytes = new Uint8Array(16);
+  window.crypto.getRandomValues(bytes);
+
+  let key = "";
+  for (let i = 0; i < bytes.length; i++) {
+    key += ("0" + bytes[i].toString(16)).slice(-2);
+  }
+  return key;
+}
+
 @Injectable()
 export class KubernetesService {
   constructor(private http: HttpClient, private snackBar: SnackBarService) {}
@@ -83,6 +97,28 @@ export class KubernetesService {
     );
   }
 
+  getCapacity(ns: string): Observable<Capacity> {
+    // Get the free resources of the cluster, i.e. GPUs
+    const url = environment.apiUrl + `/api/namespaces/${ns}/capacity`;
+
+    // The capacity is only a hint, so its errors are not shown to the user
+    return this.http.get<Resp>(url).pipe(
+      map(data => (data.success ? data.capacity : null)),
+      catchError(_ => of(null))
+    );
+  }
+
+  getUsage(ns: string): Observable<Usage> {
+    // Get the resource usage of the Notebooks in a namespace
+    const url = environment.apiUrl + `/api/namespaces/${ns}/notebooks/usage`;
+
+    // The usage is only a hint, so its errors are not shown to the user
+    return this.http.get<Resp>(url).pipe(
+      map(data => (data.success ? data.usage : null)),
+      catchError(_ => of(null))
+    );
+  }
+
   getVolumes(ns: string): Observable<Volume[]> {
     // Get existing PVCs in a namespace
     const url = environment.apiUrl + `/api/namespaces/${ns}/pvcs`;
@@ -130,7 +166,11 @@ export class KubernetesService {
       environment.apiUrl +
       `/api/namespaces/${rsrc.namespace}/${environment.resource}`;
 
-    return this.http.post<Resp>(url, rsrc).pipe(
+    // Retries of this request, i.e. by a proxy, get the response of the
+    // first one instead of creating the Notebook's volumes again
+    const headers = { "Idempotency-Key": idempotencyKey() };
+
+    return this.http.post<Resp>(url, rsrc, { headers }).pipe(
       tap(data => this.handleBackendError(data)),
       catchError(error => this.handleError(error)),
       map(_ => {
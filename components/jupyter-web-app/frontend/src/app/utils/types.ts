@@ -38,6 +38,35 @@ export interface GPU {
   vendors?: GPUVendor[];
 }
 
+// Free and total amount of a resource in the cluster's schedulable nodes
+export interface ResourceCapacity {
+  allocatable: number;
+  free: number;
+  maxFreePerNode: number;
+}
+
+export interface Capacity {
+  [resource: string]: ResourceCapacity;
+}
+
+// Suggested requests, from the usage of the Notebooks
+export interface Recommendation {
+  cpu: string;
+  memory: string;
+}
+
+export interface NotebookUsage {
+  cpu: number;
+  memory: number;
+  samples: number;
+  recommended?: Recommendation;
+}
+
+export interface Usage {
+  notebooks: { [name: string]: NotebookUsage };
+  recommended?: Recommendation;
+}
+
 // Backend response type
 export interface Resp {
   namespaces?: string[];
@@ -47,6 +76,8 @@ export interface Resp {
   pvcs?: Volume[];
   config?: any;
   poddefaults?: PodDefault[];
+  capacity?: Capacity;
+  usage?: Usage;
   success: boolean;
   log?: string;
 }
@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 import os
-from kubernetes import client, config
+import time
+from kubernetes import client, config, watch
+from kubernetes.client.rest import ApiException
 from kubernetes.config.config_exception import ConfigException
 from pathlib import Path
 
-from util import log, api_retry, long_poll, s3_copy
+from transfer import Manifest, Transfer, MIN_PART_SIZE
+from util import log, api_retry, long_poll, s3_retry
+from util import RETRY_MAX_ATTEMPTS, RETRY_BACKOFF_MS
 
 SIG_DIR = '.openmpi-controller'
 SIGCONT = f'{SIG_DIR}/SIGCONT'
@@ -12,6 +16,13 @@ SIGTERM = f'{SIG_DIR}/SIGTERM'
 PHASE_SUCCEEDED = 'Succeeded'
 PHASE_FAILED = 'Failed'
 NVIDIA_VERSION_PATH = '/proc/driver/nvidia/version'
+WATCH_TIMEOUT_SECS = 300
+# The manifest of the incremental uploads, kept in the uploaded directory so
+# that it outlives the pod if the directory does
+UPLOAD_MANIFEST = '.openmpi-controller-manifest.jsonl'
+# The manifest is never uploaded, even by the uploads that don't use it, since
+# it may be left in the directory by an earlier incremental upload
+UPLOAD_EXCLUDE = (UPLOAD_MANIFEST, UPLOAD_MANIFEST + '.tmp')
 
 
 class Controller:
@@ -24,7 +35,8 @@ class Controller:
 
   def __init__(self, namespace, master, num_gpus, timeout_secs,
                download_data_from, download_data_to, upload_data_from,
-               upload_data_to):
+               upload_data_to, s3_concurrency, s3_part_size_mb,
+               incremental_upload=False):
     self.namespace = namespace
     self.master = master
     self.num_gpus = num_gpus
@@ -33,6 +45,9 @@ class Controller:
     self.download_data_to = download_data_to
     self.upload_data_from = upload_data_from
     self.upload_data_to = upload_data_to
+    self.s3_concurrency = s3_concurrency
+    self.s3_part_size = s3_part_size_mb * 1024 * 1024
+    self.incremental_upload = incremental_upload
     self._validate_args()
     Path(SIG_DIR).mkdir()
 
@@ -70,13 +85,90 @@ class Controller:
       if not os.environ.get('AWS_SECRET_ACCESS_KEY'):
         raise ValueError('AWS_SECRET_ACCESS_KEY not set')
 
+      if self.s3_concurrency < 1:
+        raise ValueError('s3 concurrency must be at least 1')
+
+      if self.s3_part_size < MIN_PART_SIZE:
+        raise ValueError(f's3 part size must be at least {MIN_PART_SIZE} '
+                         'bytes')
+
   def _wait_nvidia_driver_present(self):
     log('waiting for nvidia driver to be installed')
     long_poll(self._poll_nvidia_driver_version, timeout_secs=self.timeout_secs)
 
   def _wait_master_terminated(self):
     log('waiting for master to terminate')
-    long_poll(self._poll_master_phase)
+    try:
+      self._watch_master_terminated()
+    except Exception as e:
+      log(f'watching {self.master} failed, polling instead: {e}')
+      long_poll(self._poll_master_phase)
+
+  def _watch_master_terminated(self):
+    """
+    Watches the master pod until it's terminated, so that its termination is
+    seen right away. Each watch resumes from the last resourceVersion seen. The
+    pod is only read again if that resourceVersion has expired or the watch
+    broke, i.e. its connection dropped.
+    """
+    failures = 0
+    phase, resource_version = self._query_master_phase_and_version()
+    while phase not in (PHASE_SUCCEEDED, PHASE_FAILED):
+      log(f'{self.master} is in "{phase}" phase')
+      try:
+        phase, resource_version = self._watch_master_phase(
+            phase, resource_version)
+        failures = 0
+        continue
+      except ApiException as e:
+        if e.status != 410:
+          raise
+        log(f'watch of {self.master} expired, reading it again')
+      except Exception as e:
+        failures += 1
+        if failures >= RETRY_MAX_ATTEMPTS:
+          raise
+        log(f'watch of {self.master} failed, reading it again: {e}')
+        time.sleep(RETRY_BACKOFF_MS / 1000)
+
+      phase, resource_version = self._query_master_phase_and_version()
+
+    log(f'{self.master} is in "{phase}" phase')
+    return phase
+
+  def _watch_master_phase(self, phase, resource_version):
+    """
+    Watches the master pod for up to WATCH_TIMEOUT_SECS, or until it's
+    terminated or deleted. Returns its last phase and resourceVersion.
+    """
+    w = watch.Watch()
+    stream = w.stream(
+        self.api.list_namespaced_pod,
+        self.namespace,
+        field_selector=f'metadata.name={self.master}',
+        resource_version=resource_version,
+        timeout_seconds=WATCH_TIMEOUT_SECS,
+        _request_timeout=WATCH_TIMEOUT_SECS + 30)
+    for event in stream:
+      if event['type'] == 'ERROR':
+        status = event['raw_object']
+        raise ApiException(
+            status=status.get('code'), reason=status.get('message'))
+
+      pod = event['object']
+      resource_version = pod.metadata.resource_version
+      phase = pod.status.phase
+      if event['type'] == 'DELETED':
+        # The pod will never terminate, so unless it succeeded it failed
+        log(f'{self.master} was deleted')
+        if phase != PHASE_SUCCEEDED:
+          phase = PHASE_FAILED
+
+      if phase in (PHASE_SUCCEEDED, PHASE_FAILED):
+        w.stop()
+        break
+
+    return phase, resource_version
 
   def _poll_nvidia_driver_version(self):
     # Driver installer is expected to be installed externally.
@@ -96,21 +188,46 @@ class Controller:
       return None
     return phase
 
-  @api_retry
   def _query_master_phase(self):
+    phase, _ = self._query_master_phase_and_version()
+    return phase
+
+  @api_retry
+  def _query_master_phase_and_version(self):
     pod = self.api.read_namespaced_pod(self.master, self.namespace)
-    return pod.status.phase
+    return pod.status.phase, pod.metadata.resource_version
 
   def _download_data(self):
     if self.download_data_from and self.download_data_to:
       Path(self.download_data_to).mkdir(exist_ok=True)
       log(f'downloading data from {self.download_data_from} to '
-          '{self.download_data_to}')
-      s3_copy(self.download_data_from, self.download_data_to)
+          f'{self.download_data_to}')
+      self._transfer().download(self.download_data_from,
+                                self.download_data_to)
 
   def _upload_data(self):
     if self.upload_data_from and self.upload_data_to:
       if Path(self.upload_data_from).exists():
         log(f'uploading data from {self.upload_data_from} to '
-            '{self.upload_data_to}')
-        s3_copy(self.upload_data_from, self.upload_data_to)
+            f'{self.upload_data_to}')
+        if self.incremental_upload:
+          self._upload_data_incrementally()
+        else:
+          self._transfer().upload(self.upload_data_from, self.upload_data_to,
+                                  exclude=UPLOAD_EXCLUDE)
+
+  @s3_retry
+  def _upload_data_incrementally(self):
+    """
+    Uploads the files that aren't at the destination yet, or changed. So a
+    retry, or the next attempt of the job, only uploads the files that the
+    previous ones didn't.
+    """
+    manifest = Manifest(Path(self.upload_data_from, UPLOAD_MANIFEST))
+    self._transfer().upload(
+        self.upload_data_from, self.upload_data_to, manifest=manifest,
+        exclude=UPLOAD_EXCLUDE)
+
+  def _transfer(self):
+    return Transfer(
+        concurrency=self.s3_concurrency, part_size=self.s3_part_size)
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+# Unit tests for the watch of the master pod and the uploads in controller.py.
+# The watch is stubbed with FakeWatch, which replays scripted events, and the
+# transfers with mocks. Run them from
+# controller/ with `python3 -m unittest transfer_test controller_test`, i.e.
+# `make test`.
+import tempfile
+import unittest
+from unittest import mock
+
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+
+import controller
+from controller import Controller, PHASE_FAILED, PHASE_SUCCEEDED
+from controller import UPLOAD_EXCLUDE
+from util import S3ClientError
+
+MASTER = 'job-master'
+
+
+def pod(phase, resource_version):
+  return client.V1Pod(
+      metadata=client.V1ObjectMeta(
+          name=MASTER, resource_version=str(resource_version)),
+      status=client.V1PodStatus(phase=phase))
+
+
+def event(type, phase, resource_version):
+  return {'type': type, 'object': pod(phase, resource_version)}
+
+
+def expired():
+  return {'type': 'ERROR', 'raw_object': {'code': 410, 'message': 'Gone'}}
+
+
+class FakeWatch:
+  """
+  Each stream() replays the next script: a list of events, or an exception to
+  raise. The keyword arguments of the streams are kept in 'calls'.
+  """
+  scripts = []
+  calls = []
+
+  def stream(self, fn, *args, **kwargs):
+    FakeWatch.calls.append(kwargs)
+    script = FakeWatch.scripts.pop(0)
+    if isinstance(script, Exception):
+      raise script
+    yield from script
+
+  def stop(self):
+    pass
+
+
+class FakeCoreV1Api:
+
+  def __init__(self, phases):
+    self.phases = list(phases)
+    self.reads = 0
+
+  def list_namespaced_pod(self, namespace, **kwargs):
+    raise NotImplementedError('only watched, through FakeWatch')
+
+  def read_namespaced_pod(self, name, namespace):
+    self.reads += 1
+    phase = self.phases.pop(0) if len(self.phases) > 1 else self.phases[0]
+    return pod(phase, 100 * self.reads)
+
+
+def new_controller(phases):
+  # Skips __init__, which creates the signal directory
+  c = Controller.__new__(Controller)
+  c.namespace = 'default'
+  c.master = MASTER
+  c.api = FakeCoreV1Api(phases)
+  return c
+
+
+class WatchMasterTest(unittest.TestCase):
+
+  def setUp(self):
+    FakeWatch.scripts = []
+    FakeWatch.calls = []
+    patches = [
+        mock.patch.object(controller.watch, 'Watch', FakeWatch),
+        mock.patch.object(controller.time, 'sleep', lambda secs: None),
+        mock.patch.object(controller, 'log', lambda msg: None),
+    ]
+    for p in patches:
+      p.start()
+      self.addCleanup(p.stop)
+
+  def test_already_terminated(self):
+    c = new_controller([PHASE_SUCCEEDED])
+    self.assertEqual(c._watch_master_terminated(), PHASE_SUCCEEDED)
+    self.assertEqual(FakeWatch.calls, [])
+
+  def test_watch_until_terminated(self):
+    c = new_controller(['Running'])
+    FakeWatch.scripts = [[
+        event('MODIFIED', 'Running', 101),
+        event('MODIFIED', PHASE_FAILED, 102),
+    ]]
+    self.assertEqual(c._watch_master_terminated(), PHASE_FAILED)
+    self.assertEqual(FakeWatch.calls[0]['resource_version'], '100')
+    self.assertEqual(c.api.reads, 1)
+
+  def test_watch_resumes_after_timeout(self):
+    c = new_controller(['Running'])
+    FakeWatch.scripts = [
+        [event('MODIFIED', 'Running', 101)],
+        [event('MODIFIED', PHASE_SUCCEEDED, 102)],
+    ]
+    self.assertEqual(c._watch_master_terminated(), PHASE_SUCCEEDED)
+    self.assertEqual([k['resource_version'] for k in FakeWatch.calls],
+                     ['100', '101'])
+    self.assertEqual(c.api.reads, 1)
+
+  def test_expired_watch_reads_the_pod_again(self):
+    c = new_controller(['Pending', 'Running'])
+    FakeWatch.scripts = [
+        [expired()],
+        [event('MODIFIED', PHASE_SUCCEEDED, 201)],
+    ]
+    self.assertEqual(c._watch_master_terminated(), PHASE_SUCCEEDED)
+    self.assertEqual([k['resource_version'] for k in FakeWatch.calls],
+                     ['100', '200'])
+
+  def test_expired_watch_by_exception(self):
+    c = new_controller(['Pending', 'Running'])
+    FakeWatch.scripts = [
+        ApiException(status=410),
+        [event('MODIFIED', PHASE_SUCCEEDED, 201)],
+    ]
+    self.assertEqual(c._watch_master_terminated(), PHASE_SUCCEEDED)
+    self.assertEqual(c.api.reads, 2)
+
+  def test_deleted_is_terminal(self):
+    c = new_controller(['Running'])
+    FakeWatch.scripts = [[event('DELETED', 'Running', 101)]]
+    with mock.patch.object(controller, 'long_poll') as poll:
+      c._wait_master_terminated()
+    poll.assert_not_called()
+    self.assertEqual(c.api.reads, 1)
+
+  def test_deleted_after_success(self):
+    c = new_controller(['Running'])
+    FakeWatch.scripts = [[event('DELETED', PHASE_SUCCEEDED, 101)]]
+    self.assertEqual(c._watch_master_terminated(), PHASE_SUCCEEDED)
+
+  def test_deleted_phase(self):
+    c = new_controller(['Running'])
+    FakeWatch.scripts = [[event('DELETED', 'Running', 101)]]
+    self.assertEqual(c._watch_master_terminated(), PHASE_FAILED)
+
+  def test_broken_watch_is_retried(self):
+    c = new_controller(['Running'])
+    FakeWatch.scripts = [
+        ConnectionError('reset'),
+        [event('MODIFIED', PHASE_SUCCEEDED, 201)],
+    ]
+    self.assertEqual(c._watch_master_terminated(), PHASE_SUCCEEDED)
+    self.assertEqual(c.api.reads, 2)
+
+  def test_falls_back_to_polling(self):
+    c = new_controller(['Running'])
+    FakeWatch.scripts = [
+        ConnectionError('reset') for _ in range(controller.RETRY_MAX_ATTEMPTS)
+    ]
+    with mock.patch.object(controller, 'long_poll') as poll:
+      c._wait_master_terminated()
+    poll.assert_called_once_with(c._poll_master_phase)
+
+  def test_other_api_errors_fall_back_to_polling(self):
+    c = new_controller(['Running'])
+    FakeWatch.scripts = [ApiException(status=403)]
+    with mock.patch.object(controller, 'long_poll') as poll:
+      c._wait_master_terminated()
+    poll.assert_called_once_with(c._poll_master_phase)
+    self.assertEqual(len(FakeWatch.calls), 1)
+
+
+class UploadDataTest(unittest.TestCase):
+
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.transfer = mock.Mock()
+    # Skips __init__, which creates the signal directory
+    self.c = Controller.__new__(Controller)
+    self.c.upload_data_from = tmp.name
+    self.c.upload_data_to = 's3://bucket/out'
+    self.c._transfer = lambda: self.transfer
+    p = mock.patch.object(controller, 'log', lambda msg: None)
+    p.start()
+    self.addCleanup(p.stop)
+
+  def test_upload_excludes_the_manifest(self):
+    self.c.incremental_upload = False
+    self.c._upload_data()
+    self.transfer.upload.assert_called_once_with(
+        self.c.upload_data_from, self.c.upload_data_to,
+        exclude=UPLOAD_EXCLUDE)
+
+  def test_incremental_upload_excludes_the_manifest(self):
+    self.c.incremental_upload = True
+    self.c._upload_data()
+    _, kwargs = self.transfer.upload.call_args
+    self.assertEqual(UPLOAD_EXCLUDE, kwargs['exclude'])
+    self.assertIsNotNone(kwargs['manifest'])
+
+  def test_client_errors_are_not_retried(self):
+    self.c.incremental_upload = True
+    self.transfer.upload.side_effect = S3ClientError('forbidden')
+    with self.assertRaises(S3ClientError):
+      self.c._upload_data()
+    self.assertEqual(1, self.transfer.upload.call_count)
+
+
+if __name__ == '__main__':
+  unittest.main()
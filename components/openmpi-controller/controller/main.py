@@ -14,6 +14,21 @@ def main():
   parser.add_argument('--download-data-to', type=str)
   parser.add_argument('--upload-data-from', type=str)
   parser.add_argument('--upload-data-to', type=str)
+  parser.add_argument(
+      '--s3-concurrency',
+      type=int,
+      default=10,
+      help='number of objects, or parts of objects, sent at once')
+  parser.add_argument(
+      '--s3-part-size-mb',
+      type=int,
+      default=8,
+      help='size of the parts of the objects uploaded and downloaded')
+  parser.add_argument(
+      '--incremental-upload',
+      action='store_true',
+      help='only upload the files that are new or changed since the last '
+      'upload to the same destination')
   args = parser.parse_args()
 
   with Controller(
@@ -24,7 +39,10 @@ def main():
       download_data_from=args.download_data_from,
       download_data_to=args.download_data_to,
       upload_data_from=args.upload_data_from,
-      upload_data_to=args.upload_data_to) as ctl:
+      upload_data_to=args.upload_data_to,
+      s3_concurrency=args.s3_concurrency,
+      s3_part_size_mb=args.s3_part_size_mb,
+      incremental_upload=args.incremental_upload) as ctl:
     ctl.wait_ready()
     ctl.wait_done()
 
@@ -0,0 +1,480 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from pathlib import Path
+from urllib.parse import urlparse
+
+import botocore.session
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from retrying import retry
+
+from util import (log, S3ClientError, S3Exception, RETRY_MAX_ATTEMPTS,
+                  RETRY_BACKOFF_MS)
+
+DEFAULT_CONCURRENCY = 10
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+# S3 rejects multipart uploads with smaller parts, but the last, or with more
+# parts
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Client errors that are worth retrying. Any other 4xx, i.e. a missing bucket
+# or denied access, fails the transfer right away
+RETRY_STATUSES = (408, 429)
+NO_RETRY_ERRORS = (FileNotFoundError, IsADirectoryError, NotADirectoryError,
+                   PermissionError)
+
+
+def parse_s3_url(url):
+  """
+  Splits s3://bucket/prefix into the bucket and the prefix. The prefix ends
+  with a / unless it's empty, so that s3://bucket/data doesn't match the keys
+  under s3://bucket/data-old/.
+  """
+  parsed = urlparse(url)
+  if parsed.scheme != 's3' or not parsed.netloc:
+    raise ValueError(f'{url} is not an s3://bucket/prefix URL')
+  prefix = parsed.path.lstrip('/')
+  if prefix and not prefix.endswith('/'):
+    prefix += '/'
+  return parsed.netloc, prefix
+
+
+def local_path(local_dir, name):
+  """
+  The path of an object under local_dir, by its key relative to the prefix.
+  Keys that would end up outside of local_dir, i.e. with '..' or an extra
+  leading /, are rejected.
+  """
+  root = Path(local_dir).resolve()
+  path = root.joinpath(name).resolve()
+  if root not in path.parents:
+    raise ValueError(f'{name} is outside of {local_dir}')
+  return path
+
+
+def is_retryable(e):
+  if isinstance(e, ClientError):
+    status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+    return status >= 500 or status in RETRY_STATUSES
+  return not isinstance(e, NO_RETRY_ERRORS)
+
+
+def part_ranges(size, part_size):
+  """
+  The (offset, length) of each part of an object of the given size. The
+  parts are made larger if there would be more than MAX_PARTS.
+  """
+  part_size = max(part_size, math.ceil(size / MAX_PARTS))
+  return [(offset, min(part_size, size - offset))
+          for offset in range(0, size, part_size)]
+
+
+def s3_etag(path, size, part_size):
+  """
+  The ETag S3 gives the file once uploaded by Transfer with this part_size:
+  the MD5 of its content, or, if it's uploaded in parts, the MD5 of the MD5s
+  of its parts followed by the number of parts. Objects encrypted with
+  SSE-KMS or SSE-C have other ETags, so they never match.
+  """
+  ranges = [(0, size)]
+  if size > part_size:
+    ranges = part_ranges(size, part_size)
+
+  digests = []
+  with path.open('rb') as f:
+    for _, length in ranges:
+      md5 = hashlib.md5()
+      for chunk in iter(lambda: f.read(min(READ_CHUNK_SIZE, length)), b''):
+        md5.update(chunk)
+        length -= len(chunk)
+      digests.append(md5.digest())
+
+  if len(digests) == 1:
+    return digests[0].hex()
+  return hashlib.md5(b''.join(digests)).hexdigest() + f'-{len(digests)}'
+
+
+class Transfer:
+  """
+  Transfer copies directory trees between the local disk and S3, like
+  `aws s3 cp --recursive`. The objects, or their parts for the ones larger
+  than part_size, are sent by a pool of concurrency threads. Uploads of large
+  files are multipart and downloads of large objects are ranged. Each request
+  is retried on its own, so a failure only sends again the part that failed.
+  The credentials are read from the environment, as for the aws cli.
+  """
+
+  def __init__(self, concurrency=DEFAULT_CONCURRENCY,
+               part_size=DEFAULT_PART_SIZE, endpoint_url=None,
+               max_attempts=RETRY_MAX_ATTEMPTS,
+               retry_backoff_ms=RETRY_BACKOFF_MS):
+    if concurrency < 1:
+      raise ValueError('concurrency must be at least 1')
+    if part_size < 1:
+      raise ValueError('part_size must be at least 1')
+
+    self.concurrency = concurrency
+    self.part_size = part_size
+    self._retry = retry(
+        stop_max_attempt_number=max_attempts,
+        wait_exponential_multiplier=retry_backoff_ms,
+        retry_on_exception=is_retryable)
+
+    # The requests are retried here, per part, rather than by botocore. The
+    # client is thread safe, and keeps a connection per thread of the pool.
+    s3_config = {'addressing_style': 'path'} if endpoint_url else None
+    self.client = botocore.session.get_session().create_client(
+        's3',
+        endpoint_url=endpoint_url,
+        config=Config(
+            max_pool_connections=concurrency,
+            retries={'max_attempts': 0},
+            s3=s3_config))
+
+  def download(self, url, local_dir):
+    """Downloads the objects under the s3 url to local_dir"""
+    bucket, prefix = parse_s3_url(url)
+    objects = [(obj['Key'], obj['Size'])
+               for obj in self._list_objects(bucket, prefix)
+               if not obj['Key'].endswith('/')]
+    log(f'downloading {len(objects)} objects from {url} to {local_dir}')
+
+    progress = Progress('downloaded', objects)
+    paths = {}
+    try:
+      with ThreadPoolExecutor(self.concurrency) as pool:
+        futures = []
+        for key, size in objects:
+          path = local_path(local_dir, key[len(prefix):])
+          path.parent.mkdir(parents=True, exist_ok=True)
+          # The parts are written in place, so the file is created full size
+          with path.open('wb') as f:
+            f.truncate(size)
+          paths[key] = path
+          if size == 0:
+            progress.add(key, 0)
+          for offset, length in part_ranges(size, self.part_size):
+            futures.append(
+                pool.submit(self._download_part, bucket, key, size, path,
+                            offset, length, progress))
+        self._wait(futures)
+    except BaseException:
+      # The files of the parts that weren't all written have holes, so they
+      # are removed rather than left looking complete
+      for key, path in paths.items():
+        if not progress.is_complete(key):
+          self._remove(path)
+      raise
+
+    progress.done()
+
+  def upload(self, local_dir, url, manifest=None, exclude=()):
+    """
+    Uploads the files under local_dir to the s3 url, except the ones named
+    in exclude, relative to local_dir. With a manifest, only the files that
+    aren't already at the url, with the same size and ETag, are uploaded,
+    and each is added to the manifest once uploaded.
+    """
+    bucket, prefix = parse_s3_url(url)
+    skip = {Path(local_dir, name).resolve() for name in exclude}
+    if manifest is not None:
+      skip.update((manifest.path.resolve(), manifest.tmp.resolve()))
+    files = [(path.relative_to(local_dir).as_posix(), path.stat().st_size)
+             for path in sorted(Path(local_dir).rglob('*'))
+             if path.is_file() and path.resolve() not in skip]
+
+    entries = {}
+
+    def uploaded(name):
+      if manifest is not None:
+        manifest.add(name, entries[name])
+
+    if manifest is not None:
+      total = len(files)
+      files, entries = self._changed_files(bucket, prefix, local_dir, files,
+                                           manifest)
+      log(f'{total - len(files)} of {total} files in {local_dir} are '
+          f'already at {url}')
+    log(f'uploading {len(files)} files from {local_dir} to {url}')
+
+    progress = Progress('uploaded', files)
+    uploads = []
+    try:
+      with ThreadPoolExecutor(self.concurrency) as pool:
+        futures = []
+        for name, size in files:
+          path = Path(local_dir, name)
+          if size <= self.part_size:
+            futures.append(
+                pool.submit(self._put_object, bucket, prefix + name, name,
+                            path, size, progress, uploaded))
+            continue
+
+          key = prefix + name
+          ranges = part_ranges(size, self.part_size)
+          upload = MultipartUpload(
+              self._create_multipart_upload(bucket, key), key, name, path,
+              len(ranges))
+          uploads.append(upload)
+          for number, (offset, length) in enumerate(ranges, 1):
+            futures.append(
+                pool.submit(self._upload_part, bucket, upload, number, offset,
+                            length, progress, uploaded))
+        self._wait(futures)
+    finally:
+      for upload in uploads:
+        if not upload.completed:
+          self._abort_multipart_upload(bucket, upload)
+
+    progress.done()
+
+  def _changed_files(self, bucket, prefix, local_dir, files, manifest):
+    """
+    The files that differ from the objects at the destination, and the
+    manifest entries of all the files. The files that are unchanged since
+    they were added to the manifest aren't read again.
+    """
+    objects = {
+        obj['Key'][len(prefix):]: (obj['Size'], obj['ETag'].strip('"'))
+        for obj in self._list_objects(bucket, prefix)
+    }
+    with ThreadPoolExecutor(self.concurrency) as pool:
+      entries = dict(
+          zip([name for name, _ in files],
+              pool.map(lambda f: self._manifest_entry(
+                  manifest, Path(local_dir, f[0]), f[0]), files)))
+
+    changed = []
+    for name, _ in files:
+      entry = entries[name]
+      if objects.get(name) != (entry['size'], entry['etag']):
+        changed.append((name, entry['size']))
+      elif manifest.get(name) != entry:
+        manifest.add(name, entry)
+    return changed, entries
+
+  def _manifest_entry(self, manifest, path, name):
+    stat = path.stat()
+    current = {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+        'part_size': self.part_size,
+    }
+    entry = manifest.get(name)
+    if entry is not None and all(entry.get(k) == v
+                                 for k, v in current.items()):
+      return entry
+
+    return dict(current, etag=s3_etag(path, stat.st_size, self.part_size))
+
+  def _remove(self, path):
+    try:
+      path.unlink()
+    except OSError as e:
+      log(f'removing the incomplete {path} failed: {e}')
+
+  def _wait(self, futures):
+    """Waits for the futures, and cancels the rest as soon as one fails"""
+    done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+    for future in not_done:
+      future.cancel()
+    for future in done:
+      future.result()
+
+  def _call(self, fn):
+    """
+    Calls fn, retrying it on the errors that are worth retrying. The error it
+    fails with is raised as an S3Exception, or as an S3ClientError if it isn't
+    worth retrying.
+    """
+    try:
+      return self._retry(fn)()
+    except S3Exception:
+      raise
+    except Exception as e:
+      if not is_retryable(e):
+        raise S3ClientError(f's3 transfer failed: {e}') from e
+      raise S3Exception(f's3 transfer failed: {e}') from e
+
+  def _list_objects(self, bucket, prefix):
+    paginator = self.client.get_paginator('list_objects_v2')
+    pages = self._call(lambda: list(
+        paginator.paginate(Bucket=bucket, Prefix=prefix)))
+    for page in pages:
+      yield from page.get('Contents', [])
+
+  def _download_part(self, bucket, key, size, path, offset, length, progress):
+
+    def get():
+      args = {}
+      if length < size:
+        args['Range'] = f'bytes={offset}-{offset + length - 1}'
+      body = self.client.get_object(Bucket=bucket, Key=key, **args)['Body']
+      with path.open('r+b') as f:
+        f.seek(offset)
+        written = 0
+        for chunk in iter(lambda: body.read(READ_CHUNK_SIZE), b''):
+          f.write(chunk)
+          written += len(chunk)
+      if written != length:
+        raise S3Exception(f'got {written} of {length} bytes of {key} at '
+                          f'{offset}')
+
+    self._call(get)
+    progress.add(key, length)
+
+  def _put_object(self, bucket, key, name, path, size, progress, uploaded):
+
+    def put():
+      with path.open('rb') as f:
+        self.client.put_object(Bucket=bucket, Key=key, Body=f)
+
+    self._call(put)
+    uploaded(name)
+    progress.add(name, size)
+
+  def _create_multipart_upload(self, bucket, key):
+    resp = self._call(lambda: self.client.create_multipart_upload(
+        Bucket=bucket, Key=key))
+    return resp['UploadId']
+
+  def _upload_part(self, bucket, upload, number, offset, length, progress,
+                   uploaded):
+    """Uploads a part, and completes the upload if it's the last one"""
+
+    def put():
+      with upload.path.open('rb') as f:
+        f.seek(offset)
+        data = f.read(length)
+      return self.client.upload_part(
+          Bucket=bucket,
+          Key=upload.key,
+          UploadId=upload.upload_id,
+          PartNumber=number,
+          Body=data)['ETag']
+
+    if upload.add_part(number, self._call(put)):
+      self._complete_multipart_upload(bucket, upload)
+      upload.completed = True
+      uploaded(upload.name)
+    progress.add(upload.name, length)
+
+  def _complete_multipart_upload(self, bucket, upload):
+    parts = [{'ETag': etag, 'PartNumber': number}
+             for number, etag in sorted(upload.etags.items())]
+    self._call(lambda: self.client.complete_multipart_upload(
+        Bucket=bucket,
+        Key=upload.key,
+        UploadId=upload.upload_id,
+        MultipartUpload={'Parts': parts}))
+
+  def _abort_multipart_upload(self, bucket, upload):
+    try:
+      self.client.abort_multipart_upload(
+          Bucket=bucket, Key=upload.key, UploadId=upload.upload_id)
+    except Exception as e:
+      log(f'aborting the upload of {upload.key} failed: {e}')
+
+
+class MultipartUpload:
+
+  def __init__(self, upload_id, key, name, path, parts):
+    self.upload_id = upload_id
+    self.key = key
+    self.name = name
+    self.path = path
+    self.parts = parts
+    self.etags = {}
+    self.completed = False
+    self.lock = threading.Lock()
+
+  def add_part(self, number, etag):
+    """Returns whether all the parts are uploaded"""
+    with self.lock:
+      self.etags[number] = etag
+      return len(self.etags) == self.parts
+
+
+class Manifest:
+  """
+  Manifest keeps the files of a directory that are at the upload's
+  destination, with their size, mtime and ETag, so that they aren't uploaded
+  or read again. It's a journal of JSON lines, and a line is appended as each
+  file is uploaded. So an upload that failed, or whose pod was restarted,
+  resumes after the last file it completed. The journal is compacted when
+  it's loaded.
+  """
+
+  def __init__(self, path):
+    self.path = Path(path)
+    self.tmp = self.path.with_name(self.path.name + '.tmp')
+    self.entries = {}
+    self.lock = threading.Lock()
+    self._load()
+
+  def get(self, name):
+    return self.entries.get(name)
+
+  def add(self, name, entry):
+    line = json.dumps(dict(entry, name=name), sort_keys=True)
+    with self.lock:
+      self.entries[name] = entry
+      with self.path.open('a') as f:
+        f.write(line + '\n')
+
+  def _load(self):
+    if self.path.exists():
+      for line in self.path.read_text().splitlines():
+        try:
+          entry = json.loads(line)
+          self.entries[entry.pop('name')] = entry
+        except (ValueError, KeyError):
+          # i.e. the last line, if the controller was killed writing it
+          log(f'ignoring invalid line of {self.path}: {line}')
+
+    self.path.parent.mkdir(parents=True, exist_ok=True)
+    self.tmp.write_text(''.join(
+        json.dumps(dict(entry, name=name), sort_keys=True) + '\n'
+        for name, entry in self.entries.items()))
+    os.replace(str(self.tmp), str(self.path))
+
+
+class Progress:
+  """Logs each object once all of its bytes are transferred"""
+
+  def __init__(self, verb, objects):
+    self.verb = verb
+    self.remaining = dict(objects)
+    self.sizes = dict(objects)
+    self.completed = 0
+    self.transferred = 0
+    self.start = time.time()
+    self.lock = threading.Lock()
+
+  def add(self, name, length):
+    with self.lock:
+      self.remaining[name] -= length
+      self.transferred += length
+      if self.remaining[name] > 0:
+        return
+      self.completed += 1
+      completed = self.completed
+    log(f'{self.verb} {name} ({self.sizes[name]} bytes, {completed}/'
+        f'{len(self.sizes)} files)')
+
+  def is_complete(self, name):
+    with self.lock:
+      return self.remaining[name] <= 0
+
+  def done(self):
+    secs = max(time.time() - self.start, 1e-3)
+    log(f'{self.verb} {len(self.sizes)} files, {self.transferred} bytes in '
+        f'{secs:.1f}s ({self.transferred / secs / 1024 / 1024:.1f} MiB/s)')
@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+# Unit tests for transfer.py. They run against FakeS3, a stand-in for the S3
+# API that keeps the objects in memory. The modules are imported as the
+# controller imports them, so the tests run from controller/ with
+# `python3 -m unittest transfer_test controller_test`, i.e. `make test`.
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import unittest
+import uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, unquote, urlparse
+from xml.etree import ElementTree
+
+import transfer
+from util import S3ClientError, S3Exception
+
+KiB = 1024
+PART_SIZE = 64 * KiB
+
+
+class FakeS3(ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+
+  def __init__(self):
+    super().__init__(('127.0.0.1', 0), FakeS3Handler)
+    self.objects = {}
+    self.etags = {}
+    self.uploads = {}
+    # The status to fail the next requests of a method with, i.e.
+    # faults['GET'] = [500, 500]
+    self.faults = {}
+    self.requests = []
+    self.lock = threading.Lock()
+
+  @property
+  def url(self):
+    return f'http://127.0.0.1:{self.server_address[1]}'
+
+  def fault(self, method):
+    with self.lock:
+      self.requests.append(method)
+      faults = self.faults.get(method)
+      return faults.pop(0) if faults else None
+
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def log_message(self, *args):
+    pass
+
+  def parse(self):
+    url = urlparse(self.path)
+    bucket, _, key = unquote(url.path).lstrip('/').partition('/')
+    query = {k: v[0] for k, v in parse_qs(url.query, True).items()}
+    length = int(self.headers.get('Content-Length', 0))
+    body = self.rfile.read(length) if length else b''
+    return bucket, key, query, body
+
+  def respond(self, status, body=b'', headers=None):
+    self.send_response(status)
+    for name, value in (headers or {}).items():
+      self.send_header(name, value)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def fail(self):
+    status = self.server.fault(self.command)
+    if status is None:
+      return False
+    self.respond(status, b'<Error><Code>Fault</Code></Error>')
+    return True
+
+  def do_GET(self):
+    bucket, key, query, _ = self.parse()
+    if self.fail():
+      return
+    if not key:
+      return self.list_objects(bucket, query)
+
+    data = self.server.objects.get((bucket, key))
+    if data is None:
+      return self.respond(404, b'<Error><Code>NoSuchKey</Code></Error>')
+
+    match = re.match(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+    if not match:
+      return self.respond(200, data)
+    start, end = int(match.group(1)), int(match.group(2))
+    self.respond(206, data[start:end + 1], {
+        'Content-Range': f'bytes {start}-{end}/{len(data)}'
+    })
+
+  def list_objects(self, bucket, query):
+    prefix = query.get('prefix', '')
+    # Small pages, so that the listings are paginated
+    max_keys = int(query.get('max-keys', 2))
+    start = query.get('continuation-token', '')
+    keys = sorted(k for b, k in self.server.objects
+                  if b == bucket and k.startswith(prefix) and k > start)
+    page = keys[:max_keys]
+    contents = ''.join(
+        f'<Contents><Key>{k}</Key>'
+        f'<Size>{len(self.server.objects[(bucket, k)])}</Size>'
+        f'<ETag>{self.server.etags.get((bucket, k), "")}</ETag>'
+        '<LastModified>2019-01-01T00:00:00.000Z</LastModified></Contents>'
+        for k in page)
+    truncated = len(keys) > max_keys
+    token = (f'<NextContinuationToken>{page[-1]}</NextContinuationToken>'
+             if truncated else '')
+    self.respond(200, (
+        '<ListBucketResult><Name>{}</Name><Prefix>{}</Prefix>'
+        '<KeyCount>{}</KeyCount><MaxKeys>{}</MaxKeys>'
+        '<IsTruncated>{}</IsTruncated>{}{}</ListBucketResult>').format(
+            bucket, prefix, len(page), max_keys,
+            str(truncated).lower(), token, contents).encode())
+
+  def do_PUT(self):
+    bucket, key, query, body = self.parse()
+    if self.fail():
+      return
+    etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+    if 'uploadId' in query:
+      upload = self.server.uploads.get(query['uploadId'])
+      if upload is None:
+        return self.respond(404, b'<Error><Code>NoSuchUpload</Code></Error>')
+      upload[int(query['partNumber'])] = (etag, body)
+    else:
+      self.server.objects[(bucket, key)] = body
+      self.server.etags[(bucket, key)] = etag
+    self.respond(200, headers={'ETag': etag})
+
+  def do_POST(self):
+    bucket, key, query, body = self.parse()
+    if self.fail():
+      return
+    if 'uploads' in query:
+      upload_id = uuid.uuid4().hex
+      self.server.uploads[upload_id] = {}
+      return self.respond(200, (
+          '<InitiateMultipartUploadResult><Bucket>{}</Bucket><Key>{}</Key>'
+          '<UploadId>{}</UploadId></InitiateMultipartUploadResult>').format(
+              bucket, key, upload_id).encode())
+
+    upload = self.server.uploads.pop(query['uploadId'])
+    data = b''
+    digests = b''
+    parts = ElementTree.fromstring(body)
+    for part in parts:
+      fields = {e.tag.split('}')[-1]: e.text for e in part}
+      etag, chunk = upload[int(fields['PartNumber'])]
+      assert etag == fields['ETag']
+      data += chunk
+      digests += hashlib.md5(chunk).digest()
+    etag = '"{}-{}"'.format(hashlib.md5(digests).hexdigest(), len(parts))
+    self.server.objects[(bucket, key)] = data
+    self.server.etags[(bucket, key)] = etag
+    self.respond(200, (
+        '<CompleteMultipartUploadResult><Bucket>{}</Bucket><Key>{}</Key>'
+        '<ETag>{}</ETag></CompleteMultipartUploadResult>').format(
+            bucket, key, etag).encode())
+
+  def do_DELETE(self):
+    _, _, query, _ = self.parse()
+    if self.fail():
+      return
+    self.server.uploads.pop(query.get('uploadId'), None)
+    self.respond(204)
+
+
+class TestTransfer(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    for name, value in (('AWS_ACCESS_KEY_ID', 'test'),
+                        ('AWS_SECRET_ACCESS_KEY', 'test'),
+                        ('AWS_DEFAULT_REGION', 'us-east-1'),
+                        ('AWS_REQUEST_CHECKSUM_CALCULATION', 'when_required')):
+      os.environ.setdefault(name, value)
+
+  def setUp(self):
+    self.s3 = FakeS3()
+    threading.Thread(target=self.s3.serve_forever, daemon=True).start()
+    self.transfer = transfer.Transfer(
+        concurrency=4,
+        part_size=PART_SIZE,
+        endpoint_url=self.s3.url,
+        retry_backoff_ms=1)
+    self.tmp = tempfile.TemporaryDirectory()
+    self.dir = Path(self.tmp.name)
+
+  def tearDown(self):
+    self.s3.shutdown()
+    self.s3.server_close()
+    self.tmp.cleanup()
+
+  def put(self, key, size):
+    data = os.urandom(size)
+    self.s3.objects[('bucket', key)] = data
+    return data
+
+  def write(self, name, size):
+    path = self.dir / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = os.urandom(size)
+    path.write_bytes(data)
+    return data
+
+  def test_parse_s3_url(self):
+    self.assertEqual(('bucket', ''), transfer.parse_s3_url('s3://bucket'))
+    self.assertEqual(('bucket', 'a/b/'),
+                     transfer.parse_s3_url('s3://bucket/a/b'))
+    self.assertEqual(('bucket', 'a/b/'),
+                     transfer.parse_s3_url('s3://bucket/a/b/'))
+    with self.assertRaises(ValueError):
+      transfer.parse_s3_url('/a/b')
+
+  def test_part_ranges(self):
+    self.assertEqual([], transfer.part_ranges(0, 10))
+    self.assertEqual([(0, 10), (10, 10), (20, 5)],
+                     transfer.part_ranges(25, 10))
+    size = transfer.MAX_PARTS * 10 + 1
+    parts = transfer.part_ranges(size, 10)
+    self.assertLessEqual(len(parts), transfer.MAX_PARTS)
+    self.assertEqual(size, sum(length for _, length in parts))
+
+  def test_download(self):
+    objects = {
+        'data/small': self.put('data/small', 10 * KiB),
+        'data/empty': self.put('data/empty', 0),
+        'data/sub/large': self.put('data/sub/large', 5 * PART_SIZE + 7),
+    }
+    self.put('data-old/other', 10)
+    self.put('data/dir/', 0)
+
+    self.transfer.download('s3://bucket/data', self.dir)
+
+    files = sorted(p.relative_to(self.dir).as_posix()
+                   for p in self.dir.rglob('*') if p.is_file())
+    self.assertEqual(['empty', 'small', 'sub/large'], files)
+    for key, data in objects.items():
+      self.assertEqual(data, (self.dir / key[len('data/'):]).read_bytes())
+    # Two pages of listing, and the large object is read by parts
+    self.assertEqual(2 + 1 + 6, self.s3.requests.count('GET'))
+
+  def test_local_path(self):
+    self.assertEqual(self.dir.resolve() / 'a/b',
+                     transfer.local_path(self.dir, 'a/b'))
+    for name in ('../escape', 'a/../../escape', '/etc/passwd', ''):
+      with self.assertRaises(ValueError):
+        transfer.local_path(self.dir, name)
+
+  def test_download_rejects_keys_outside_of_the_directory(self):
+    self.put('data/../../escape', 10)
+
+    with self.assertRaises(ValueError):
+      self.transfer.download('s3://bucket/data', self.dir / 'out')
+    self.assertFalse((self.dir / 'escape').exists())
+
+  def test_download_retries_failed_parts(self):
+    data = self.put('data/large', 3 * PART_SIZE)
+    self.s3.faults['GET'] = [None, 503, 500]
+
+    self.transfer.download('s3://bucket/data', self.dir)
+
+    self.assertEqual(data, (self.dir / 'large').read_bytes())
+    self.assertEqual(1 + 3 + 2, self.s3.requests.count('GET'))
+
+  def test_download_fails_without_retrying_client_errors(self):
+    self.put('data/small', 10)
+    self.s3.faults['GET'] = [None, 403]
+
+    with self.assertRaises(S3ClientError):
+      self.transfer.download('s3://bucket/data', self.dir)
+    self.assertEqual(2, self.s3.requests.count('GET'))
+
+  def test_download_gives_up(self):
+    self.put('data/small', 10)
+    self.s3.faults['GET'] = [None] + [500] * transfer.RETRY_MAX_ATTEMPTS
+
+    with self.assertRaises(S3Exception) as e:
+      self.transfer.download('s3://bucket/data', self.dir)
+    # So that the controller retries the whole transfer
+    self.assertNotIsInstance(e.exception, S3ClientError)
+
+  def test_failed_download_removes_incomplete_files(self):
+    data = self.put('data/a', 10)
+    self.put('data/b', 3 * PART_SIZE)
+    self.put('data/c', 10)
+    # Sequential, so that the second part of b is the one that fails
+    sequential = transfer.Transfer(
+        concurrency=1, part_size=PART_SIZE, endpoint_url=self.s3.url)
+    self.s3.faults['GET'] = [None, None, None, None, 403]
+
+    with self.assertRaises(S3ClientError):
+      sequential.download('s3://bucket/data', self.dir)
+
+    files = [p.name for p in self.dir.rglob('*') if p.is_file()]
+    self.assertEqual(['a'], files)
+    self.assertEqual(data, (self.dir / 'a').read_bytes())
+
+  def test_upload(self):
+    files = {
+        'small': self.write('small', 10 * KiB),
+        'empty': self.write('empty', 0),
+        'sub/large': self.write('sub/large', 3 * PART_SIZE + 1),
+    }
+
+    self.transfer.upload(self.dir, 's3://bucket/out/')
+
+    self.assertEqual({('bucket', 'out/' + k): v
+                      for k, v in files.items()}, self.s3.objects)
+    self.assertEqual({}, self.s3.uploads)
+    # Two puts and four parts
+    self.assertEqual(6, self.s3.requests.count('PUT'))
+
+  def test_upload_retries_failed_parts(self):
+    data = self.write('large', 2 * PART_SIZE)
+    self.s3.faults['PUT'] = [500, 500]
+    self.s3.faults['POST'] = [503]
+
+    self.transfer.upload(self.dir, 's3://bucket/out')
+
+    self.assertEqual(data, self.s3.objects[('bucket', 'out/large')])
+    self.assertEqual(2 + 2, self.s3.requests.count('PUT'))
+
+  def test_upload_aborts_failed_multipart_uploads(self):
+    self.write('large', 2 * PART_SIZE)
+    self.s3.faults['PUT'] = [403]
+
+    with self.assertRaises(S3Exception):
+      self.transfer.upload(self.dir, 's3://bucket/out')
+    self.assertEqual({}, self.s3.objects)
+    self.assertEqual({}, self.s3.uploads)
+    self.assertIn('DELETE', self.s3.requests)
+
+  def test_upload_excludes_files(self):
+    data = self.write('a', 10)
+    self.write('.manifest', 10)
+    self.write('.manifest.tmp', 10)
+
+    self.transfer.upload(self.dir, 's3://bucket/out',
+                         exclude=('.manifest', '.manifest.tmp'))
+
+    self.assertEqual({('bucket', 'out/a'): data}, self.s3.objects)
+
+  def test_s3_etag(self):
+    self.write('small', PART_SIZE)
+    self.write('large', 2 * PART_SIZE + 1)
+    self.transfer.upload(self.dir, 's3://bucket/out')
+
+    for name in ('small', 'large'):
+      path = self.dir / name
+      etag = transfer.s3_etag(path, path.stat().st_size, PART_SIZE)
+      self.assertEqual(f'"{etag}"', self.s3.etags[('bucket', 'out/' + name)])
+
+  def test_incremental_upload(self):
+    self.write('a', 10)
+    self.write('sub/b', 2 * PART_SIZE)
+    self.write('c', 10)
+    manifest_path = self.dir / '.manifest'
+
+    self.transfer.upload(self.dir, 's3://bucket/out',
+                         transfer.Manifest(manifest_path))
+    self.assertEqual({'out/a', 'out/sub/b', 'out/c'},
+                     {key for _, key in self.s3.objects})
+    manifest = transfer.Manifest(manifest_path)
+    self.assertEqual({'a', 'sub/b', 'c'}, set(manifest.entries))
+    # Nor is the compacted manifest left by a controller killed writing it
+    manifest.tmp.write_text('')
+
+    # Only the new and changed files are uploaded
+    self.write('c', 20)
+    d = self.write('d', 10)
+    del self.s3.requests[:]
+    self.transfer.upload(self.dir, 's3://bucket/out', manifest)
+    self.assertEqual(['PUT', 'PUT'],
+                     [r for r in self.s3.requests if r != 'GET'])
+    self.assertEqual(d, self.s3.objects[('bucket', 'out/d')])
+    self.assertEqual(20, len(self.s3.objects[('bucket', 'out/c')]))
+
+    # Objects missing at the destination are uploaded again
+    del self.s3.objects[('bucket', 'out/a')]
+    del self.s3.requests[:]
+    self.transfer.upload(self.dir, 's3://bucket/out', manifest)
+    self.assertEqual(['PUT'], [r for r in self.s3.requests if r != 'GET'])
+
+  def test_incremental_upload_resumes(self):
+    self.write('a', 10)
+    self.write('b', 10)
+    self.write('c', 10)
+    manifest_path = self.dir / '.manifest'
+    self.s3.faults['PUT'] = [None, 403]
+
+    transfer_ = transfer.Transfer(
+        concurrency=1,
+        part_size=PART_SIZE,
+        endpoint_url=self.s3.url,
+        retry_backoff_ms=1)
+    with self.assertRaises(S3Exception):
+      transfer_.upload(self.dir, 's3://bucket/out',
+                       transfer.Manifest(manifest_path))
+
+    # The manifest has the files uploaded before the failure, and a partial
+    # line left by a controller killed while writing
+    with manifest_path.open('a') as f:
+      f.write('{"name": "b", "si')
+    manifest = transfer.Manifest(manifest_path)
+    self.assertIn('a', manifest.entries)
+    self.assertNotIn('b', manifest.entries)
+
+    uploaded = len(manifest.entries)
+    del self.s3.requests[:]
+    self.transfer.upload(self.dir, 's3://bucket/out', manifest)
+    self.assertEqual(['PUT'] * (3 - uploaded),
+                     [r for r in self.s3.requests if r != 'GET'])
+    self.assertEqual({'out/a', 'out/b', 'out/c'},
+                     {key for _, key in self.s3.objects})
+
+
+if __name__ == '__main__':
+  unittest.main()
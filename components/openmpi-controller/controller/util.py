@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 from kubernetes.client.rest import ApiException
 from retrying import retry
-from subprocess import Popen, PIPE
 
 RETRY_MAX_ATTEMPTS = 5
 RETRY_BACKOFF_MS = 1000
@@ -17,6 +16,18 @@ class S3Exception(Exception):
   pass
 
 
+# i.e. a 403 or a 404, which would fail the same way if retried
+class S3ClientError(S3Exception):
+  pass
+
+
+s3_retry = retry(
+    stop_max_attempt_number=RETRY_MAX_ATTEMPTS,
+    wait_exponential_multiplier=RETRY_BACKOFF_MS,
+    retry_on_exception=lambda e: (isinstance(e, S3Exception) and
+                                  not isinstance(e, S3ClientError)))
+
+
 def log(msg):
   print(msg, flush=True)
 
@@ -32,22 +43,3 @@ def long_poll(poll_fn, timeout_secs=None):
     return poll_fn()
 
   return poll_wrapper()
-
-
-def exec_command(command):
-  process = Popen(
-      command, stdin=None, stdout=PIPE, stderr=PIPE, shell=True, close_fds=True)
-  stdout, stderr = process.communicate()
-  return process.returncode, stdout, stderr
-
-
-@retry(
-    stop_max_attempt_number=RETRY_MAX_ATTEMPTS,
-    wait_exponential_multiplier=RETRY_BACKOFF_MS,
-    retry_on_exception=lambda e: isinstance(e, S3Exception))
-def s3_copy(copy_from, copy_to):
-  exit_code, stdout, stderr = exec_command(
-      f'aws s3 cp --recursive "{copy_from}" "{copy_to}"')
-  if exit_code != 0:
-    raise S3Exception(f's3 copy failed with exit code '
-                      '{exit_code}:\nstdout:{stdout}\nstderr:{stderr}')